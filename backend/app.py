@@ -1,4 +1,6 @@
 import os
+import time
+_import_start = time.perf_counter()
 from flask import Flask, send_from_directory, request, jsonify
 from flask_cors import CORS
 from pathlib import Path
@@ -6,15 +8,22 @@ from models import db
 from blueprints.customers import customers_bp
 from blueprints.products import products_bp
 from blueprints.orders import orders_bp
-from product_search import VectorProductIndex
+from blueprints.health import health_bp
+from blueprints.admin import admin_bp
+from product_search.db import ENGINE_OPTIONS
+from product_search import tracing, profiling, sql_monitor
+_import_seconds = time.perf_counter() - _import_start
 
 def create_app(config_name='development'):
+    start = time.perf_counter()
+    timings = [('导入模块', _import_seconds)]
     app = Flask(__name__)
     
     # 根据配置类型设置配置
     if config_name == 'testing':
         app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        # 默认使用内存 SQLite；基准测试等场景可通过 TEST_DATABASE_URL 指向文件数据库或本地 MySQL
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('TEST_DATABASE_URL', 'sqlite:///:memory:')
     else:
         # 从环境变量获取数据库配置
         db_host = os.getenv('DB_HOST', 'localhost')
@@ -24,6 +33,8 @@ def create_app(config_name='development'):
         db_password = os.getenv('DB_PASSWORD', '')
         
         app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+        # 连接池：借出前检查连接存活，并在 MySQL wait_timeout 之前回收；向量索引与 ORM 共用该连接池
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = ENGINE_OPTIONS
     
     # 配置CORS
     CORS(app, resources={
@@ -54,34 +65,55 @@ def create_app(config_name='development'):
     app.config['INDEX_PATH'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
                                           'data', 'product_search', 'product_index.bin')
     
+    timings.append(('应用配置', time.perf_counter() - start))
+    
     # 初始化扩展
+    phase_start = time.perf_counter()
     db.init_app(app)
+    timings.append(('初始化数据库', time.perf_counter() - phase_start))
 
-    # 初始化向量索引
+    # 向量索引在第一次使用时才初始化（product_search.get_product_index，进程内单例），
+    # 只处理 CRUD 请求的 worker 不加载 faiss 和向量数据。
+    # 索引从 product_images 加载，之后通过 index_changes 变更日志与其他进程保持同步；
+    # 配置了 INDEX_SERVER_ADDRESS 时由独立的索引服务进程持有索引（python -m product_search.server）
+    app.config['PRODUCT_INDEX_ENABLED'] = not app.config['TESTING']
+    # 启用预热时在后台线程中加载并预热索引，/readyz 在预热完成前返回 503；
+    # INDEX_WARMUP=0 时索引保持按需加载，/readyz 不等待索引
+    app.config['INDEX_WARMUP'] = app.config['PRODUCT_INDEX_ENABLED'] and os.getenv('INDEX_WARMUP', '1') == '1'
     if not app.config['TESTING']:
-        product_index = VectorProductIndex()
-        # 如果索引文件存在，加载它
-        if os.path.exists(app.config['INDEX_PATH']):
-            try:
-                product_index.load_index(app.config['INDEX_PATH'])
-                app.logger.info(f"已加载向量索引: {app.config['INDEX_PATH']}")
-            except Exception as e:
-                app.logger.error(f"加载向量索引时出错: {e}")
-        app.config['PRODUCT_INDEX'] = product_index
-        
         # 确保向量索引目录存在
         Path(os.path.dirname(app.config['INDEX_PATH'])).mkdir(parents=True, exist_ok=True)
+    if app.config['INDEX_WARMUP']:
+        from product_search import start_background_warmup
+        with app.app_context():
+            start_background_warmup(db.engine)
+    
+    # 请求追踪：响应带 Server-Timing 头，抽样或慢请求导出到 TRACE_EXPORTER（测试环境不启用）
+    if not app.config['TESTING']:
+        tracing.init_app(app)
+    # 按需剖析：配置了 ADMIN_TOKEN 或 PROFILE_SAMPLE_RATE 时才注册钩子
+    profiling.init_app(app)
+    # SQL 统计：按请求统计语句数、检测 N+1、记录慢查询及其 EXPLAIN（/api/admin/sql）
+    sql_monitor.init_app(app)
     
     # 注册蓝图
+    phase_start = time.perf_counter()
     app.register_blueprint(customers_bp)
     app.register_blueprint(products_bp)
     app.register_blueprint(orders_bp)
+    app.register_blueprint(health_bp)
+    app.register_blueprint(admin_bp)
+    timings.append(('注册蓝图', time.perf_counter() - phase_start))
     
     # 添加静态文件路由
     @app.route('/uploads/<path:filename>')
     def serve_upload(filename):
         return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
     
+    # 启动耗时报告
+    app.config['STARTUP_TIMINGS'] = {name: round(seconds, 4) for name, seconds in timings}
+    total = _import_seconds + time.perf_counter() - start
+    print(f"应用启动完成，耗时 {total:.3f} 秒（" + '，'.join(f"{name} {seconds:.3f}s" for name, seconds in timings) + "）")
     return app
 
 app = create_app()
@@ -0,0 +1,49 @@
+import os
+from functools import wraps
+from flask import Blueprint, jsonify, request, send_from_directory, abort
+from product_search import profiling, sql_monitor, peek_product_index
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+def require_admin_token(view):
+    """管理接口需要请求头 X-Admin-Token 等于 ADMIN_TOKEN；未配置 ADMIN_TOKEN 时管理接口不可用"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profiling.ADMIN_TOKEN or request.headers.get('X-Admin-Token') != profiling.ADMIN_TOKEN:
+            return jsonify({'error': '无权访问'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@admin_bp.route('/profiles', methods=['GET'])
+@require_admin_token
+def list_profiles():
+    """列出已保存的请求剖析结果（最新的在前）"""
+    return jsonify({'profiles': profiling.list_profiles(), 'mode': profiling.PROFILE_MODE,
+                    'sample_rate': profiling.PROFILE_SAMPLE_RATE, 'endpoints': profiling.PROFILE_ENDPOINTS})
+
+@admin_bp.route('/profiles/<path:filename>', methods=['GET'])
+@require_admin_token
+def download_profile(filename):
+    """下载剖析结果：.folded 为折叠栈（火焰图），.prof 为 pstats，.json 为元数据"""
+    if not filename.endswith(('.folded', '.prof', '.json')) or os.path.basename(filename) != filename:
+        abort(404)
+    return send_from_directory(profiling.PROFILE_DIR, filename, as_attachment=True)
+
+@admin_bp.route('/sql', methods=['GET'])
+@require_admin_token
+def sql_summary():
+    """各接口的语句数与耗时、疑似 N+1 的语句、最近的慢查询及其 EXPLAIN"""
+    return jsonify(sql_monitor.MONITOR.summary())
+
+@admin_bp.route('/sql/reset', methods=['POST'])
+@require_admin_token
+def reset_sql_summary():
+    sql_monitor.MONITOR.reset()
+    return jsonify({'message': '已清空 SQL 统计'})
+
+@admin_bp.route('/index/partitions', methods=['GET'])
+@require_admin_token
+def index_partitions():
+    """本进程向量索引各分区的向量数；索引尚未加载或未启用分区时 partitions 为 null"""
+    index = peek_product_index()
+    return jsonify({'partitions': index.partition_stats() if index is not None else None})
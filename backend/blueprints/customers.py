@@ -1,13 +1,11 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin
 from models import db, Customer, BalanceTransaction
-from pypinyin import lazy_pinyin
+from product_search.tracing import span
 import re
 import os
 import json
-# Please install OpenAI SDK first: `pip3 install openai`
 from dotenv import load_dotenv
-from openai import OpenAI
 
 load_dotenv()
 # 移除直接执行的 API 调用代码
@@ -28,6 +26,9 @@ customers_bp = Blueprint('customers', __name__, url_prefix='/api/customers')
 def parse_address(text):
     """使用 DeepSeek API 解析地址文本，提取姓名、电话和地址信息"""
     try:
+        # Please install OpenAI SDK first: `pip3 install openai`
+        # 延迟导入，避免每个 worker 启动时加载 openai
+        from openai import OpenAI
         client = OpenAI(
             api_key=os.getenv('DEEPSEEK_API_KEY'),
             base_url="https://api.deepseek.com"
@@ -43,14 +44,15 @@ def parse_address(text):
 
         user_prompt = f"请解析以下文本：\n{text}"
 
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            stream=False
-        )
+        with span('deepseek.chat', model='deepseek-chat'):
+            response = client.chat.completions.create(
+                model="deepseek-chat",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                stream=False
+            )
 
         # 获取响应内容
         content = response.choices[0].message.content
@@ -78,6 +80,7 @@ def parse_address(text):
 
 def get_pinyin(text):
     """获取文本的拼音"""
+    from pypinyin import lazy_pinyin  # 延迟导入，拼音词典加载较慢
     return ''.join(lazy_pinyin(text)).lower()
 
 @customers_bp.route('', methods=['POST', 'OPTIONS'])
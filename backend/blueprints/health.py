@@ -0,0 +1,45 @@
+import os
+from flask import Blueprint, Response, jsonify, current_app
+from sqlalchemy import text
+from models import db
+from product_search import metrics
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('/healthz', methods=['GET'])
+def healthz():
+    """存活检查：进程能处理请求即返回 200，不访问数据库和向量索引"""
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@health_bp.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    就绪检查：数据库可用，且（启用预热时）向量索引已加载并预热完成才返回 200，否则返回 503，
+    k8s 只把流量路由到就绪的 Pod
+    """
+    ready = True
+    checks = {}
+    try:
+        db.session.execute(text('SELECT 1'))
+        checks['database'] = 'ok'
+    except Exception as e:
+        current_app.logger.error(f"就绪检查数据库失败: {e}")
+        checks['database'] = str(e)
+        ready = False
+
+    if current_app.config.get('PRODUCT_INDEX_ENABLED'):
+        import product_search
+        if current_app.config.get('INDEX_WARMUP'):
+            # 预热线程未运行时（如 fork 后的 worker、上次失败）重新启动
+            product_search.start_background_warmup(db.engine)
+        index_status = product_search.get_index_status()
+        checks['index'] = index_status
+        if current_app.config.get('INDEX_WARMUP') and index_status['state'] != 'ready':
+            ready = False
+
+    return jsonify({'status': 'ready' if ready else 'not_ready', 'checks': checks}), 200 if ready else 503
+
+@health_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """本 worker 进程的指标（Prometheus 文本格式），不会触发向量索引加载"""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
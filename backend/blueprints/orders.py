@@ -5,7 +5,6 @@ from datetime import datetime
 import json
 from flask_cors import cross_origin
 from werkzeug.utils import secure_filename
-import pandas as pd
 import os
 
 orders_bp = Blueprint('orders', __name__, url_prefix='/api/orders')
@@ -253,6 +252,7 @@ def import_orders():
         return jsonify({'error': '文件格式错误', 'detail': '请上传.xlsx格式的Excel文件'}), 400
 
     try:
+        import pandas as pd  # 延迟导入，只有导入Excel时才需要
         df = pd.read_excel(file)
         required_columns = ['订单编号', '快递公司', '运单号', '我打备注']
         missing_columns = [col for col in required_columns if col not in df.columns]
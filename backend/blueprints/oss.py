@@ -1,9 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
 import os
-import oss2
 import uuid
 from datetime import datetime
 from werkzeug.utils import secure_filename
+from product_search.tracing import span
 
 oss_bp = Blueprint('oss', __name__, url_prefix='/api/oss')
 
@@ -24,6 +24,8 @@ def get_oss_client():
     if not all([access_key_id, access_key_secret, endpoint, bucket_name]):
         raise ValueError("OSS配置不完整，请检查环境变量")
     
+    import oss2  # 延迟导入，只有上传文件时才需要
+
     # 创建Auth对象
     auth = oss2.Auth(access_key_id, access_key_secret)
     
@@ -65,7 +67,8 @@ def upload_file():
         bucket, bucket_name = get_oss_client()
         
         # 上传文件
-        result = bucket.put_object(oss_path, file)
+        with span('oss.put_object', path=oss_path):
+            result = bucket.put_object(oss_path, file)
         
         # 生成访问URL
         endpoint = os.getenv('OSS_ENDPOINT')
@@ -103,7 +106,8 @@ def delete_file():
         bucket, _ = get_oss_client()
         
         # 删除文件
-        bucket.delete_object(oss_path)
+        with span('oss.delete_object', path=oss_path):
+            bucket.delete_object(oss_path)
         
         return jsonify({'message': '文件删除成功'})
         
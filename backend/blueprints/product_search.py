@@ -4,12 +4,15 @@ import os
 from pathlib import Path
 import csv
 import io
-from product_search import VectorProductIndex, ProductInfo
+from models import db
+from product_search import ProductInfo
 
 product_search_bp = Blueprint('product_search', __name__)
 
-# 初始化产品搜索索引
-product_index = VectorProductIndex()
+def get_product_index():
+    """使用进程内单例的向量索引（本地索引或索引服务客户端），首次使用时才初始化"""
+    from product_search import get_product_index as get_index
+    return get_index(db.engine)
 
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
@@ -56,7 +59,7 @@ def add_product():
             description=description
         )
         
-        product_id = product_index.add_product(
+        product_id = get_product_index().add_product(
             name=name,
             attributes=json.loads(attributes),
             price=price,
@@ -96,7 +99,7 @@ def search_products():
         
         # 搜索相似商品
         top_k = int(request.form.get('top_k', 5))
-        results = product_index.search(query_image_path, top_k)
+        results = get_product_index().search(query_image_path, top_k)
         
         return jsonify({
             'message': '搜索成功',
@@ -164,7 +167,7 @@ def add_products_from_csv():
                 )
                 
                 # 添加商品到索引
-                product_id = product_index.add_product(
+                product_id = get_product_index().add_product(
                     name=product.name,
                     attributes=product.attributes,
                     price=product.price,
@@ -7,9 +7,14 @@ import json
 import csv
 import io
 import time
-from product_search import VectorProductIndex# 导入向量搜索和产品信息
-from models import db, Product,ProductImage,Order# 导入Product模型
+from models import db, Product,ProductImage,Order,DuplicateCluster,ProductSimilarity# 导入Product模型
+from models.index_change import IndexChange, record_index_changes
 from .oss import get_oss_client  # 导入OSS客户端
+from product_search import ProductInfo
+from product_search.metrics import (SEARCH_STAGE_SECONDS, SEARCH_SECONDS, SEARCH_REQUESTS,
+                                    INGEST_PRODUCTS, INGEST_IMAGES, INGEST_STAGE_SECONDS)
+from product_search.tracing import span
+from product_search.phash import image_hash
 import hashlib
 import uuid
 import ast
@@ -21,6 +26,16 @@ from sqlalchemy import and_ # <--- 添加这一行
 
 products_bp = Blueprint('products', __name__, url_prefix='/api/products')
 
+def get_product_index():
+    """
+    获取向量索引。索引在第一次使用时才初始化（进程内单例），只处理 CRUD 的 worker 不会加载；
+    未启用向量搜索（如测试环境）时返回 None
+    """
+    if not current_app.config.get('PRODUCT_INDEX_ENABLED'):
+        return None
+    from product_search import get_product_index as get_index
+    return get_index(db.engine)
+
 # Helper function (consider moving to a utils file)
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
@@ -122,10 +137,10 @@ def add_product():
         # 更新产品信息
         db.session.commit()
         # 如果配置了向量搜索
-        if current_app.config.get('PRODUCT_INDEX'):
+        if current_app.config.get('PRODUCT_INDEX_ENABLED'):
             try:
                 # 添加到向量索引
-                product_index = current_app.config['PRODUCT_INDEX']
+                product_index = get_product_index()
                 if existing_img_objs or uploaded_img_objs:  # 使用第一张商品图片作为索引
                     for good_img_url in existing_img_objs + uploaded_img_objs:
                         image_path = os.path.join(
@@ -139,7 +154,8 @@ def add_product():
                         product_image = ProductImage(
                             product_id=product_id,
                             image_path=good_img_url['url'],
-                            vector=feature
+                            vector=feature,
+                            image_hash=image_hash(image_path)
                         )
                         db.session.add(product_image)
                     db.session.commit()
@@ -223,7 +239,7 @@ def update_product(product_id):
         db.session.commit()
 
         # 如果配置了向量搜索且有新的商品图片
-        if current_app.config.get('PRODUCT_INDEX') and good_images:
+        if current_app.config.get('PRODUCT_INDEX_ENABLED') and good_images:
             try:
                 # 创建产品信息对象
                 product_info = ProductInfo(
@@ -235,7 +251,7 @@ def update_product(product_id):
                 )
                 
                 # 更新向量索引
-                product_index = current_app.config['PRODUCT_INDEX']
+                product_index = get_product_index()
                 image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'good_images', os.path.basename(uploaded_img_objs[0]['url'].split('/')[-1]))
                 product_index.add_product(product_info, image_path)
                 
@@ -304,6 +320,9 @@ def batch_delete_products():
         # 数据库会自动删除关联的 product_images 记录。
         # 如果图片文件也存储在本地且需要清理，需要额外逻辑，但对于批量操作，
         # 依赖数据库级联删除通常更高效。
+        # 批量删除绕过了 ORM，需要手动在同一事务中记录被级联删除的向量
+        images = db.session.query(ProductImage.id, ProductImage.product_id).filter(ProductImage.product_id.in_(product_ids)).all()
+        record_index_changes(db.session, IndexChange.OP_REMOVE, [row[0] for row in images], [row[1] for row in images])
         
         num_deleted = Product.query.filter(Product.id.in_(product_ids)).delete(synchronize_session=False)
         db.session.commit()
@@ -332,28 +351,36 @@ def batch_delete_products():
 @products_bp.route('/search', methods=['POST'])
 @cross_origin()
 def search_products():
+    request_start = time.perf_counter()
     try:
         # 检查是否配置了向量搜索
-        if 'PRODUCT_INDEX' not in current_app.config:
+        product_index = get_product_index()
+        if product_index is None:
             return jsonify({'error': '向量搜索未配置'}), 500
-        product_index = current_app.config['PRODUCT_INDEX']
-        import pdb;pdb.set_trace()
         # 处理图片上传
         if 'image' in request.files:
             file = request.files['image']
             if file and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
                 filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                with SEARCH_STAGE_SECONDS.time(stage='upload_read'), span('file.save'):
+                    file.save(filepath)
               
-                # 使用向量索引搜索相似产品
-                results = product_index.search_similar_images(filepath, top_k=10)
+                # 启用分区时可按分区列过滤，如表单字段 factory_name 可多次出现
+                filters = None
+                partition_column = getattr(product_index, 'partition_column', None)
+                if partition_column and request.form.getlist(partition_column):
+                    filters = {partition_column: request.form.getlist(partition_column)}
+                # 使用向量索引搜索相似产品（特征提取、FAISS 搜索和补全图片记录的耗时在索引内记录）
+                results = product_index.search_similar_images(filepath, top_k=10, filters=filters)
   
                 # 清理上传的文件
                 os.remove(filepath)
                 # 获取产品详细信息
+                stage_start = time.perf_counter()
                 product_ids = [result.get('product_id') for result in results]
                 products = Product.query.filter(Product.id.in_(product_ids)).all()
+                SEARCH_STAGE_SECONDS.observe(time.perf_counter() - stage_start, stage='product_lookup')
                  
                 # 将产品对象转换为字典
                 product_list = []
@@ -390,7 +417,11 @@ def search_products():
                 # 如果需要再次确认排序，可以取消下面这行注释，但通常不需要
                 # final_product_list.sort(key=lambda x: x.get('similarity', 0), reverse=True)
                 print(final_product_list)
-                return jsonify(final_product_list)
+                with SEARCH_STAGE_SECONDS.time(stage='serialization'), span('serialize'):
+                    response = jsonify(final_product_list)
+                SEARCH_REQUESTS.inc(status='ok')
+                SEARCH_SECONDS.observe(time.perf_counter() - request_start)
+                return response
         
         # 处理文本搜索
         elif 'query' in request.json:
@@ -421,6 +452,42 @@ def search_products():
         
         return jsonify({'error': '未提供搜索参数'}), 400
     except Exception as e:
+        SEARCH_REQUESTS.inc(status='error')
+        return jsonify({'error': str(e)}), 500
+
+# 近似重复商品分组（由离线查重任务生成）
+@products_bp.route('/duplicates', methods=['GET'])
+@cross_origin()
+def get_duplicate_clusters():
+    try:
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        total = db.session.query(db.func.count(db.distinct(DuplicateCluster.cluster_id))).scalar()
+        cluster_ids = [row[0] for row in db.session.query(DuplicateCluster.cluster_id).distinct()
+                       .order_by(DuplicateCluster.cluster_id).offset((page - 1) * per_page).limit(per_page)]
+        members = (db.session.query(DuplicateCluster, Product, ProductImage.image_path)
+                   .join(Product, Product.id == DuplicateCluster.product_id)
+                   .outerjoin(ProductImage, ProductImage.id == DuplicateCluster.image_id)
+                   .filter(DuplicateCluster.cluster_id.in_(cluster_ids))
+                   .order_by(DuplicateCluster.cluster_id, DuplicateCluster.product_id).all()) if cluster_ids else []
+
+        clusters = {cluster_id: [] for cluster_id in cluster_ids}
+        for entry, product, image_path in members:
+            clusters[entry.cluster_id].append({
+                **entry.to_dict(),
+                'name': product.name,
+                'product_code': product.product_code,
+                'factory_name': product.factory_name,
+                'image_path': image_path,
+            })
+        return jsonify({
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'clusters': [{'cluster_id': cluster_id, 'products': items} for cluster_id, items in clusters.items() if items],
+        })
+    except Exception as e:
+        current_app.logger.error(f"查询重复商品分组失败: {e}")
         return jsonify({'error': str(e)}), 500
 
 # 获取单个产品
@@ -439,6 +506,27 @@ def get_product(product_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 相似商品（由 build-similar 任务预先计算）
+@products_bp.route('/<int:product_id>/similar', methods=['GET'])
+@cross_origin()
+def get_similar_products(product_id):
+    try:
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        # (product_id, rank) 索引上的一次查询，连同相似商品信息一起取出
+        rows = (db.session.query(ProductSimilarity, Product)
+                .join(Product, Product.id == ProductSimilarity.similar_product_id)
+                .filter(ProductSimilarity.product_id == product_id)
+                .order_by(ProductSimilarity.rank)
+                .limit(limit).all())
+        return jsonify({
+            'product_id': product_id,
+            'similar': [{**product.to_dict(), 'rank': entry.rank, 'similarity': entry.similarity}
+                        for entry, product in rows],
+        })
+    except Exception as e:
+        current_app.logger.error(f"查询相似商品失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # 上传产品图片到OSS
 @products_bp.route('/upload_image', methods=['POST'])
 @cross_origin()
@@ -591,6 +679,10 @@ def upload_csv():
         if not os.path.exists(images_folder):
             return jsonify({'error': '图片文件夹路径不存在'}), 400
 
+        # 各阶段累计耗时（秒），随导入结果返回，便于定位导入瓶颈
+        timings = {'read_csv': 0.0, 'db_lookup': 0.0, 'db_commit': 0.0, 'copy_images': 0.0}
+        stage_start = time.perf_counter()
+        
         # 读取CSV文件，支持多种编码格式
         csv_content_bytes = file.read()
         csv_content = None
@@ -610,12 +702,14 @@ def upload_csv():
         
         csv_file = io.StringIO(csv_content)
         csv_reader = csv.DictReader(csv_file)
+        timings['read_csv'] += time.perf_counter() - stage_start
         
         # 导入结果统计
         stats = {
             'total': 0,
             'success': 0,
             'failed': 0,
+            'images': 0,
             'errors': []
         }
         
@@ -632,7 +726,10 @@ def upload_csv():
                 except (TypeError, ValueError):
                     raise ValueError(f"CSV中id值无效，必须为整数: '{row.get('id')}'")
                 # 检查重复ID
-                if Product.query.get(csv_id):
+                stage_start = time.perf_counter()
+                exists = Product.query.get(csv_id)
+                timings['db_lookup'] += time.perf_counter() - stage_start
+                if exists:
                     raise ValueError(f'产品ID {csv_id} 已存在，跳过导入该行')
                 # 创建产品对象
                 product_data = {}
@@ -685,8 +782,10 @@ def upload_csv():
                 # 创建产品对象并保存到数据库
                 product = Product.from_dict(product_data)
                 product.id = csv_id
+                stage_start = time.perf_counter()
                 db.session.add(product)
                 db.session.commit()
+                timings['db_commit'] += time.perf_counter() - stage_start
                 
                 # 获取产品ID
                 product_id = product.id
@@ -699,6 +798,7 @@ def upload_csv():
                     product_specific_images_folder = os.path.join(images_folder, product_name)
                     
                     if os.path.isdir(product_specific_images_folder):
+                        stage_start = time.perf_counter()
                         # 遍历特定产品图片文件夹中的文件
                         for filename in os.listdir(product_specific_images_folder):
                             if allowed_file(filename):
@@ -712,9 +812,11 @@ def upload_csv():
                                 # 目标文件路径
                                 dest_path = os.path.join(product_good_dir, unique_filename)
                                 # 复制文件
-                                shutil.copy2(image_path, dest_path)
+                                with span('file.copy'):
+                                    shutil.copy2(image_path, dest_path)
                                 # 添加URL到列表
                                 good_img_urls.append(f"/uploads/good_images/{product_id}/{unique_filename}")
+                        timings['copy_images'] += time.perf_counter() - stage_start
                     else:
                         current_app.logger.warning(f"产品 '{product_name}' 对应的图片文件夹 '{product_specific_images_folder}' 不存在或不是一个目录")
                 else:
@@ -722,9 +824,12 @@ def upload_csv():
                 
                 # 更新产品的图片URL
                 if good_img_urls:
+                    stage_start = time.perf_counter()
                     product.good_img = json.dumps(good_img_urls)
                     product.image_url = good_img_urls[0]  # 使用第一张图片作为主图
                     db.session.commit()
+                    timings['db_commit'] += time.perf_counter() - stage_start
+                stats['images'] += len(good_img_urls)
                 
                 # 向量索引逻辑已移至 _add_images_to_vector_index 函数
                 # upload_csv 函数不再直接处理向量索引的创建
@@ -737,6 +842,11 @@ def upload_csv():
                 current_app.logger.error(error_msg)
                 db.session.rollback()
         
+        stats['timings'] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+        INGEST_PRODUCTS.inc(stats['success'], source='csv')
+        INGEST_IMAGES.inc(stats['images'], source='csv')
+        for stage, seconds in timings.items():
+            INGEST_STAGE_SECONDS.inc(seconds, source='csv', stage=stage)
         return jsonify({
             'message': 'CSV文件导入完成',
             'stats': stats
@@ -746,12 +856,21 @@ def upload_csv():
         return jsonify({'error': str(e)}), 500
 
 # 辅助函数：将产品图片添加到向量索引
-def _add_images_to_vector_index(product_id, good_img_urls):
-    if not current_app.config.get('PRODUCT_INDEX') or not good_img_urls:
+def _add_images_to_vector_index(product_id, good_img_urls, timings=None):
+    """
+    提取产品图片特征并写入 ProductImage 表，FAISS 索引由变更日志同步
+    Args:
+        timings: 可选的阶段耗时字典，累加 embedding（特征提取）和 db_commit（写入数据库）的秒数
+    Returns:
+        int: 成功写入的图片数
+    """
+    if timings is None:
+        timings = {}
+    if not current_app.config.get('PRODUCT_INDEX_ENABLED') or not good_img_urls:
         current_app.logger.info(f"Skipping vector indexing for product {product_id}: Product index not configured or no image URLs provided.")
-        return
+        return 0
 
-    product_index = current_app.config['PRODUCT_INDEX']
+    product_index = get_product_index()
     images_to_index = []
     try:
         for item in good_img_urls:
@@ -769,11 +888,16 @@ def _add_images_to_vector_index(product_id, good_img_urls):
                 continue
             
             try:
+                stage_start = time.perf_counter()
                 feature = product_index.extract_feature(filesystem_path)
+                elapsed = time.perf_counter() - stage_start
+                timings['embedding'] = timings.get('embedding', 0.0) + elapsed
+                INGEST_STAGE_SECONDS.inc(elapsed, source='index', stage='embedding')
                 product_image_record = ProductImage(
                     product_id=product_id,
                     image_path=web_path,  # 这是图片的 web 路径
-                    vector=feature
+                    vector=feature,
+                    image_hash=image_hash(filesystem_path)
                 )
                 images_to_index.append(product_image_record)
             except Exception as feature_exc:
@@ -781,15 +905,23 @@ def _add_images_to_vector_index(product_id, good_img_urls):
                 continue # 继续处理其他图片
 
         if images_to_index:
+            stage_start = time.perf_counter()
             db.session.add_all(images_to_index)
             db.session.commit()
+            elapsed = time.perf_counter() - stage_start
+            timings['db_commit'] = timings.get('db_commit', 0.0) + elapsed
+            INGEST_STAGE_SECONDS.inc(elapsed, source='index', stage='db_commit')
+            INGEST_PRODUCTS.inc(source='index')
+            INGEST_IMAGES.inc(len(images_to_index), source='index')
             current_app.logger.info(f"Successfully added {len(images_to_index)} images for product {product_id} to vector index and ProductImage table.")
         else:
             current_app.logger.info(f"No images were successfully processed for vector indexing for product {product_id}.")
+        return len(images_to_index)
 
     except Exception as e:
         db.session.rollback() # 如果批量添加失败，则回滚
         current_app.logger.error(f"Error adding images to vector index for product {product_id}: {e}")
+        return 0
 
 # 构建向量索引（用于图片相似度检索）
 @products_bp.route('/build-vector-index', methods=['GET'])
@@ -797,12 +929,10 @@ def _add_images_to_vector_index(product_id, good_img_urls):
 def build_vector_index():
     def event_stream_generator():
         try:
-            # 初始化向量索引 (这部分逻辑可以保留在生成器外部或开始处，确保索引对象已准备好)
-            if 'PRODUCT_INDEX' not in current_app.config:
-                from product_search import VectorProductIndex
-                product_index = VectorProductIndex()
-                current_app.config['PRODUCT_INDEX'] = product_index
-            # else: product_index = current_app.config['PRODUCT_INDEX'] # 已在外部作用域定义
+            # 初始化向量索引。是否启用向量搜索由部署配置决定，请求中不修改
+            if get_product_index() is None:
+                yield f"data: {json.dumps({'type': 'error', 'message': '未启用向量搜索，无法构建向量索引'})}\n\n"
+                return
             existing_product_id_tuples = db.session.query(ProductImage.product_id.distinct()).all()
             existing_product_ids = {pid[0] for pid in existing_product_id_tuples} # 从元组中提取ID并放入集合
             
@@ -822,6 +952,8 @@ def build_vector_index():
                 return
 
             processed_count = 0
+            images_indexed = 0
+            timings = {'embedding': 0.0, 'db_commit': 0.0}
             error_list = [] # 用于收集处理单个产品时发生的错误信息
             
             for product in products_to_process:
@@ -835,7 +967,7 @@ def build_vector_index():
                     
                     # 调用辅助函数进行向量索引
                     # _add_images_to_vector_index 应该处理自己的内部错误并记录，这里我们只关心它是否成功触发
-                    _add_images_to_vector_index(product.id, good_img_urls)
+                    images_indexed += _add_images_to_vector_index(product.id, good_img_urls, timings)
                     # 假设 _add_images_to_vector_index 成功执行（或内部处理了错误）
                     processed_count += 1
                     yield f"data: {json.dumps({'type': 'progress', 'processed': processed_count, 'total': total_count, 'current_product_id': product.id, 'status': 'processed'})}\n\n"
@@ -854,7 +986,7 @@ def build_vector_index():
             if error_list:
                 final_message += f" 发生 {len(error_list)} 个错误。"
 
-            yield f"data: {json.dumps({'type': 'complete', 'message': final_message, 'products_processed': processed_count, 'total_products_considered': total_count, 'errors': error_list})}\n\n"
+            yield f"data: {json.dumps({'type': 'complete', 'message': final_message, 'products_processed': processed_count, 'total_products_considered': total_count, 'images_indexed': images_indexed, 'timings': {stage: round(seconds, 4) for stage, seconds in timings.items()}, 'errors': error_list})}\n\n"
         
         except Exception as e:
             # 捕获生成器初始化或查询时发生的顶层错误
@@ -869,10 +1001,9 @@ def build_vector_index():
 def build_vector_index_sse():
     def event_stream_generator():
         try:
-            if 'PRODUCT_INDEX' not in current_app.config:
-                from product_search import VectorProductIndex
-                product_index = VectorProductIndex()
-                current_app.config['PRODUCT_INDEX'] = product_index
+            if get_product_index() is None:
+                yield f"data: {json.dumps({'type': 'error', 'message': '未启用向量搜索，无法构建向量索引'})}\n\n"
+                return
             existing_product_id_tuples = db.session.query(ProductImage.product_id.distinct()).all()
             existing_product_ids = {pid[0] for pid in existing_product_id_tuples}
 
@@ -892,6 +1023,8 @@ def build_vector_index_sse():
                 return
 
             processed_count = 0
+            images_indexed = 0
+            timings = {'embedding': 0.0, 'db_commit': 0.0}
             error_list = []
 
             for product in products_to_process:
@@ -902,7 +1035,7 @@ def build_vector_index_sse():
                         yield f"data: {json.dumps({'type': 'progress', 'processed': processed_count, 'total': total_count, 'current_product_id': product.id, 'status': 'skipped_no_images'})}\n\n"
                         continue
 
-                    _add_images_to_vector_index(product.id, good_img_urls)
+                    images_indexed += _add_images_to_vector_index(product.id, good_img_urls, timings)
                     processed_count += 1
                     yield f"data: {json.dumps({'type': 'progress', 'processed': processed_count, 'total': total_count, 'current_product_id': product.id, 'status': 'processed'})}\n\n"
 
@@ -918,7 +1051,7 @@ def build_vector_index_sse():
             if error_list:
                 final_message += f" 发生 {len(error_list)} 个错误。"
 
-            yield f"data: {json.dumps({'type': 'complete', 'message': final_message, 'products_processed': processed_count, 'total_products_considered': total_count, 'errors': error_list})}\n\n"
+            yield f"data: {json.dumps({'type': 'complete', 'message': final_message, 'products_processed': processed_count, 'total_products_considered': total_count, 'images_indexed': images_indexed, 'timings': {stage: round(seconds, 4) for stage, seconds in timings.items()}, 'errors': error_list})}\n\n"
 
         except Exception as e:
             current_app.logger.error(f"构建向量索引流时发生严重错误: {str(e)}")
@@ -107,6 +107,7 @@ CREATE TABLE IF NOT EXISTS product_images (
   product_id INT NOT NULL,
   image_path VARCHAR(255) NOT NULL,
   vector BLOB NOT NULL,
+  image_hash BIGINT NULL COMMENT '图片的64位dHash，已有数据库的升级步骤见 README',
   PRIMARY KEY (id),
   UNIQUE KEY unique_image_path (image_path),
   KEY idx_product_id (product_id),
@@ -123,4 +124,48 @@ CREATE TABLE IF NOT EXISTS balance_transactions (
     FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE,
     INDEX idx_customer_id (customer_id),
     INDEX idx_created_at (created_at)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
\ No newline at end of file
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+-- 创建向量索引变更日志表（与 product_images 的增删在同一事务中写入）
+CREATE TABLE IF NOT EXISTS index_changes (
+    seq BIGINT AUTO_INCREMENT PRIMARY KEY COMMENT '单调递增序号',
+    op VARCHAR(10) NOT NULL COMMENT '操作类型：add-新增向量, remove-删除向量',
+    image_id INT NOT NULL COMMENT 'product_images.id',
+    product_id INT NULL COMMENT '图片所属商品ID，图片删除后用于找到受影响的商品',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    INDEX idx_created_at (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建近似重复商品分组表（离线查重任务整表重写）
+CREATE TABLE IF NOT EXISTS duplicate_clusters (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    cluster_id INT NOT NULL COMMENT '分组编号，按组内商品数降序',
+    product_id INT NOT NULL,
+    image_id INT NOT NULL COMMENT '与组内其他商品最相似的图片 product_images.id',
+    similarity FLOAT NOT NULL COMMENT '该图片与组内其他商品图片的最高余弦相似度',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '查重任务运行时间',
+    INDEX idx_cluster_id (cluster_id),
+    INDEX idx_product_id (product_id),
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建相似商品表（每个商品保留前 K 个相似商品，由 build-similar 任务维护）
+CREATE TABLE IF NOT EXISTS product_similarities (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    product_id INT NOT NULL,
+    similar_product_id INT NOT NULL,
+    `rank` INT NOT NULL COMMENT '相似度排名，从 1 开始',
+    similarity FLOAT NOT NULL,
+    change_seq BIGINT NOT NULL DEFAULT 0 COMMENT '计算时已处理到的 index_changes.seq',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_product_rank (product_id, `rank`),
+    INDEX idx_similar_product_id (similar_product_id),
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+    FOREIGN KEY (similar_product_id) REFERENCES products(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 创建相似商品增量计算进度表（只有 id=1 一行）
+CREATE TABLE IF NOT EXISTS product_similarity_state (
+    id INT PRIMARY KEY,
+    change_seq BIGINT NOT NULL DEFAULT 0 COMMENT '已处理到的 index_changes.seq',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
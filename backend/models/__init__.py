@@ -7,5 +7,8 @@ from .order import Order
 from .product import Product, ProductImage
 from .balance_transaction import BalanceTransaction
 from .file_hash import FileHash
+from .index_change import IndexChange
+from .duplicate_cluster import DuplicateCluster
+from .product_similarity import ProductSimilarity, ProductSimilarityState
 
-__all__ = ['db', 'Customer', 'Order', 'Product', 'ProductImage', 'BalanceTransaction', 'FileHash']
+__all__ = ['db', 'Customer', 'Order', 'Product', 'ProductImage', 'BalanceTransaction', 'FileHash', 'IndexChange', 'DuplicateCluster', 'ProductSimilarity', 'ProductSimilarityState']
@@ -0,0 +1,30 @@
+from datetime import datetime
+from . import db
+
+class DuplicateCluster(db.Model):
+    """
+    近似重复商品分组，由离线查重任务（python -m product_search.admin find-duplicates）整表重写。
+    同一 cluster_id 的商品至少有一张图片与组内其他商品的图片相似度超过阈值。
+    """
+    __tablename__ = 'duplicate_clusters'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cluster_id = db.Column(db.Integer, nullable=False, index=True, comment='分组编号，按组内商品数降序')
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
+    image_id = db.Column(db.Integer, nullable=False, comment='与组内其他商品最相似的图片 product_images.id')
+    similarity = db.Column(db.Float, nullable=False, comment='该图片与组内其他商品图片的最高余弦相似度')
+    created_at = db.Column(db.DateTime, default=datetime.now, comment='查重任务运行时间')
+
+    product = db.relationship('Product')
+
+    def __repr__(self):
+        return f'<DuplicateCluster {self.cluster_id} product {self.product_id}>'
+
+    def to_dict(self):
+        return {
+            'cluster_id': self.cluster_id,
+            'product_id': self.product_id,
+            'image_id': self.image_id,
+            'similarity': self.similarity,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
@@ -0,0 +1,90 @@
+import os
+from datetime import datetime
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from . import db
+
+class IndexChange(db.Model):
+    """
+    向量索引变更日志，与 product_images 的插入/删除在同一事务中写入。
+    各进程中的 VectorProductIndex 按 seq 递增顺序追踪该表，增量应用变更。
+    """
+    __tablename__ = 'index_changes'
+
+    OP_ADD = 'add'
+    OP_REMOVE = 'remove'
+
+    # SQLite 只对 INTEGER PRIMARY KEY 自增，测试环境下退化为 Integer
+    seq = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True, comment='单调递增序号')
+    op = db.Column(db.String(10), nullable=False, comment='操作类型：add-新增向量, remove-删除向量')
+    image_id = db.Column(db.Integer, nullable=False, comment='product_images.id')
+    product_id = db.Column(db.Integer, nullable=True, comment='图片所属商品ID，图片删除后用于找到受影响的商品')
+    created_at = db.Column(db.DateTime, default=datetime.now, comment='创建时间')
+
+    def __repr__(self):
+        return f'<IndexChange {self.seq} {self.op} {self.image_id}>'
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'op': self.op,
+            'image_id': self.image_id,
+            'product_id': self.product_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+
+# 向量索引按该 Product 列分区（如 factory_name、launch_season），为空表示不分区。
+# 该列被修改时为商品的全部图片写入 add 变更，各进程同步时把图片移到新分区
+INDEX_PARTITION_COLUMN = os.getenv('INDEX_PARTITION_COLUMN', '')
+
+# 提交后回调（例如唤醒本进程的索引同步线程）
+_commit_listeners = []
+
+def register_commit_listener(callback):
+    """注册在写入过索引变更的事务提交后调用的回调"""
+    if callback not in _commit_listeners:
+        _commit_listeners.append(callback)
+
+def record_index_changes(session, op, image_ids, product_ids=None):
+    """
+    在当前事务中写入变更日志。
+    用于绕过 ORM 的批量操作（如 Query.delete() 依赖数据库级联删除 product_images），
+    调用方需在执行删除前先查出受影响的图片ID；product_ids 与 image_ids 一一对应，可为空
+    """
+    image_ids = list(image_ids)
+    product_ids = list(product_ids) if product_ids is not None else [None] * len(image_ids)
+    rows = [{'op': op, 'image_id': int(image_id), 'product_id': product_id, 'created_at': datetime.now()}
+            for image_id, product_id in zip(image_ids, product_ids)]
+    if rows:
+        session.connection().execute(IndexChange.__table__.insert(), rows)
+        session.info['index_changed'] = True
+
+@event.listens_for(Session, 'after_flush')
+def _log_product_image_changes(session, flush_context):
+    # after_flush 时 new/deleted/dirty 仍保留本次 flush 前的状态，且新对象已分配主键
+    from .product import Product, ProductImage
+
+    added = [(obj.id, obj.product_id) for obj in session.new if isinstance(obj, ProductImage)]
+    removed = [(obj.id, obj.product_id) for obj in session.deleted if isinstance(obj, ProductImage)]
+    if INDEX_PARTITION_COLUMN:
+        moved = [obj.id for obj in session.dirty if isinstance(obj, Product)
+                 and inspect(obj).attrs[INDEX_PARTITION_COLUMN].history.has_changes()]
+        if moved:
+            added += [tuple(row) for row in session.connection().execute(
+                select(ProductImage.id, ProductImage.product_id).where(ProductImage.product_id.in_(moved)))]
+    for op, images in ((IndexChange.OP_ADD, added), (IndexChange.OP_REMOVE, removed)):
+        record_index_changes(session, op, [image_id for image_id, _ in images],
+                             [product_id for _, product_id in images])
+
+@event.listens_for(Session, 'after_commit')
+def _notify_index_change_commit(session):
+    if session.info.pop('index_changed', False):
+        for callback in list(_commit_listeners):
+            try:
+                callback()
+            except Exception as e:
+                print(f"索引变更回调执行失败: {e}")
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_index_change_flag(session):
+    session.info.pop('index_changed', None)
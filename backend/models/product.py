@@ -138,6 +138,7 @@ class ProductImage(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
     image_path = db.Column(db.String(255), nullable=False, unique=True)
     vector = db.Column(db.LargeBinary, nullable=False)  # BLOB类型用于存储向量
+    image_hash = db.Column(db.BigInteger, nullable=True)  # 图片的 64 位 dHash，用于不经特征提取识别重复图片
     
     # 建立与Product的关系
     product = db.relationship('Product', backref=db.backref('images', lazy=True, cascade='all, delete-orphan'))
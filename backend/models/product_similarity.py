@@ -0,0 +1,39 @@
+from datetime import datetime
+from . import db
+
+class ProductSimilarity(db.Model):
+    """
+    预计算的相似商品（每个商品按相似度保留前 K 个），由 python -m product_search.admin build-similar 维护。
+    商品详情页通过 (product_id, rank) 索引一次查询取出。
+    """
+    __tablename__ = 'product_similarities'
+    __table_args__ = (db.Index('idx_product_rank', 'product_id', 'rank'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    similar_product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
+    rank = db.Column(db.Integer, nullable=False, comment='相似度排名，从 1 开始')
+    similarity = db.Column(db.Float, nullable=False)
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, comment='计算时已处理到的 index_changes.seq')
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    similar_product = db.relationship('Product', foreign_keys=[similar_product_id])
+
+    def __repr__(self):
+        return f'<ProductSimilarity {self.product_id} -> {self.similar_product_id}>'
+
+    def to_dict(self):
+        return {
+            'product_id': self.similar_product_id,
+            'rank': self.rank,
+            'similarity': self.similarity,
+        }
+
+class ProductSimilarityState(db.Model):
+    """build-similar 增量计算的进度（只有 id=1 一行），与相似商品结果分开保存，没有写入结果时也能推进"""
+    __tablename__ = 'product_similarity_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, comment='已处理到的 index_changes.seq')
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
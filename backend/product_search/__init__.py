@@ -0,0 +1,108 @@
+"""
+商品图片向量检索。
+
+子模块在首次访问对应名称时才导入（PEP 562），只使用 CRUD 接口的 worker 和测试不会加载 faiss；
+get_product_index() 在首次调用时创建本进程唯一的索引实例。
+"""
+import importlib
+import os
+import threading
+import time
+
+from .types import ProductInfo
+
+_LAZY_ATTRS = {
+    'VectorProductIndex': '.index',
+    'DB_CONFIG': '.index',
+    'IndexClient': '.client',
+    'RemoteProductIndex': '.client',
+}
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+_index = None
+_index_pid = None
+_index_lock = threading.Lock()
+
+def get_product_index(engine=None):
+    """
+    获取本进程的向量索引，首次调用时创建。
+    配置了 INDEX_SERVER_ADDRESS 时返回索引服务客户端，否则在本进程加载索引。
+    fork 出的子进程（如 gunicorn --preload 的 worker）不沿用父进程的实例，会重新创建。
+    Args:
+        engine: 数据库连接池，仅在首次创建时使用
+    """
+    global _index, _index_pid
+    if _index is None or _index_pid != os.getpid():
+        with _index_lock:
+            if _index is None or _index_pid != os.getpid():
+                start = time.perf_counter()
+                address = os.getenv('INDEX_SERVER_ADDRESS')
+                if address:
+                    from .client import RemoteProductIndex
+                    _index = RemoteProductIndex(address, engine=engine)
+                else:
+                    from .index import VectorProductIndex, limit_faiss_threads
+                    limit_faiss_threads()
+                    _index = VectorProductIndex(engine=engine)
+                _index_pid = os.getpid()
+                print(f"向量索引初始化完成，耗时 {time.perf_counter() - start:.2f} 秒。")
+    return _index
+
+def peek_product_index():
+    """返回本进程已创建的向量索引，尚未创建时返回 None（不会触发加载）"""
+    return _index if _index_pid == os.getpid() else None
+
+_warmup_thread = None
+_warmup_pid = None
+_warmup_error = None
+
+def start_background_warmup(engine=None):
+    """
+    在后台线程中创建并预热向量索引，不阻塞应用启动。
+    可重复调用：预热进行中或已完成时不做任何事，上次失败时重新尝试。
+    """
+    global _warmup_thread, _warmup_pid
+    with _index_lock:
+        if _warmup_pid == os.getpid() and _warmup_thread is not None and _warmup_thread.is_alive():
+            return
+        index = peek_product_index()
+        if index is not None and index.warmup_state in ('warming', 'ready'):
+            return
+        _warmup_thread = threading.Thread(target=_warm_up, args=(engine,), name='index-warmup', daemon=True)
+        _warmup_pid = os.getpid()
+        _warmup_thread.start()
+
+def _warm_up(engine):
+    global _warmup_error
+    _warmup_error = None
+    try:
+        get_product_index(engine).warm_up()
+    except Exception as e:
+        _warmup_error = str(e)
+        print(f"向量索引加载或预热失败: {e}")
+
+def get_index_status() -> dict:
+    """
+    本进程向量索引的就绪状态
+    Returns:
+        dict: state 为 pending/loading/warming/ready/failed，索引已创建时还包含 generation 和 ntotal
+    """
+    index = peek_product_index()
+    if index is None:
+        loading = _warmup_pid == os.getpid() and _warmup_thread is not None and _warmup_thread.is_alive()
+        if loading:
+            state = 'loading'
+        else:
+            state = 'failed' if _warmup_error else 'pending'
+        return {'state': state, 'error': _warmup_error}
+    return index.warmup_status()
+
+__all__ = ['VectorProductIndex', 'ProductInfo', 'DB_CONFIG', 'IndexClient', 'RemoteProductIndex',
+           'get_product_index', 'peek_product_index', 'start_background_warmup', 'get_index_status']
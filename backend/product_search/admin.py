@@ -0,0 +1,453 @@
+"""
+向量索引管理工具。
+
+用法:
+    python -m product_search.admin stats
+    python -m product_search.admin verify --replication-dir /data/index
+    python -m product_search.admin reconcile --index-file product_index.bin
+    python -m product_search.admin compact --replication-dir /data/index
+    python -m product_search.admin export --output vectors/ [--format npy|parquet]
+    python -m product_search.admin import --input vectors/ --output product_index.bin
+    python -m product_search.admin backfill-hashes [--upload-folder uploads/]
+    python -m product_search.admin find-duplicates [--threshold 0.95] [--dry-run]
+    python -m product_search.admin build-similar [--full] [--loop 300]
+
+索引来源:
+    --index-file       save_index 保存的索引文件
+    --replication-dir  WAL 与快照目录（默认取 INDEX_REPLICATION_DIR），从最新快照启动并重放 WAL
+    都未指定时从 product_images 全量加载（与 Web 进程相同）
+
+数据库与索引都按 --chunk-size 分块遍历，除索引本身外内存占用与块大小成正比。
+reconcile/compact 写入复制目录时以写入方（leader）身份打开，运行前需停止正在运行的写入方。
+"""
+import argparse
+import json
+import os
+import zlib
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from .index import VectorProductIndex, INDEX_REPLICATION_DIR, INDEX_TRAIN_SIZE, base_index, serialize_index, faiss
+from .numpy_index import NumpyIndex
+from .ondisk import ondisk_lists
+from .phash import image_hash
+from .dedup import DEDUP_THRESHOLD, DEDUP_BLOCK_SIZE, find_duplicates
+from .similar import SIMILAR_TOP_K, build_similarities, run_forever
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
+SAMPLE_SIZE = 20  # 报告中列出的差异ID数量
+
+def open_index(index_file: Optional[str] = None, replication_dir: Optional[str] = None,
+               role: str = 'follower', dimension: int = 1024) -> VectorProductIndex:
+    """
+    打开要管理的索引，不启动后台同步和搜索批处理
+    Args:
+        index_file: 索引文件路径
+        replication_dir: WAL 与快照目录
+        role: 打开复制目录时的角色，需要写回（reconcile/compact）时为 'leader'
+        dimension: 特征向量维度
+    """
+    index = VectorProductIndex(dimension, sync_interval=0, batch_max_size=1,
+                               replication_dir='' if index_file else (replication_dir or ''),
+                               replication_role=role, autoload=not index_file)
+    if index_file:
+        index.load_index(index_file)
+        index.dimension = index.index.d
+    return index
+
+def index_ids(index: VectorProductIndex) -> np.ndarray:
+    """索引中的全部有效 product_images.id（升序）"""
+    return index.live_ids()
+
+def iter_db_vectors(conn, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    按 id 分块读取 product_images 中的向量。
+    调用方在同一个连接（同一事务快照）中遍历，各块之间的数据是一致的
+    """
+    last_id = 0
+    while True:
+        rows = conn.exec_driver_sql(
+            "SELECT id, vector FROM product_images WHERE id > %s ORDER BY id LIMIT %s", (last_id, chunk_size)
+        ).fetchall()
+        if not rows:
+            return
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        yield ids, np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        if len(rows) < chunk_size:
+            return
+        last_id = int(ids[-1])
+
+def iter_index_vectors(index: VectorProductIndex, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       ids: Optional[np.ndarray] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """按 id 分块从索引中取回向量，ids 为空时遍历整个索引"""
+    ids = index_ids(index) if ids is None else ids
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        yield chunk, index.reconstruct_vectors(chunk)
+
+def _row_checksums(ids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    return np.array([zlib.crc32(vector.tobytes(), int(image_id) & 0xFFFFFFFF)
+                     for image_id, vector in zip(ids, np.ascontiguousarray(vectors, dtype=np.float32))], dtype=np.uint64)
+
+def verify(index: VectorProductIndex, chunk_size: int = DEFAULT_CHUNK_SIZE, checksum: bool = True) -> dict:
+    """
+    按 id 和向量校验和比对索引与 product_images
+    Args:
+        checksum: 是否比对向量内容；有损压缩的索引类型应关闭，只比对 id
+    只索引代表图片时，以当前选出的代表图片为准
+    Returns:
+        dict: missing（数据库有、索引没有）、extra（索引有、数据库没有）、stale（向量不一致）的数量、
+              示例ID和全部ID，以及双方与顺序无关的汇总校验和
+    """
+    ids_in_index = index_ids(index)
+    representatives = index.representative_ids()
+    seen = np.zeros(len(ids_in_index), dtype=bool)
+    missing, stale = [], []
+    db_rows = 0
+    db_checksum = index_checksum = 0
+    with index.db.connect(statement_timeout_ms=0) as conn:
+        for ids, vectors in iter_db_vectors(conn, chunk_size):
+            db_rows += len(ids)
+            # 只索引代表图片时，其余图片不算缺失（在索引中则算多余），也不计入数据库一侧的校验和
+            expected = np.ones(len(ids), dtype=bool) if representatives is None else np.isin(ids, representatives)
+            if len(ids_in_index):
+                pos = np.minimum(np.searchsorted(ids_in_index, ids), len(ids_in_index) - 1)
+                present = (ids_in_index[pos] == ids) & expected
+                seen[pos[present]] = True
+            else:
+                present = np.zeros(len(ids), dtype=bool)
+            missing.extend(int(i) for i in ids[~present & expected])
+            if not checksum:
+                continue
+            db_sums = _row_checksums(ids, vectors)
+            db_sums[~expected] = 0
+            db_checksum = (db_checksum + int(db_sums.sum())) & 0xFFFFFFFFFFFFFFFF
+            if present.any():
+                stored = index.reconstruct_vectors(ids[present])
+                index_sums = _row_checksums(ids[present], stored)
+                index_checksum = (index_checksum + int(index_sums.sum())) & 0xFFFFFFFFFFFFFFFF
+                stale.extend(int(i) for i in ids[present][index_sums != db_sums[present]])
+    extra = [int(i) for i in ids_in_index[~seen]]
+    if checksum and extra:
+        for ids, vectors in iter_index_vectors(index, chunk_size, np.array(extra, dtype=np.int64)):
+            index_checksum = (index_checksum + int(_row_checksums(ids, vectors).sum())) & 0xFFFFFFFFFFFFFFFF
+    result = {
+        'db_rows': db_rows,
+        'index_vectors': len(ids_in_index),
+        'missing': len(missing),
+        'extra': len(extra),
+        'stale': len(stale),
+        'in_sync': not (missing or extra or stale),
+        'samples': {'missing': missing[:SAMPLE_SIZE], 'extra': extra[:SAMPLE_SIZE], 'stale': stale[:SAMPLE_SIZE]},
+        'drift_ids': sorted(set(missing) | set(extra) | set(stale)),
+    }
+    if checksum:
+        result['db_checksum'] = f"{db_checksum:016x}"
+        result['index_checksum'] = f"{index_checksum:016x}"
+    return result
+
+def reconcile(index: VectorProductIndex, chunk_size: int = DEFAULT_CHUNK_SIZE, checksum: bool = True) -> dict:
+    """
+    修复索引与数据库的差异：只对有差异的图片ID按 product_images 当前状态重新应用，
+    与增量同步走同一路径（写入方会同时写 WAL）
+    """
+    report = verify(index, chunk_size, checksum)
+    drift_ids = report.pop('drift_ids')
+    with index.db.connect() as conn:
+        for start in range(0, len(drift_ids), chunk_size):
+            index._apply_image_changes(conn, drift_ids[start:start + chunk_size])
+    report['fixed'] = len(drift_ids)
+    return report
+
+def compact(index: VectorProductIndex, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    按现有向量重建索引，回收删除向量后残留的存储容量（std::vector 删除元素后不会缩容），
+    同时清除不支持物理删除的索引类型中的已删除向量。写入方随后切出新快照并删除旧的 WAL 段
+    """
+    before = index_memory_bytes(index)
+    with index._lock:
+        rebuilt = index._new_index()
+        if not rebuilt.is_trained:
+            if ondisk_lists(rebuilt) is not None and index.ntotal:
+                # 磁盘倒排表无法克隆，用现有向量的样本重新训练
+                ids = index.live_ids()
+                sample = np.random.default_rng(0).choice(ids, min(INDEX_TRAIN_SIZE, len(ids)), replace=False)
+                rebuilt.train(index.reconstruct_vectors(np.sort(sample)))
+            else:
+                # 沿用已训练的量化器，不重新训练
+                rebuilt = faiss.clone_index(index.index)
+                rebuilt.reset()
+        for ids, vectors in iter_index_vectors(index, chunk_size):
+            rebuilt.add_with_ids(vectors, ids)
+        index._set_index(rebuilt)
+        index._release_lists()
+        index.generation += 1
+    return {'ntotal': int(index.ntotal), 'memory_bytes_before': before, 'memory_bytes_after': index_memory_bytes(index)}
+
+def index_memory_bytes(index: VectorProductIndex) -> int:
+    """索引占用的内存：平面索引按向量存储与ID映射的大小计算，其他类型按序列化大小估算"""
+    with index._lock:
+        ix = index.index
+        if isinstance(ix, NumpyIndex):
+            return ix.nbytes
+        codes = getattr(base_index(ix), 'codes', None)
+        if codes is not None:
+            id_bytes = ix.id_map.size() * 8 if hasattr(ix, 'id_map') else 0
+            return int(codes.size() + id_bytes)
+        return int(serialize_index(ix).size)
+
+def _type_chain(ix) -> str:
+    names = []
+    while ix is not None:
+        if not isinstance(ix, NumpyIndex):
+            ix = faiss.downcast_index(ix)
+        names.append(type(ix).__name__)
+        ix = getattr(ix, 'index', None)
+    return ' -> '.join(names)
+
+def _dir_size(directory: str) -> Tuple[int, int]:
+    if not os.path.isdir(directory):
+        return 0, 0
+    names = [n for n in os.listdir(directory) if os.path.isfile(os.path.join(directory, n))]
+    return len(names), sum(os.path.getsize(os.path.join(directory, n)) for n in names)
+
+def stats(index: VectorProductIndex, index_file: Optional[str] = None) -> dict:
+    """索引类型、规模、内存与磁盘占用，以及数据库侧的行数与变更日志位置"""
+    with index._lock:
+        ix = index.index
+        result = {
+            'type': _type_chain(ix),
+            'ntotal': int(index.ntotal),
+            'tombstones': len(index._tombstones),
+            'dimension': ix.d,
+            'metric': 'inner_product' if faiss is not None and ix.metric_type == faiss.METRIC_INNER_PRODUCT else 'l2',
+            'is_trained': bool(ix.is_trained),
+            'generation': index.generation,
+            'last_change_seq': index.last_change_seq,
+        }
+    result['memory_bytes'] = index_memory_bytes(index)
+    partitions = index.partition_stats()
+    if partitions is not None:
+        result['partitions'] = partitions
+    with index._lock:
+        invlists = ondisk_lists(index.index)
+        if invlists is not None:
+            result['ondisk'] = {'file': invlists.filename, 'file_bytes': int(invlists.totsize),
+                                **index.list_cache.stats()}
+    if index_file:
+        result['file_bytes'] = os.path.getsize(index_file)
+    if index.replication_dir:
+        latest = index._snapshots.latest() if index._snapshots else None
+        if latest:
+            result['snapshot'] = {'file': latest['file'], 'lsn': latest['lsn'], 'bytes': os.path.getsize(latest['path'])}
+        segments, wal_bytes = _dir_size(os.path.join(index.replication_dir, 'wal'))
+        result['wal'] = {'segments': segments, 'bytes': wal_bytes}
+    with index.db.connect() as conn:
+        result['db_rows'] = int(conn.exec_driver_sql("SELECT COUNT(*) FROM product_images").scalar())
+        result['db_max_change_seq'] = int(conn.exec_driver_sql("SELECT COALESCE(MAX(seq), 0) FROM index_changes").scalar())
+    return result
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("导出/导入 Parquet 需要安装 pyarrow: pip install pyarrow")
+    return pyarrow
+
+def export_vectors(chunks: Iterator[Tuple[np.ndarray, np.ndarray]], total: int, dimension: int,
+                   output: str, fmt: str = 'npy') -> int:
+    """
+    分块写出向量
+    Args:
+        chunks: (ids, vectors) 迭代器
+        total: 总行数（npy 需要预先分配文件）
+        output: npy 格式为目录（写 ids.npy 与 vectors.npy），parquet 格式为文件路径
+    Returns:
+        int: 写出的行数
+    """
+    written = 0
+    if fmt == 'npy':
+        os.makedirs(output, exist_ok=True)
+        ids_out = np.lib.format.open_memmap(os.path.join(output, 'ids.npy'), mode='w+', dtype=np.int64, shape=(total,))
+        vectors_out = np.lib.format.open_memmap(os.path.join(output, 'vectors.npy'), mode='w+',
+                                                dtype=np.float32, shape=(total, dimension))
+        for ids, vectors in chunks:
+            ids_out[written:written + len(ids)] = ids
+            vectors_out[written:written + len(ids)] = vectors
+            written += len(ids)
+        ids_out.flush()
+        vectors_out.flush()
+        return written
+
+    pa = _import_pyarrow()
+    schema = pa.schema([('id', pa.int64()), ('vector', pa.list_(pa.float32(), dimension))])
+    with pa.parquet.ParquetWriter(output, schema) as writer:
+        for ids, vectors in chunks:
+            vector_array = pa.FixedSizeListArray.from_arrays(pa.array(np.ascontiguousarray(vectors, dtype=np.float32).ravel()), dimension)
+            writer.write_table(pa.Table.from_arrays([pa.array(ids), vector_array], schema=schema))
+            written += len(ids)
+    return written
+
+def iter_import_file(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """分块读取 export_vectors 写出的文件"""
+    if os.path.isdir(path):
+        ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+        vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        for start in range(0, len(ids), chunk_size):
+            yield np.array(ids[start:start + chunk_size]), np.array(vectors[start:start + chunk_size])
+        return
+    pa = _import_pyarrow()
+    for batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        vectors = batch.column('vector')
+        dimension = len(vectors[0]) if len(vectors) else 0
+        yield (batch.column('id').to_numpy(),
+               vectors.flatten().to_numpy(zero_copy_only=False).reshape(-1, dimension))
+
+def import_vectors(index: VectorProductIndex, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """把导出的向量写入索引（同 id 覆盖），返回导入的行数"""
+    imported = 0
+    for ids, vectors in iter_import_file(path, chunk_size):
+        index.add_vectors(ids, vectors)
+        imported += len(ids)
+    return imported
+
+def backfill_hashes(index: VectorProductIndex, upload_folder: str = DEFAULT_UPLOAD_FOLDER,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    为 image_hash 为空的图片计算 dHash。每块与 index_changes 在同一事务中写入，
+    运行中的 Web 进程通过变更同步更新内存中的哈希索引
+    """
+    updated, missing, failed = 0, 0, 0
+    last_id = 0
+    while True:
+        with index.db.connect(statement_timeout_ms=0) as conn:
+            rows = conn.exec_driver_sql(
+                "SELECT id, image_path FROM product_images WHERE image_hash IS NULL AND id > %s ORDER BY id LIMIT %s",
+                (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            values = []
+            for image_id, web_path in rows:
+                # image_path 为 web 路径，如 /uploads/good_images/{商品ID}/{文件名}
+                path = os.path.join(upload_folder, web_path.split('/uploads/', 1)[-1].lstrip('/'))
+                if not os.path.exists(path):
+                    missing += 1
+                    continue
+                try:
+                    values.append((image_hash(path), image_id))
+                except Exception as e:
+                    print(f"计算图片 {image_id} 的感知哈希失败: {e}")
+                    failed += 1
+            if values:
+                conn.exec_driver_sql("UPDATE product_images SET image_hash = %s WHERE id = %s", values)
+                conn.exec_driver_sql("INSERT INTO index_changes (op, image_id) VALUES ('add', %s)",
+                                     [(image_id,) for _, image_id in values])
+                conn.commit()
+                updated += len(values)
+    return {'updated': updated, 'missing_files': missing, 'failed': failed}
+
+def _persist(index: VectorProductIndex, output: Optional[str]) -> Optional[str]:
+    """写回修改：写入方切出快照，否则保存到 output 文件"""
+    if index._wal is not None:
+        return index.snapshot()['file']
+    if output:
+        index.save_index(output)
+        return output
+    print("警告: 索引修改只在内存中，未指定 --output，不会保存")
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='向量索引管理工具')
+    parser.add_argument('--index-file', help='save_index 保存的索引文件')
+    parser.add_argument('--replication-dir', default=INDEX_REPLICATION_DIR, help='WAL 与快照目录')
+    parser.add_argument('--dimension', type=int, default=1024, help='特征向量维度')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='分块大小')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('stats', help='索引类型、规模与内存/磁盘占用')
+    for name, description in (('verify', '按 id 与校验和比对索引和 product_images'),
+                              ('reconcile', '修复索引与 product_images 的差异')):
+        command = commands.add_parser(name, help=description)
+        command.add_argument('--no-checksum', action='store_true', help='只比对 id（有损压缩的索引类型）')
+        command.add_argument('--verbose', action='store_true', help='输出全部差异ID')
+        if name == 'reconcile':
+            command.add_argument('--output', help='修复后的索引文件，默认覆盖 --index-file')
+    command = commands.add_parser('compact', help='重建索引回收空间，并截断 WAL')
+    command.add_argument('--output', help='压缩后的索引文件，默认覆盖 --index-file')
+    command = commands.add_parser('export', help='分块导出向量')
+    command.add_argument('--output', required=True, help='npy 格式为目录，parquet 格式为文件')
+    command.add_argument('--format', choices=['npy', 'parquet'], default='npy')
+    command = commands.add_parser('import', help='分块导入向量到索引')
+    command.add_argument('--input', required=True, help='export 写出的目录（npy）或文件（parquet）')
+    command.add_argument('--output', help='导入后的索引文件，默认覆盖 --index-file')
+    command = commands.add_parser('backfill-hashes', help='为缺少感知哈希的图片计算 dHash')
+    command.add_argument('--upload-folder', default=DEFAULT_UPLOAD_FOLDER, help='上传文件目录')
+    command = commands.add_parser('find-duplicates', help='全库近似重复商品检测，结果写入 duplicate_clusters')
+    command.add_argument('--threshold', type=float, default=DEDUP_THRESHOLD, help='视为重复的最低余弦相似度')
+    command.add_argument('--block-size', type=int, default=DEDUP_BLOCK_SIZE, help='分块矩阵乘积的块大小')
+    command.add_argument('--workdir', help='临时向量文件目录，需要约 图片数 x 维度 x 4 字节的空间')
+    command.add_argument('--dry-run', action='store_true', help='只输出统计，不写表')
+    command = commands.add_parser('build-similar', help='用已存储的向量计算相似商品，写入 product_similarities')
+    command.add_argument('--full', action='store_true', help='为全部商品重新计算，默认只处理有变化的商品')
+    command.add_argument('--top-k', type=int, default=SIMILAR_TOP_K, help='每个商品保存的相似商品数')
+    command.add_argument('--loop', type=float, help='作为后台任务运行，每隔指定秒数增量更新一次')
+    args = parser.parse_args(argv)
+
+    writes = args.command in ('reconcile', 'compact', 'import')
+    if args.command in ('backfill-hashes', 'find-duplicates'):
+        # 只读写数据库，不需要加载索引
+        index = VectorProductIndex(args.dimension, sync_interval=0, batch_max_size=1, replication_dir='', autoload=False)
+    elif args.command in ('export', 'import') and not args.index_file and not args.replication_dir:
+        # 导出不经过 FAISS，直接分块读数据库；导入从空索引开始
+        index = VectorProductIndex(args.dimension, sync_interval=0, batch_max_size=1, replication_dir='', autoload=False)
+    else:
+        index = open_index(args.index_file, args.replication_dir, 'leader' if writes else 'follower', args.dimension)
+    output = getattr(args, 'output', None) or args.index_file
+
+    if args.command == 'stats':
+        result = stats(index, args.index_file)
+    elif args.command in ('verify', 'reconcile'):
+        if args.command == 'verify':
+            result = verify(index, args.chunk_size, not args.no_checksum)
+        else:
+            result = reconcile(index, args.chunk_size, not args.no_checksum)
+            result['saved'] = _persist(index, output) if result['fixed'] else None
+        if not args.verbose:
+            result.pop('drift_ids', None)
+    elif args.command == 'compact':
+        result = compact(index, args.chunk_size)
+        result['saved'] = _persist(index, output)
+    elif args.command == 'export':
+        if args.index_file or args.replication_dir:
+            chunks, total = iter_index_vectors(index, args.chunk_size), int(index.ntotal)
+            result = {'source': 'index', 'rows': export_vectors(chunks, total, index.dimension, args.output, args.format)}
+        else:
+            with index.db.connect(statement_timeout_ms=0) as conn:
+                total = int(conn.exec_driver_sql("SELECT COUNT(*) FROM product_images").scalar())
+                chunks = iter_db_vectors(conn, args.chunk_size)
+                result = {'source': 'product_images', 'rows': export_vectors(chunks, total, index.dimension, args.output, args.format)}
+        result['output'] = args.output
+    elif args.command == 'backfill-hashes':
+        result = backfill_hashes(index, args.upload_folder, args.chunk_size)
+    elif args.command == 'build-similar':
+        result = build_similarities(index, args.full, args.top_k)
+        if args.loop:
+            run_forever(index, args.loop, args.top_k)
+    elif args.command == 'find-duplicates':
+        result = find_duplicates(index.db, args.dimension, args.threshold, args.block_size, args.chunk_size,
+                                 args.workdir, args.dry_run)
+    else:
+        result = {'rows': import_vectors(index, args.input, args.chunk_size), 'ntotal': int(index.ntotal)}
+        result['saved'] = _persist(index, output)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if getattr(index, '_wal', None) is not None:
+        index._wal.close()
+    return result
+
+if __name__ == '__main__':
+    main()
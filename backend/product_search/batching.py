@@ -0,0 +1,117 @@
+"""
+搜索请求的动态微批处理。
+
+多个请求线程各自对单个向量调用 index.search 时，FAISS 无法利用 BLAS 的批量计算，
+而且每次调用都会启动 OpenMP 线程。SearchBatcher 把一个短时间窗口内到达的查询
+合并成一次批量搜索，再把结果分发回各个调用方。
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Tuple
+
+import numpy as np
+
+class _PendingSearch:
+    __slots__ = ('queries', 'k', 'future')
+
+    def __init__(self, queries: np.ndarray, k: int):
+        self.queries = queries
+        self.k = k
+        self.future = Future()
+
+class SearchBatcher:
+    """
+    收集窗口内（window_ms 毫秒或累计 max_batch 条查询，先到为准）的查询，
+    用一个后台线程执行合并后的搜索。
+    """
+
+    def __init__(self, search_fn: Callable[[np.ndarray, int], Tuple[np.ndarray, np.ndarray]],
+                 window_ms: float = 2.0, max_batch: int = 32):
+        """
+        Args:
+            search_fn: 实际执行批量搜索的函数，签名与 faiss.Index.search 一致
+            window_ms: 收到第一条查询后最多等待的时间（毫秒）
+            max_batch: 单次批量搜索的最大查询条数
+        """
+        self.search_fn = search_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._stopped = False
+        # 统计信息
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name='search-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, queries: np.ndarray, k: int) -> Future:
+        """提交查询，返回结果为 (distances, ids) 的 Future"""
+        if self._stopped:
+            raise RuntimeError('SearchBatcher 已停止')
+        pending = _PendingSearch(np.atleast_2d(queries), k)
+        self._queue.put(pending)
+        return pending.future
+
+    def search(self, queries: np.ndarray, k: int, timeout: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        return self.submit(queries, k).result(timeout)
+
+    def stop(self):
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'queries': self.queries,
+            'avg_batch_size': self.queries / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+        }
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            rows = len(first.queries)
+            stop = False
+            deadline = time.monotonic() + self.window
+            while rows < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    # 窗口结束后仍把已在队列中的查询一并带上
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                rows += len(item.queries)
+            self._execute(batch)
+            if stop:
+                return
+
+    def _execute(self, batch):
+        k = max(item.k for item in batch)
+        try:
+            queries = batch[0].queries if len(batch) == 1 else np.vstack([item.queries for item in batch])
+            distances, ids = self.search_fn(queries, k)
+        except Exception as e:
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        self.batches += 1
+        self.queries += len(queries)
+        self.largest_batch = max(self.largest_batch, len(queries))
+        offset = 0
+        for item in batch:
+            n = len(item.queries)
+            item.future.set_result((distances[offset:offset + n, :item.k], ids[offset:offset + n, :item.k]))
+            offset += n
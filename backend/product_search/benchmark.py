@@ -0,0 +1,259 @@
+"""
+向量索引配置基准测试：召回率、延迟、构建耗时与内存。
+
+每种配置都构建一个 VectorProductIndex（与线上相同的封装、锁与墓碑逻辑），
+以平面索引的精确搜索结果为基准计算 recall@k，结果以 JSON 输出便于回归对比。
+
+用法:
+    python -m product_search.benchmark --synthetic 100000
+    python -m product_search.benchmark --input vectors/ --configs Flat "HNSW32" "IVF1024,Flat:nprobe=16"
+    python -m product_search.benchmark --synthetic 10000 --output bench.json
+    python -m product_search.benchmark --input vectors/ --configs Flat HNSW32 --reduce 128 256 --reduce-type pca
+
+--input 为 python -m product_search.admin export 导出的目录（npy）或 Parquet 文件。
+配置写作 <index_factory>[:<搜索参数>]，例如 "IVF4096,Flat:nprobe=32"、"HNSW32:efSearch=128"。
+二值初筛配置（LSHt、ITQ,LSHt）重排时直接从输入向量中读取原始向量。
+NumPy 引擎写作 "NumpyFlat"、"NumpyFlat16:threads=4"，可与 faiss 的 Flat 直接对比。
+--reduce 为每种配置再测试一组降维（PCA/OPQ 前置变换）版本，报告中 reduction 一节给出
+相对原配置的召回损失（recall_loss）与单条/批量查询加速比（speedup）。
+"""
+import argparse
+import json
+import os
+import platform
+import time
+from typing import List, Optional
+
+import faiss
+import numpy as np
+from sqlalchemy import create_engine
+
+from .index import VectorProductIndex, with_reduction, serialize_index
+from .admin import iter_import_file
+
+def default_configs(n: int, dimension: int) -> List[str]:
+    """按数据规模给出默认的一组配置：平面、IVF、HNSW、SQ8、PQ、二值初筛"""
+    nlist = max(16, int(4 * np.sqrt(n)))
+    # 每 16 维一个子空间（1024 维即 PQ64），需能整除维度
+    pq_m = next(m for m in (dimension // 16, dimension // 8, dimension // 4, dimension) if m and dimension % m == 0)
+    return [
+        'Flat',
+        f'IVF{nlist},Flat:nprobe={max(1, nlist // 64)}',
+        f'IVF{nlist},Flat:nprobe={max(1, nlist // 16)}',
+        'HNSW32:efSearch=64',
+        'HNSW32:efSearch=128',
+        'SQ8',
+        f'PQ{pq_m}',
+        'LSHt',
+    ]
+
+def synthetic_vectors(n: int, dimension: int = 1024, clusters: Optional[int] = None, seed: int = 0) -> np.ndarray:
+    """
+    生成带聚类结构的单位向量，近似商品图片 embedding 的分布（同类商品聚在一起）
+    Args:
+        clusters: 聚类数，默认约为 sqrt(n)
+    """
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(1, int(np.sqrt(n)))
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = np.empty((n, dimension), dtype=np.float32)
+    chunk = 100000
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        assignment = rng.integers(0, clusters, size)
+        vectors[start:start + size] = centers[assignment] + 0.5 * rng.standard_normal((size, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def load_vectors(path: str):
+    """读取 admin export 导出的向量"""
+    ids, vectors = [], []
+    for chunk_ids, chunk_vectors in iter_import_file(path):
+        ids.append(chunk_ids)
+        vectors.append(chunk_vectors)
+    return np.concatenate(ids), np.vstack(vectors)
+
+def make_queries(vectors: np.ndarray, num_queries: int, seed: int = 1) -> np.ndarray:
+    """从数据集中抽样并加噪声得到查询（真实查询是同款商品的另一张图片，不会与库中向量完全相同）"""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), num_queries, replace=len(vectors) < num_queries)].copy()
+    queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+def _rss_bytes() -> int:
+    """当前进程的常驻内存（Linux 读取 /proc，其他平台退化为峰值 RSS）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == 'Darwin' else peak * 1024
+
+def _percentiles(samples: List[float]) -> dict:
+    samples_ms = np.array(samples) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(samples_ms, 50)), 4),
+        'p99_ms': round(float(np.percentile(samples_ms, 99)), 4),
+        'mean_ms': round(float(samples_ms.mean()), 4),
+    }
+
+def recall_at_k(result_ids: np.ndarray, truth_ids: np.ndarray, k: int) -> float:
+    hits = sum(len(np.intersect1d(result[:k], truth[:k])) for result, truth in zip(result_ids, truth_ids))
+    return hits / (len(truth_ids) * k)
+
+def _array_source(ids: np.ndarray, vectors: np.ndarray):
+    """二值初筛索引重排用的向量来源：直接从测试数据中按ID查找，代替 product_images"""
+    order = np.argsort(ids)
+    sorted_ids = ids[order]
+
+    def source(wanted: np.ndarray):
+        pos = np.minimum(np.searchsorted(sorted_ids, wanted), len(sorted_ids) - 1)
+        found = sorted_ids[pos] == wanted
+        return wanted[found], vectors[order[pos[found]]]
+    return source
+
+def run_config(config: str, ids: np.ndarray, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray,
+               k: int = 10, batch_size: int = 32, engine=None) -> dict:
+    """
+    构建并测量一种配置
+    Args:
+        config: <index_factory>[:<搜索参数>]
+        truth: 精确搜索得到的前 k 个ID
+    """
+    factory, _, search_params = config.partition(':')
+    rss_before = _rss_bytes()
+    index = VectorProductIndex(vectors.shape[1], sync_interval=0, batch_max_size=1, replication_dir='',
+                               engine=engine, autoload=False, index_factory=factory, search_params=search_params,
+                               vector_source=_array_source(ids, vectors))
+    start = time.perf_counter()
+    index.build(ids, vectors)
+    build_seconds = time.perf_counter() - start
+    rss_after = _rss_bytes()
+
+    # 单条查询：模拟逐个请求
+    single = []
+    result_ids = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, found = index.search_vectors(query.reshape(1, -1), k)
+        single.append(time.perf_counter() - start)
+        result_ids[i] = found[0]
+
+    # 批量查询：模拟批处理合并后的调用
+    batched = []
+    for start_row in range(0, len(queries), batch_size):
+        batch = queries[start_row:start_row + batch_size]
+        start = time.perf_counter()
+        index.search_vectors(batch, k)
+        batched.append(time.perf_counter() - start)
+
+    with index._lock:
+        index_bytes = int(serialize_index(index.index).size)
+    return {
+        'config': config,
+        'index_factory': factory,
+        'search_params': search_params,
+        'ntotal': int(index.ntotal),
+        f'recall@{k}': round(recall_at_k(result_ids, truth, k), 4),
+        'build_seconds': round(build_seconds, 3),
+        'index_bytes': index_bytes,
+        'rss_delta_bytes': rss_after - rss_before,
+        'single': {**_percentiles(single), 'qps': round(len(single) / sum(single), 1)},
+        'batched': {**_percentiles(batched), 'batch_size': batch_size,
+                    'qps': round(len(queries) / sum(batched), 1)},
+    }
+
+def reduction_configs(config: str, reduce_dims: List[int], reduce_type: str = 'pca') -> List[str]:
+    """配置的降维版本，保留搜索参数"""
+    factory, sep, search_params = config.partition(':')
+    return [with_reduction(factory, dim, reduce_type) + sep + search_params for dim in reduce_dims]
+
+def compare_reduction(base: dict, reduced: dict, k: int) -> dict:
+    """降维配置相对原配置的召回损失与加速比"""
+    return {
+        'config': base['config'],
+        'reduced_config': reduced['config'],
+        'recall_loss': round(base[f'recall@{k}'] - reduced[f'recall@{k}'], 4),
+        'speedup': {
+            'single_p50': round(base['single']['p50_ms'] / max(reduced['single']['p50_ms'], 1e-6), 2),
+            'batched_qps': round(reduced['batched']['qps'] / max(base['batched']['qps'], 1e-6), 2),
+        },
+        'index_bytes_ratio': round(reduced['index_bytes'] / max(base['index_bytes'], 1), 3),
+    }
+
+def run(ids: np.ndarray, vectors: np.ndarray, configs: List[str], num_queries: int = 1000,
+        k: int = 10, batch_size: int = 32, reduce_dims: Optional[List[int]] = None,
+        reduce_type: str = 'pca') -> dict:
+    """对每种配置运行基准测试，返回可直接序列化为 JSON 的报告"""
+    queries = make_queries(vectors, num_queries)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth_rows = exact.search(queries, k)
+    truth = ids[truth_rows]
+    del exact
+
+    # 基准测试不访问数据库，引擎只用于满足 VectorProductIndex 的构造参数
+    engine = create_engine('sqlite://')
+    results = []
+    reduction = []
+    for config in configs:
+        print(f"运行配置 {config} ...")
+        base = run_config(config, ids, vectors, queries, truth, k, batch_size, engine)
+        results.append(base)
+        for reduced_config in reduction_configs(config, reduce_dims or [], reduce_type):
+            print(f"运行配置 {reduced_config} ...")
+            reduced = run_config(reduced_config, ids, vectors, queries, truth, k, batch_size, engine)
+            results.append(reduced)
+            reduction.append(compare_reduction(base, reduced, k))
+    report = {
+        'dataset': {'ntotal': int(len(ids)), 'dimension': int(vectors.shape[1]), 'queries': num_queries, 'k': k},
+        'environment': {
+            'faiss': faiss.__version__,
+            'omp_threads': faiss.omp_get_max_threads(),
+            'cpu_count': os.cpu_count(),
+            'platform': platform.platform(),
+        },
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if reduction:
+        report['reduction'] = reduction
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='向量索引配置基准测试')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='admin export 导出的向量（npy 目录或 Parquet 文件）')
+    source.add_argument('--synthetic', type=int, help='生成指定数量的合成向量，如 10000、100000、1000000')
+    parser.add_argument('--dimension', type=int, default=1024, help='合成向量维度')
+    parser.add_argument('--configs', nargs='+', help='要测试的配置，默认按规模选择 Flat/IVF/HNSW/SQ8/PQ')
+    parser.add_argument('--queries', type=int, default=1000, help='查询数')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32, help='批量查询的批大小')
+    parser.add_argument('--reduce', type=int, nargs='+', help='同时测试降维到这些维度的版本，如 128 256')
+    parser.add_argument('--reduce-type', choices=['pca', 'opq'], default='pca', help='降维变换类型')
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    args = parser.parse_args(argv)
+
+    if args.input:
+        ids, vectors = load_vectors(args.input)
+    else:
+        vectors = synthetic_vectors(args.synthetic, args.dimension)
+        ids = np.arange(1, len(vectors) + 1, dtype=np.int64)
+    report = run(ids, vectors, args.configs or default_configs(len(ids), vectors.shape[1]),
+                 args.queries, args.k, args.batch_size, args.reduce, args.reduce_type)
+    report['dataset']['source'] = args.input or 'synthetic'
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"结果已写入 {args.output}")
+    else:
+        print(output)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+图片搜索结果缓存。
+
+同一张供应商图片会被反复搜索。缓存位于特征提取之后、FAISS 搜索与结果补全之前，
+键为 (查询向量哈希, k, 过滤条件)，每条结果记录写入时的索引 generation：
+索引有任何增删改（generation 变化）后旧结果自动失效。命中时再用一次按主键的查询
+核对结果中商品的 updated_at，商品被修改或删除时同样视为未命中。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .metrics import CACHE_REQUESTS
+
+def query_key(query_vector: np.ndarray, top_k: int, filters: Optional[dict] = None) -> Tuple:
+    """缓存键: 查询向量（float32 字节）的哈希、k 和规范化后的过滤条件"""
+    digest = hashlib.sha1(np.ascontiguousarray(query_vector, dtype=np.float32).tobytes()).hexdigest()
+    normalized = tuple(sorted((key, tuple(value) if isinstance(value, (list, set, tuple)) else value)
+                              for key, value in (filters or {}).items()))
+    return digest, int(top_k), normalized
+
+class _Entry:
+    __slots__ = ('generation', 'results', 'versions', 'expires_at')
+
+    def __init__(self, generation: int, results: list, versions: Dict[int, object], expires_at: float):
+        self.generation = generation
+        self.results = results
+        self.versions = versions
+        self.expires_at = expires_at
+
+class SearchResultCache:
+    """有界的 LRU 缓存，线程安全"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300, name: str = 'search_results'):
+        """
+        Args:
+            max_entries: 最多缓存的查询数，超出时淘汰最久未使用的
+            ttl: 条目的最长存活时间（秒），兜底处理没有经过 generation 和 updated_at 反映的变化
+            name: 指标中的缓存名称
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, key: Hashable, generation: int,
+            load_versions: Callable[[List[int]], Dict[int, object]]) -> Optional[list]:
+        """
+        查找缓存的结果
+        Args:
+            generation: 当前索引 generation，与写入时不同则失效
+            load_versions: 按商品ID查询 {商品ID: updated_at}，用于核对商品是否被修改
+        Returns:
+            list: 缓存的结果；未命中或已失效时返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            result = None
+            if entry is None:
+                self.misses += 1
+                result = 'miss'
+            elif entry.generation != generation or entry.expires_at < now:
+                # 因 generation 变化或过期而失效的条目单独计为 stale，便于区分失效与从未缓存
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                result = 'stale'
+            else:
+                self._entries.move_to_end(key)
+        if result is not None:
+            CACHE_REQUESTS.inc(cache=self.name, result=result)
+            return None
+
+        # 核对商品版本在锁外进行，避免数据库查询阻塞其他请求的缓存访问
+        if entry.versions and load_versions(list(entry.versions)) != entry.versions:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+            CACHE_REQUESTS.inc(cache=self.name, result='stale')
+            return None
+        with self._lock:
+            self.hits += 1
+        CACHE_REQUESTS.inc(cache=self.name, result='hit')
+        return entry.results
+
+    def put(self, key: Hashable, generation: int, results: list, versions: Dict[int, object]):
+        """
+        写入结果
+        Args:
+            generation: 执行搜索前读取的索引 generation
+            versions: 结果中商品的 {商品ID: updated_at}
+        """
+        with self._lock:
+            self._entries[key] = _Entry(generation, results, versions, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
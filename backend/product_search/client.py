@@ -0,0 +1,251 @@
+"""
+向量索引服务的客户端，以及供 Flask 应用使用的 RemoteProductIndex。
+"""
+import json
+import os
+import queue
+import socket
+import threading
+from contextlib import contextmanager
+from typing import List, Tuple
+
+import numpy as np
+from sqlalchemy.engine import Engine
+
+from .index import VectorProductIndex, DB_CONFIG, INDEX_COALESCE_TIMEOUT
+from .db import IndexDatabase, create_index_engine
+from .embedding import create_embedder
+from .singleflight import SingleFlight
+from .server import (
+    FRAME_HEADER, COUNT, STATUS_OK,
+    OP_PING, OP_SEARCH, OP_ADD, OP_REMOVE, OP_STATS, OP_SYNC,
+    parse_address, encode_search_request, decode_search_response, decode_search_stats, encode_ids,
+)
+
+INDEX_REMOTE_SEARCH_CHUNK = int(os.getenv('INDEX_REMOTE_SEARCH_CHUNK', 64))  # 多条查询按此行数拆成多个请求流水线发送
+
+class IndexServerError(Exception):
+    """索引服务返回的错误"""
+
+class _Connection:
+    def __init__(self, family, addr, timeout: float):
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(addr)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile('rb')
+        self.next_request_id = 0
+
+    def send(self, opcode: int, body: bytes = b'') -> int:
+        self.next_request_id = (self.next_request_id + 1) & 0xFFFFFFFF
+        self.sock.sendall(FRAME_HEADER.pack(len(body), self.next_request_id, opcode) + body)
+        return self.next_request_id
+
+    def receive(self, request_id: int) -> bytes:
+        header = self.rfile.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            raise ConnectionError('索引服务连接已关闭')
+        body_len, response_id, status = FRAME_HEADER.unpack(header)
+        body = self.rfile.read(body_len) if body_len else b''
+        if len(body) < body_len:
+            raise ConnectionError('索引服务连接已关闭')
+        if response_id != request_id:
+            raise ConnectionError(f"响应顺序错乱: 期望 {request_id}，收到 {response_id}")
+        if status != STATUS_OK:
+            raise IndexServerError(body.decode('utf-8', errors='replace'))
+        return body
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+class IndexClient:
+    """
+    索引服务客户端，线程安全。
+    维护一个有上限的连接池；批量接口在同一连接上流水线发送请求后再依次读取响应。
+    """
+
+    def __init__(self, address: str, pool_size: int = 8, timeout: float = 5.0):
+        self.address = address
+        self.family, self.addr = parse_address(address)
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self.last_stats = None  # 最近一次搜索响应附带的 (ntotal, generation)
+
+    @contextmanager
+    def _connection(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError('等待索引服务连接超时')
+        try:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = _Connection(self.family, self.addr, self.timeout)
+            try:
+                yield conn
+            except IndexServerError:
+                # 服务端正常返回了错误，连接仍然可用
+                self._pool.put(conn)
+                raise
+            except Exception:
+                conn.close()
+                raise
+            else:
+                self._pool.put(conn)
+        finally:
+            self._slots.release()
+
+    def _call(self, opcode: int, body: bytes = b'') -> bytes:
+        with self._connection() as conn:
+            return conn.receive(conn.send(opcode, body))
+
+    def _pipeline(self, requests: List[Tuple[int, bytes]]) -> List[bytes]:
+        """在同一连接上先发送全部请求，再按顺序读取响应"""
+        with self._connection() as conn:
+            request_ids = [conn.send(opcode, body) for opcode, body in requests]
+            responses, error = [], None
+            for request_id in request_ids:
+                # 某个请求出错后仍要读完其余响应，否则归还连接池后下一个调用方会读到旧响应
+                try:
+                    responses.append(conn.receive(request_id))
+                except IndexServerError as e:
+                    error = error or e
+            if error is not None:
+                raise error
+            return responses
+
+    def ping(self) -> bool:
+        self._call(OP_PING)
+        return True
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (distances, ids)，与 faiss.Index.search 一致"""
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        return self._decode_search(self._call(OP_SEARCH, encode_search_request(queries, k)))
+
+    def search_many(self, query_batches: List[np.ndarray], k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """流水线发送多个搜索请求"""
+        bodies = self._pipeline([(OP_SEARCH, encode_search_request(np.atleast_2d(q), k)) for q in query_batches])
+        return [self._decode_search(body) for body in bodies]
+
+    def _decode_search(self, body: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        stats = decode_search_stats(body)
+        if stats is not None:
+            self.last_stats = stats
+        return decode_search_response(body)
+
+    def add(self, ids, vectors) -> int:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        return COUNT.unpack(self._call(OP_ADD, encode_ids(ids) + vectors.tobytes()))[0]
+
+    def remove(self, ids) -> int:
+        return COUNT.unpack(self._call(OP_REMOVE, encode_ids(ids)))[0]
+
+    def sync(self) -> int:
+        return COUNT.unpack(self._call(OP_SYNC))[0]
+
+    def stats(self) -> dict:
+        return json.loads(self._call(OP_STATS).decode('utf-8'))
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+class RemoteProductIndex(VectorProductIndex):
+    """
+    与 VectorProductIndex 接口一致，但向量检索委托给独立的索引服务；
+    特征提取与结果补全仍在当前进程完成，本进程不加载任何向量。
+    """
+
+    def __init__(self, address: str = None, dimension: int = 1024, pool_size: int = 8, engine: Engine = None):
+        """
+        Args:
+            address: 索引服务地址，默认取 INDEX_SERVER_ADDRESS
+            dimension: 特征向量维度
+            pool_size: 到索引服务的最大连接数
+            engine: 补全搜索结果使用的数据库连接池，为空时按 DB_CONFIG 自建
+        """
+        self.dimension = dimension
+        self.embedder = create_embedder(dimension)
+        self.result_cache = None  # generation 取自上次搜索响应，可能滞后于索引服务，结果缓存由调用方按需开启
+        self.hash_index = None  # 本进程不加载 product_images
+        self.partition_column = None
+        self.partitions = None
+        self.list_cache = None  # 磁盘倒排表在索引服务进程中
+        # 代表图片由索引服务选出，本进程不维护商品与代表图片的对应关系
+        self.representatives = None
+        self.representative_threshold = None
+        self.expand_representatives = False
+        self._product_representatives = {}
+        self._representative_product = {}
+        self._single_flight = SingleFlight(INDEX_COALESCE_TIMEOUT) if INDEX_COALESCE_TIMEOUT > 0 else None
+        self.client = IndexClient(address or os.environ['INDEX_SERVER_ADDRESS'], pool_size=pool_size)
+        self._owns_engine = engine is None
+        self.db = IndexDatabase(engine if engine is not None else create_index_engine(DB_CONFIG))
+
+    def _remote_stats(self) -> Tuple[int, int]:
+        """
+        索引服务的 (ntotal, generation)。优先使用最近一次搜索响应附带的值，避免每次搜索多一次往返；
+        尚未搜索过或上次为空索引时才发送 OP_STATS（空索引不会触发搜索，缓存的 0 无法自行更新）
+        """
+        stats = self.client.last_stats
+        if stats is None or stats[0] == 0:
+            remote = self.client.stats()
+            stats = self.client.last_stats = (int(remote['ntotal']), int(remote['generation']))
+        return stats
+
+    @property
+    def ntotal(self) -> int:
+        return self._remote_stats()[0]
+
+    @property
+    def generation(self) -> int:
+        return self._remote_stats()[1]
+
+    def _ensure_fresh(self):
+        pass  # 由索引服务负责追踪变更
+
+    def _touch_pages(self) -> int:
+        return 0  # 向量数据在索引服务进程中，由服务启动时预热
+
+    def _warmup_queries(self, num_queries: int) -> np.ndarray:
+        # 本进程没有向量，用随机单位向量预热连接池和索引服务
+        queries = np.random.default_rng().standard_normal((max(num_queries, 0), self.dimension)).astype(np.float32)
+        return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    def sync_changes(self) -> int:
+        return self.client.sync()
+
+    def _notify_change(self):
+        # 本进程没有同步线程，写入变更后让索引服务立即同步
+        self.client.sync()
+
+    def search_vectors(self, query_vectors: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(-1, self.dimension)
+        if len(queries) <= INDEX_REMOTE_SEARCH_CHUNK:
+            return self.client.search(queries, top_k)
+        # 大批量查询拆成多个请求在同一连接上流水线发送，索引服务逐个处理时客户端可以继续发送
+        chunks = [queries[i:i + INDEX_REMOTE_SEARCH_CHUNK] for i in range(0, len(queries), INDEX_REMOTE_SEARCH_CHUNK)]
+        results = self.client.search_many(chunks, top_k)
+        return np.vstack([d for d, _ in results]), np.vstack([i for _, i in results])
+
+    def add_vectors(self, ids, vectors):
+        self.client.add(ids, vectors)
+
+    def remove_vectors(self, ids) -> int:
+        return self.client.remove(ids)
+
+    def __del__(self):
+        if hasattr(self, 'client'):
+            self.client.close()
+        super().__del__()
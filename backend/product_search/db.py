@@ -0,0 +1,133 @@
+"""
+向量索引使用的数据库连接池。
+
+VectorProductIndex 的搜索、同步线程和 add_product 会被多个请求线程同时调用，
+共享单个 pymysql 连接既不安全，也会在 MySQL 空闲超时后失效。
+这里统一从 SQLAlchemy 连接池按次借出连接：借出前做存活检查（pool_pre_ping），
+按调用给 SELECT 加上执行时间提示，并统计等待连接的耗时。
+"""
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# 连接池配置
+INDEX_DB_POOL_SIZE = int(os.getenv('INDEX_DB_POOL_SIZE', 5))
+INDEX_DB_MAX_OVERFLOW = int(os.getenv('INDEX_DB_MAX_OVERFLOW', 5))
+INDEX_DB_POOL_TIMEOUT = float(os.getenv('INDEX_DB_POOL_TIMEOUT', 5))  # 等待空闲连接的最长时间（秒）
+INDEX_DB_POOL_RECYCLE = int(os.getenv('INDEX_DB_POOL_RECYCLE', 1800))  # 早于 MySQL wait_timeout 回收连接（秒）
+INDEX_DB_STATEMENT_TIMEOUT_MS = int(os.getenv('INDEX_DB_STATEMENT_TIMEOUT_MS', 3000))  # 默认 SELECT 超时（毫秒），0 表示不限制
+
+# 连接池参数，Flask 应用通过 SQLALCHEMY_ENGINE_OPTIONS 让 ORM 与索引共用同样的设置
+ENGINE_OPTIONS = {
+    'pool_size': INDEX_DB_POOL_SIZE,
+    'max_overflow': INDEX_DB_MAX_OVERFLOW,
+    'pool_timeout': INDEX_DB_POOL_TIMEOUT,
+    'pool_recycle': INDEX_DB_POOL_RECYCLE,
+    'pool_pre_ping': True,
+}
+
+STATEMENT_TIMEOUT_OPTION = 'index_statement_timeout_ms'  # 连接的 execution_options 中记录本次借出的语句超时
+_SELECT_PREFIX = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+
+def with_execution_time_hint(statement: str, timeout_ms: int) -> str:
+    """给 SELECT 语句加上 MySQL 的 MAX_EXECUTION_TIME 优化器提示，其他语句和 timeout_ms<=0 时原样返回"""
+    if timeout_ms <= 0 or not _SELECT_PREFIX.match(statement):
+        return statement
+    return _SELECT_PREFIX.sub(f"SELECT /*+ MAX_EXECUTION_TIME({int(timeout_ms)}) */", statement, count=1)
+
+def _add_execution_time_hint(conn, cursor, statement, parameters, context, executemany):
+    # 超时只对当前语句生效，不修改会话变量，连接归还后 ORM 的查询不受影响
+    timeout_ms = conn.get_execution_options().get(STATEMENT_TIMEOUT_OPTION)
+    if timeout_ms:
+        statement = with_execution_time_hint(statement, timeout_ms)
+    return statement, parameters
+
+def create_index_engine(db_config: dict) -> Engine:
+    """
+    没有 Flask 应用时（例如独立的索引服务进程）按 DB_CONFIG 创建连接池
+    Args:
+        db_config: pymysql 风格的连接参数
+    """
+    url = URL.create(
+        'mysql+pymysql',
+        username=db_config['user'],
+        password=db_config['password'],
+        host=db_config['host'],
+        port=db_config['port'],
+        database=db_config['database'],
+        query={'charset': db_config.get('charset', 'utf8mb4')},
+    )
+    return create_engine(url, **ENGINE_OPTIONS)
+
+class IndexDatabase:
+    """
+    按次借出连接的数据库访问入口，线程安全。
+    SQL 通过 conn.exec_driver_sql 执行，沿用 %s 占位符。
+    """
+
+    def __init__(self, engine: Engine, statement_timeout_ms: Optional[int] = None):
+        """
+        Args:
+            engine: SQLAlchemy Engine，Flask 应用中传入 db.engine
+            statement_timeout_ms: 默认语句超时（毫秒），默认取 INDEX_DB_STATEMENT_TIMEOUT_MS
+        """
+        self.engine = engine
+        if engine.dialect.name == 'mysql' and not event.contains(engine, 'before_cursor_execute', _add_execution_time_hint):
+            event.listen(engine, 'before_cursor_execute', _add_execution_time_hint, retval=True)
+        self.statement_timeout_ms = INDEX_DB_STATEMENT_TIMEOUT_MS if statement_timeout_ms is None else statement_timeout_ms
+        self._stats_lock = threading.Lock()
+        # 连接池等待统计
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @contextmanager
+    def connect(self, statement_timeout_ms: Optional[int] = None):
+        """
+        借出一个连接，退出时归还连接池（未提交的事务会被回滚）
+        Args:
+            statement_timeout_ms: 本次调用中 SELECT 的超时（毫秒），0 表示不限制，默认取 statement_timeout_ms
+        """
+        start = time.perf_counter()
+        try:
+            conn = self.engine.connect()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.checkout_timeouts += 1
+            raise
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        try:
+            # execution_options 属于这次借出的 Connection 对象，不会随底层连接留在连接池中
+            conn.execution_options(**{STATEMENT_TIMEOUT_OPTION: self.statement_timeout_ms if statement_timeout_ms is None
+                                      else statement_timeout_ms})
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        pool = self.engine.pool
+        with self._stats_lock:
+            stats = {
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.checkout_timeouts,
+                'wait_avg_ms': self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+                'wait_max_ms': self.wait_max * 1000,
+            }
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            # QueuePool 上是方法；SingletonThreadPool 等的 size 是整数属性，只统计可调用的
+            value = getattr(pool, name, None)
+            if callable(value):
+                stats[f'pool_{name}'] = value()
+        return stats
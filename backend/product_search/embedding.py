@@ -0,0 +1,220 @@
+"""
+图片特征提取后端。
+
+VectorProductIndex.extract_feature 委托给 embedder 对象，embedder 只需实现
+embed_image(image_path) -> 归一化的 float32 向量。默认使用 DashScope 多模态 embedding；
+INDEX_EMBEDDER=fake 时使用 FakeEmbedder，按图片内容生成确定的向量并模拟接口延迟，
+用于导入与建索引的基准测试和本地开发，不调用外部 API。
+"""
+import base64
+import hashlib
+import io
+import os
+import random
+import threading
+import time
+from http import HTTPStatus
+
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image
+
+from .metrics import DASHSCOPE_ERRORS, EMBEDDING_REQUESTS, EMBEDDING_STAGE_SECONDS
+from .tracing import span
+load_dotenv()
+
+INDEX_EMBEDDER = os.getenv('INDEX_EMBEDDER', 'dashscope')  # dashscope 或 fake
+FAKE_EMBEDDING_LATENCY_MS = float(os.getenv('FAKE_EMBEDDING_LATENCY_MS', 200))  # 模拟的单次调用延迟（毫秒）
+FAKE_EMBEDDING_JITTER_MS = float(os.getenv('FAKE_EMBEDDING_JITTER_MS', 50))  # 延迟的随机波动（毫秒）
+
+def _get_dashscope():
+    """首次提取特征时才导入 dashscope 并设置 API 密钥，只做检索的进程不需要密钥"""
+    import dashscope
+    if not dashscope.api_key:
+        dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+        if not dashscope.api_key:
+            raise ValueError("请设置DASHSCOPE_API_KEY环境变量")
+    return dashscope
+
+def image_to_base64(image_path: str) -> str:
+    """将图片转换为base64格式"""
+    # 读取图片并转换为jpg格式（如果不是jpg）
+    image = Image.open(image_path)
+    if image.format != 'JPEG':
+        image = image.convert('RGB')
+        img_byte_arr = io.BytesIO()
+        image.save(img_byte_arr, format='JPEG')
+        img_byte_arr = img_byte_arr.getvalue()
+    else:
+        with open(image_path, "rb") as image_file:
+            img_byte_arr = image_file.read()
+
+    base64_image = base64.b64encode(img_byte_arr).decode('utf-8')
+    return f"data:image/jpeg;base64,{base64_image}"
+
+class Embedder:
+    """特征提取后端的公共部分：记录调用次数和耗时"""
+    backend = ''
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def embed_image(self, image_path: str) -> np.ndarray:
+        start = time.perf_counter()
+        try:
+            with span('embedding', backend=self.backend):
+                feature = self._embed_image(image_path)
+            EMBEDDING_REQUESTS.inc(backend=self.backend, status='ok')
+            return feature
+        except Exception:
+            EMBEDDING_REQUESTS.inc(backend=self.backend, status='error')
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._stats_lock:
+                self.calls += 1
+                self.seconds += time.perf_counter() - start
+
+    def _embed_image(self, image_path: str) -> np.ndarray:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'backend': type(self).__name__,
+                'calls': self.calls,
+                'errors': self.errors,
+                'avg_ms': self.seconds / self.calls * 1000 if self.calls else 0.0,
+            }
+
+class DashScopeEmbedder(Embedder):
+    """调用 DashScope multimodal-embedding-v1 提取图片特征"""
+    backend = 'dashscope'
+
+    def __init__(self, dimension: int = 1024, max_retries: int = 3, retry_delay: float = 5):
+        """
+        Args:
+            max_retries: 速率限制时的最大尝试次数
+            retry_delay: 初始重试延迟（秒），之后指数退避
+        """
+        super().__init__(dimension)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def _embed_image(self, image_path: str) -> np.ndarray:
+        """使用DashScope API提取图片特征向量"""
+        dashscope = _get_dashscope()
+
+        # 添加延迟以避免触发API速率限制
+        # 使用随机延迟，在1-3秒之间，避免固定间隔可能导致的问题
+        delay = 0.1 + random.random() * 0.5
+        print(f"API调用前等待 {delay:.2f} 秒以避免速率限制...")
+        with EMBEDDING_STAGE_SECONDS.time(backend=self.backend, stage='rate_limit_wait'), span('dashscope.rate_limit_wait'):
+            time.sleep(delay)
+
+        # 将图片转换为base64格式
+        print(f"正在处理图片: {image_path}")
+        with EMBEDDING_STAGE_SECONDS.time(backend=self.backend, stage='preprocess'), span('image.preprocess'):
+            image_data = image_to_base64(image_path)
+
+        # 调用DashScope API
+        inputs = [{'image': image_data}]
+        print("正在调用DashScope API...")
+
+        # 添加重试机制
+        max_retries = self.max_retries
+        retry_delay = self.retry_delay
+
+        for retry in range(max_retries):
+            try:
+                with EMBEDDING_STAGE_SECONDS.time(backend=self.backend, stage='api_call'), \
+                        span('dashscope.embedding', attempt=retry + 1):
+                    resp = dashscope.MultiModalEmbedding.call(
+                        model="multimodal-embedding-v1",
+                        input=inputs
+                    )
+
+                if resp.status_code != HTTPStatus.OK:
+                    if "rate limit exceeded" in resp.message.lower():
+                        DASHSCOPE_ERRORS.inc(reason='rate_limit')
+                        if retry < max_retries - 1:  # 如果不是最后一次重试
+                            print(f"API速率限制错误，等待 {retry_delay} 秒后重试 ({retry+1}/{max_retries})...")
+                            with EMBEDDING_STAGE_SECONDS.time(backend=self.backend, stage='rate_limit_wait'), \
+                                    span('dashscope.rate_limit_wait'):
+                                time.sleep(retry_delay)
+                            retry_delay *= 2  # 指数退避策略
+                            continue
+                    else:
+                        DASHSCOPE_ERRORS.inc(reason=f'http_{resp.status_code}')
+                    raise Exception(f"API调用失败: {resp.message}")
+
+                # 获取特征向量
+                print("API调用成功，正在处理返回结果...")
+                feature = np.array(resp.output['embeddings'][0]['embedding'], dtype=np.float32)
+
+                # 归一化特征向量
+                norm = np.linalg.norm(feature)
+                print(f"原始向量范数: {norm}")
+                feature = feature / norm
+                print(f"归一化后范数: {np.linalg.norm(feature)}")
+                return feature
+
+            except Exception as e:
+                if "API调用失败" not in str(e):
+                    # 网络错误等异常，接口返回的错误已在上面计数
+                    DASHSCOPE_ERRORS.inc(reason='rate_limit' if "rate limit exceeded" in str(e).lower() else 'exception')
+                if retry < max_retries - 1 and "rate limit exceeded" in str(e).lower():
+                    print(f"API速率限制错误，等待 {retry_delay} 秒后重试 ({retry+1}/{max_retries})...")
+                    with EMBEDDING_STAGE_SECONDS.time(backend=self.backend, stage='rate_limit_wait'), \
+                            span('dashscope.rate_limit_wait'):
+                        time.sleep(retry_delay)
+                    retry_delay *= 2  # 指数退避策略
+                else:
+                    raise  # 如果是其他错误或已达到最大重试次数，则抛出异常
+
+class FakeEmbedder(Embedder):
+    """
+    不调用外部 API 的特征提取：按图片文件内容的哈希生成确定的单位向量，
+    同一张图片总是得到同一个向量；每次调用按配置的延迟 sleep，模拟接口耗时。
+    """
+    backend = 'fake'
+
+    def __init__(self, dimension: int = 1024, latency_ms: float = None, jitter_ms: float = None):
+        """
+        Args:
+            latency_ms: 模拟的单次调用延迟（毫秒），默认取 FAKE_EMBEDDING_LATENCY_MS
+            jitter_ms: 延迟的随机波动（毫秒），默认取 FAKE_EMBEDDING_JITTER_MS
+        """
+        super().__init__(dimension)
+        self.latency_ms = FAKE_EMBEDDING_LATENCY_MS if latency_ms is None else latency_ms
+        self.jitter_ms = FAKE_EMBEDDING_JITTER_MS if jitter_ms is None else jitter_ms
+
+    def _embed_image(self, image_path: str) -> np.ndarray:
+        with EMBEDDING_STAGE_SECONDS.time(backend=self.backend, stage='preprocess'), span('image.preprocess'):
+            with open(image_path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).digest()
+        delay_ms = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        with EMBEDDING_STAGE_SECONDS.time(backend=self.backend, stage='api_call'):
+            if delay_ms > 0:
+                time.sleep(delay_ms / 1000.0)
+        rng = np.random.default_rng(int.from_bytes(digest[:8], 'little'))
+        feature = rng.standard_normal(self.dimension).astype(np.float32)
+        return feature / np.linalg.norm(feature)
+
+def create_embedder(dimension: int = 1024, backend: str = None) -> Embedder:
+    """
+    按配置创建特征提取后端
+    Args:
+        backend: 'dashscope' 或 'fake'，默认取 INDEX_EMBEDDER
+    """
+    backend = (backend or INDEX_EMBEDDER).lower()
+    if backend == 'dashscope':
+        return DashScopeEmbedder(dimension)
+    if backend == 'fake':
+        return FakeEmbedder(dimension)
+    raise ValueError(f"未知的特征提取后端: {backend}")
@@ -0,0 +1,1489 @@
+import hashlib
+import itertools
+import numpy as np
+import json
+from typing import List, Dict, Any, Callable, Optional, Tuple
+import os
+from dotenv import load_dotenv
+import time
+import threading
+from pathlib import Path
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from models import ProductImage,Product,db
+from models.index_change import register_commit_listener, INDEX_PARTITION_COLUMN
+from .replication import IndexWAL, WALReader, WALTruncatedError, WALLockedError, SnapshotStore, OP_UPSERT, OP_REMOVE
+from .batching import SearchBatcher
+from .cache import SearchResultCache, query_key
+from .singleflight import SingleFlight
+from .phash import HashIndex, image_hash, HASH_BITS
+from .partitions import PartitionSet
+from .numpy_index import NumpyIndex, NUMPY_FACTORIES
+from .representatives import select_representatives
+from .ondisk import ListCache, attach_ondisk_lists, ondisk_lists, remove_stale_files
+from .db import IndexDatabase, create_index_engine
+from .embedding import Embedder, create_embedder
+from .metrics import SEARCH_STAGE_SECONDS, CACHE_REQUESTS
+from .tracing import span
+from .types import ProductInfo
+
+try:
+    import faiss
+except ImportError:  # 没有可用的 faiss 安装包时改用 NumpyIndex
+    faiss = None
+load_dotenv()
+
+# 数据库配置
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', 3306)),
+    'user': os.getenv('DB_USER', 'root'),
+    'password': os.getenv('DB_PASSWORD', 'zhang7481592630'),
+    'database': os.getenv('DB_NAME', 'product_crm'),
+    'charset': 'utf8mb4'
+}
+
+# 索引变更同步配置
+INDEX_SYNC_INTERVAL = float(os.getenv('INDEX_SYNC_INTERVAL', 2))  # 后台追踪 index_changes 的间隔（秒），<=0 表示不启动后台线程
+INDEX_MAX_STALENESS = float(os.getenv('INDEX_MAX_STALENESS', 5))  # 搜索前允许的最大陈旧时间（秒），超过则先同步
+INDEX_SYNC_BATCH_SIZE = 1000  # 每次从变更日志读取的最大条数
+INDEX_CHANGE_GAP_TIMEOUT = 60  # seq 空洞（未提交或已回滚的事务）的最长等待时间（秒）
+INDEX_MAX_PENDING_GAPS = 10000
+
+# 索引复制配置（WAL + 快照），未设置目录时不启用
+INDEX_REPLICATION_DIR = os.getenv('INDEX_REPLICATION_DIR', '')
+INDEX_REPLICATION_ROLE = os.getenv('INDEX_REPLICATION_ROLE', 'leader')  # leader: 追踪数据库并写WAL/快照; follower: 只读快照和WAL
+INDEX_SNAPSHOT_INTERVAL = float(os.getenv('INDEX_SNAPSHOT_INTERVAL', 300))  # 快照最短间隔（秒）
+INDEX_SNAPSHOT_EVERY = int(os.getenv('INDEX_SNAPSHOT_EVERY', 10000))  # 累计多少次变更后立即切快照
+INDEX_WAL_FSYNC = os.getenv('INDEX_WAL_FSYNC', '0') == '1'
+
+# 搜索微批处理与 FAISS 线程配置
+INDEX_BATCH_WINDOW_MS = float(os.getenv('INDEX_BATCH_WINDOW_MS', 2))  # 合并窗口（毫秒）
+INDEX_BATCH_MAX_SIZE = int(os.getenv('INDEX_BATCH_MAX_SIZE', 32))  # 单次批量搜索的最大查询数，<=1 表示不合并
+# 在线服务进程的 FAISS OpenMP 线程数。多个 gunicorn worker 各自使用全部核心会互相争抢，
+# 默认每个进程 1 个线程，由批处理提供吞吐；独立索引服务可调大。<=0 表示使用 FAISS 默认值。
+# 只由 limit_faiss_threads() 在 Web worker 和索引服务中应用，基准测试、管理命令等离线工具使用全部核心
+FAISS_OMP_THREADS = int(os.getenv('FAISS_OMP_THREADS', 1))
+
+# 索引类型配置
+INDEX_FACTORY = os.getenv('INDEX_FACTORY', 'Flat')  # faiss.index_factory 描述串，如 Flat、IVF1024,Flat、HNSW32、SQ8、PQ64；
+# NumpyFlat、NumpyFlat16 使用纯 NumPy 精确检索（见 numpy_index.py），NumPy 引擎的搜索参数为 threads=4,block_size=65536
+INDEX_SEARCH_PARAMS = os.getenv('INDEX_SEARCH_PARAMS', '')  # 搜索参数，如 nprobe=16 或 efSearch=64
+INDEX_TRAIN_SIZE = int(os.getenv('INDEX_TRAIN_SIZE', 100000))  # 需要训练的索引类型最多使用的训练样本数
+# 降维: 在索引前用从商品库向量训练的 PCA 或 OPQ 把向量投影到 INDEX_REDUCE_DIM 维，查询时同样投影。
+# 变换是索引的一部分（faiss.IndexPreTransform），随快照和 save_index 一起保存
+INDEX_REDUCE_DIM = int(os.getenv('INDEX_REDUCE_DIM', 0))  # 目标维度，如 256，<=0 表示不降维
+INDEX_REDUCE_TYPE = os.getenv('INDEX_REDUCE_TYPE', 'pca')  # pca 或 opq（OPQ 旋转后再降维，适合后接 PQ）
+# 二值化初筛: index_factory 为 LSHt（按训练得到的各维阈值取符号）或 ITQ,LSHt（先做 ITQ 旋转）时，
+# 内存中每张图片只保存 dimension/8 字节（1024 维为 128 字节）的二值码，按汉明距离取候选，
+# 再从 product_images 读取候选的原始向量按 L2 距离精确重排
+INDEX_RERANK_CANDIDATES = int(os.getenv('INDEX_RERANK_CANDIDATES', 256))  # 二值初筛的候选数
+# 磁盘倒排表: IVF 类索引的倒排表放在该目录的文件中以 mmap 访问，只有粗量化器常驻内存，为空表示不启用
+INDEX_ONDISK_DIR = os.getenv('INDEX_ONDISK_DIR', '')
+INDEX_ONDISK_CACHE_MB = int(os.getenv('INDEX_ONDISK_CACHE_MB', 128))  # 常驻内存的热点倒排表预算（MB）
+INDEX_LOAD_CHUNK_SIZE = int(os.getenv('INDEX_LOAD_CHUNK_SIZE', 10000))  # 全量加载时每次读取的向量数
+# 代表图片（见 representatives.py）: 每个商品最多收录 INDEX_REPRESENTATIVES 张代表图片，<=0 表示收录全部图片
+INDEX_REPRESENTATIVES = int(os.getenv('INDEX_REPRESENTATIVES', 0))
+INDEX_REPRESENTATIVE_THRESHOLD = float(os.getenv('INDEX_REPRESENTATIVE_THRESHOLD', 0.95))  # 视为同一外观的最低余弦相似度
+INDEX_REPRESENTATIVE_EXPAND = os.getenv('INDEX_REPRESENTATIVE_EXPAND', '0') == '1'  # 命中代表图片后按商品全部图片重排
+
+# 搜索结果缓存配置
+INDEX_RESULT_CACHE_SIZE = int(os.getenv('INDEX_RESULT_CACHE_SIZE', 1024))  # 缓存的查询数，<=0 表示不缓存
+INDEX_RESULT_CACHE_TTL = float(os.getenv('INDEX_RESULT_CACHE_TTL', 300))  # 缓存条目的最长存活时间（秒）
+INDEX_COALESCE_TIMEOUT = float(os.getenv('INDEX_COALESCE_TIMEOUT', 30))  # 相同图片并发搜索时等待首个请求的最长时间（秒），<=0 表示不合并
+INDEX_PHASH_MAX_DISTANCE = int(os.getenv('INDEX_PHASH_MAX_DISTANCE', 4))  # dHash 汉明距离不超过该值的图片排在结果最前面，<0 表示不使用感知哈希
+
+# 预热配置
+INDEX_WARMUP_QUERIES = int(os.getenv('INDEX_WARMUP_QUERIES', 64))  # 预热时执行的合成查询数
+PAGE_SIZE = 4096
+
+def limit_faiss_threads():
+    """按 FAISS_OMP_THREADS 限制本进程的 OpenMP 线程数（进程级设置），由在线服务进程在创建索引前调用"""
+    if faiss is not None and FAISS_OMP_THREADS > 0:
+        faiss.omp_set_num_threads(FAISS_OMP_THREADS)
+
+def _file_digest(path: str) -> str:
+    """图片内容哈希，用于识别不同请求上传的同一张图片"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def with_reduction(index_factory: str, reduce_dim: int, reduce_type: str = 'pca') -> str:
+    """
+    在索引类型前加上降维变换，如 (IVF1024,Flat, 256) -> PCA256,IVF1024,Flat
+    Args:
+        reduce_dim: 目标维度，<=0 或描述串已包含变换时原样返回
+        reduce_type: pca 或 opq
+    """
+    # NumPy 引擎不支持前置变换
+    if reduce_dim <= 0 or index_factory in NUMPY_FACTORIES or index_factory.split(',')[0].startswith(('PCA', 'OPQ')):
+        return index_factory
+    if reduce_type == 'pca':
+        return f'PCA{reduce_dim},{index_factory}'
+    if reduce_type == 'opq':
+        # OPQ 的子空间数与后接的 PQ 一致，否则每 16 维一个子空间；需能整除目标维度
+        pq = [part for part in index_factory.split(',') if part.startswith('PQ')]
+        m = int(''.join(ch for ch in pq[0][2:] if ch.isdigit()) or 0) if pq else 0
+        if not m or reduce_dim % m:
+            m = next(m for m in (reduce_dim // 16, reduce_dim // 8, reduce_dim // 4, reduce_dim) if m and reduce_dim % m == 0)
+        return f'OPQ{m}_{reduce_dim},{index_factory}'
+    raise ValueError(f"未知的降维类型: {reduce_type}，可选 pca、opq")
+
+def _fetch_db_vectors(db, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按图片ID从 product_images 读取原始向量，返回 (存在的图片ID, 向量)"""
+    ids = [int(image_id) for image_id in ids]
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    with db.connect() as conn:
+        rows = conn.exec_driver_sql(
+            f"SELECT id, vector FROM product_images WHERE id IN ({','.join(['%s'] * len(ids))})", tuple(ids)).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    return (np.array([row[0] for row in rows], dtype=np.int64),
+            np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]))
+
+def serialize_index(index) -> np.ndarray:
+    """序列化索引，faiss 索引与 NumpyIndex 通用"""
+    if isinstance(index, NumpyIndex):
+        return index.serialize()
+    return faiss.serialize_index(index)
+
+def read_index(path: str):
+    """读取 save_index 或快照写入的索引文件"""
+    if NumpyIndex.is_serialized(path):
+        with open(path, 'rb') as f:
+            return NumpyIndex.deserialize(f.read())
+    return faiss.read_index(path)
+
+def base_index(index):
+    """去掉 ID 映射和降维变换后的底层索引"""
+    if isinstance(index, NumpyIndex):
+        return index
+    inner = faiss.downcast_index(index.index) if hasattr(index, 'id_map') else faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexPreTransform):
+        inner = faiss.downcast_index(inner.index)
+    return inner
+
+# 搜索时支持 ID 选择器（SearchParameters.sel）的底层索引类型；PQ、LSH、NSG 不支持
+SELECTOR_INDEX_TYPES = ((faiss.IndexFlat, faiss.IndexScalarQuantizer, faiss.IndexHNSW, faiss.IndexIVF)
+                        if faiss is not None else ())
+
+class VectorProductIndex:
+    # 预热状态：pending -> warming -> ready / failed
+    warmup_state = 'pending'
+    warmup_seconds = None
+    warmup_error = None
+
+    def __init__(self, dimension: int = 1024,  # DashScope embedding维度为1024
+                 sync_interval: Optional[float] = None,
+                 max_staleness: Optional[float] = None,
+                 replication_dir: Optional[str] = None,
+                 replication_role: Optional[str] = None,
+                 batch_window_ms: Optional[float] = None,
+                 batch_max_size: Optional[int] = None,
+                 engine: Optional[Engine] = None,
+                 autoload: bool = True,
+                 index_factory: Optional[str] = None,
+                 search_params: Optional[str] = None,
+                 embedder: Optional[Embedder] = None,
+                 partition_column: Optional[str] = None,
+                 reduce_dim: Optional[int] = None,
+                 reduce_type: Optional[str] = None,
+                 rerank_candidates: Optional[int] = None,
+                 vector_source: Optional[Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]] = None,
+                 ondisk_dir: Optional[str] = None,
+                 ondisk_cache_mb: Optional[int] = None,
+                 representatives: Optional[int] = None):
+        """
+        初始化向量索引系统
+        Args:
+            dimension: 特征向量维度
+            sync_interval: 后台追踪变更日志的间隔（秒），默认取 INDEX_SYNC_INTERVAL
+            max_staleness: 搜索前允许的最大陈旧时间（秒），默认取 INDEX_MAX_STALENESS
+            replication_dir: WAL 与快照目录，默认取 INDEX_REPLICATION_DIR，为空表示不启用复制
+            replication_role: 'leader' 或 'follower'，默认取 INDEX_REPLICATION_ROLE。
+                按配置启动为写入方但 WAL 已被其他进程锁定时改为跟随方，显式传入 'leader' 时抛出 WALLockedError
+            batch_window_ms: 搜索合并窗口（毫秒），默认取 INDEX_BATCH_WINDOW_MS
+            batch_max_size: 单次批量搜索的最大查询数，默认取 INDEX_BATCH_MAX_SIZE
+            engine: 数据库连接池，Flask 应用中传入 db.engine；为空时按 DB_CONFIG 自建
+            autoload: 是否在初始化时加载向量；为 False 时索引为空，由调用方自行 load_index（如管理工具）
+            index_factory: 索引类型（faiss.index_factory 描述串），默认取 INDEX_FACTORY
+            search_params: 搜索参数（faiss.ParameterSpace 格式），默认取 INDEX_SEARCH_PARAMS
+            embedder: 图片特征提取后端，默认按 INDEX_EMBEDDER 创建
+            partition_column: 按该 Product 列分区，默认取 INDEX_PARTITION_COLUMN，为空表示不分区
+            reduce_dim: 降维后的维度，默认取 INDEX_REDUCE_DIM，<=0 表示不降维
+            reduce_type: 降维方式 pca 或 opq，默认取 INDEX_REDUCE_TYPE
+            rerank_candidates: 二值初筛索引每个查询取回并重排的候选数，默认取 INDEX_RERANK_CANDIDATES
+            vector_source: 二值初筛索引重排时按图片ID读取原始向量的函数，返回 (存在的图片ID, 向量)，
+                默认从 product_images 读取
+            ondisk_dir: IVF 类索引的倒排表存放目录，默认取 INDEX_ONDISK_DIR，为空表示倒排表在内存中
+            ondisk_cache_mb: 磁盘倒排表常驻内存的预算，默认取 INDEX_ONDISK_CACHE_MB
+            representatives: 每个商品最多收录的代表图片数，默认取 INDEX_REPRESENTATIVES，<=0 表示收录全部图片
+        """
+        self.dimension = dimension
+        self.embedder = embedder or create_embedder(dimension)
+        self.index_factory = with_reduction(index_factory or INDEX_FACTORY,
+                                            INDEX_REDUCE_DIM if reduce_dim is None else reduce_dim,
+                                            reduce_type or INDEX_REDUCE_TYPE)
+        self.search_params = INDEX_SEARCH_PARAMS if search_params is None else search_params
+        self.sync_interval = INDEX_SYNC_INTERVAL if sync_interval is None else sync_interval
+        self.max_staleness = INDEX_MAX_STALENESS if max_staleness is None else max_staleness
+        self.rerank_candidates = INDEX_RERANK_CANDIDATES if rerank_candidates is None else rerank_candidates
+        self.vector_source = vector_source or (lambda ids: _fetch_db_vectors(self.db, ids))
+        representatives = INDEX_REPRESENTATIVES if representatives is None else representatives
+        self.representatives = representatives if representatives > 0 else None
+        self.representative_threshold = INDEX_REPRESENTATIVE_THRESHOLD
+        self.expand_representatives = self.representatives is not None and INDEX_REPRESENTATIVE_EXPAND
+        self._product_representatives: Dict[int, List[int]] = {}  # 商品ID -> 已收录的代表图片ID
+        self._representative_product: Dict[int, int] = {}  # 代表图片ID -> 商品ID
+        
+        if faiss is None and self.index_factory not in NUMPY_FACTORIES:
+            print(f"无法导入 faiss，索引类型 {self.index_factory} 改用 NumpyFlat")
+            self.index_factory = 'NumpyFlat'
+        
+        # 快照只记录磁盘倒排表的文件路径，无法复制给其他进程，启用索引复制时不使用磁盘倒排表
+        ondisk_dir = INDEX_ONDISK_DIR if ondisk_dir is None else ondisk_dir
+        if ondisk_dir and (INDEX_REPLICATION_DIR if replication_dir is None else replication_dir):
+            print("启用索引复制时不支持磁盘倒排表，已忽略 INDEX_ONDISK_DIR")
+            ondisk_dir = ''
+        self.ondisk_dir = ondisk_dir or None
+        self.list_cache = None
+        if self.ondisk_dir:
+            remove_stale_files(self.ondisk_dir)
+            self.list_cache = ListCache((INDEX_ONDISK_CACHE_MB if ondisk_cache_mb is None else ondisk_cache_mb) << 20)
+        
+        # 初始化FAISS索引，使用 product_images.id 作为向量ID，便于按ID增量增删
+        self._lock = threading.RLock()  # 保护 self.index 的读写
+        self._set_index(self._new_index())
+        # 与商品库图片几乎相同的查询按 dHash 直接命中，不调用特征提取；随 product_images 加载和同步维护
+        self.hash_index = HashIndex(INDEX_PHASH_MAX_DISTANCE) if INDEX_PHASH_MAX_DISTANCE >= 0 else None
+        
+        # 变更日志追踪状态
+        self.generation = 0  # 每次索引内容变化时递增
+        self.last_change_seq = 0  # 已应用的 index_changes.seq
+        self._pending_gaps = {}  # 尚未出现的 seq -> 首次发现的时间
+        self._last_sync = 0.0
+        self._sync_lock = threading.Lock()
+        self._sync_wakeup = threading.Event()
+        self._sync_stop = threading.Event()
+        self._sync_thread = None
+        
+        # WAL 与快照
+        self.replication_dir = INDEX_REPLICATION_DIR if replication_dir is None else replication_dir
+        self.replication_role = replication_role or INDEX_REPLICATION_ROLE
+        # 按配置启动的多个 worker 共享目录时，未抢到 WAL 锁的按跟随方启动；显式指定写入方（如管理命令）时直接报错
+        self._require_leader = replication_role == 'leader'
+        self._wal = None
+        self._wal_reader = None
+        self._snapshots = None
+        self._mutations_since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+        
+        # 分区成员与感知哈希一样随 product_images 加载和同步维护，从 WAL 复制的跟随方没有商品信息，不分区
+        partition_column = INDEX_PARTITION_COLUMN if partition_column is None else partition_column
+        if partition_column and partition_column not in Product.__table__.columns:
+            raise ValueError(f"分区列 {partition_column} 不是 products 表的列")
+        if partition_column and self.replication_dir:
+            print(f"启用索引复制时不支持按 {partition_column} 分区，已忽略")
+            partition_column = ''
+        self.partition_column = partition_column or None
+        self.partitions = PartitionSet() if self.partition_column else None
+        
+        # 数据库访问：每次调用从连接池借出连接，多线程之间不共享连接
+        self._owns_engine = engine is None
+        self.db = IndexDatabase(engine if engine is not None else create_index_engine(DB_CONFIG))
+        # self._create_tables()
+        if not autoload:
+            pass
+        elif self.replication_dir:
+            self._init_replication()
+        else:
+            self._load_vectors()
+        
+        # 并发的单条查询合并为一次批量搜索
+        batch_window_ms = INDEX_BATCH_WINDOW_MS if batch_window_ms is None else batch_window_ms
+        batch_max_size = INDEX_BATCH_MAX_SIZE if batch_max_size is None else batch_max_size
+        self._batcher = SearchBatcher(self._search_direct, batch_window_ms, batch_max_size) if batch_max_size > 1 else None
+        
+        # 相同图片的重复搜索直接返回缓存结果，索引 generation 变化或商品被修改时失效
+        self.result_cache = (SearchResultCache(INDEX_RESULT_CACHE_SIZE, INDEX_RESULT_CACHE_TTL)
+                             if INDEX_RESULT_CACHE_SIZE > 0 else None)
+        # 同一张图片的并发搜索只执行一次特征提取和检索
+        self._single_flight = SingleFlight(INDEX_COALESCE_TIMEOUT) if INDEX_COALESCE_TIMEOUT > 0 else None
+        
+        # 本进程提交变更后立即唤醒同步线程，其他进程依靠定时追踪
+        register_commit_listener(self._sync_wakeup.set)
+        if self.sync_interval > 0:
+            self.start_sync()
+        
+    def _create_tables(self):
+        with self.db.connect() as conn:
+            conn.exec_driver_sql("""
+                CREATE TABLE IF NOT EXISTS products (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    attributes JSON NOT NULL,  -- 使用JSON格式存储属性
+                    price DECIMAL(10, 2) NOT NULL,
+                    description TEXT
+                )
+            """)
+            
+            conn.exec_driver_sql("""
+                CREATE TABLE IF NOT EXISTS product_images (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    product_id INT NOT NULL,
+                    image_path VARCHAR(255) NOT NULL,
+                    vector BLOB NOT NULL,  -- 对应FAISS中的向量ID
+                    FOREIGN KEY (product_id) REFERENCES products(id),
+                    UNIQUE KEY unique_image_path (image_path)
+                )
+            """)
+            conn.commit()
+
+    def _new_index(self):
+        """创建空索引，以 product_images.id 作为向量ID；类型由 index_factory 决定，默认为 L2 距离的平面索引"""
+        if self.index_factory in NUMPY_FACTORIES:
+            index = NumpyIndex(self.dimension, NUMPY_FACTORIES[self.index_factory])
+        elif self.index_factory == 'Flat':
+            index = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimension))
+        else:
+            index = faiss.IndexIDMap2(faiss.index_factory(self.dimension, self.index_factory))
+        if self.ondisk_dir and attach_ondisk_lists(index, self.ondisk_dir) is None:
+            print(f"索引类型 {self.index_factory} 不是 IVF，倒排表保留在内存中")
+            self.ondisk_dir = None
+            self.list_cache = None
+        self._configure(index)
+        return index
+
+    def _configure(self, index):
+        """
+        应用搜索参数；IVF 类索引使用数组直接映射，以支持按ID重建向量。
+        IndexIDMap2 按顺序编号写入内层索引，删除走墓碑，编号始终连续
+        """
+        if isinstance(index, NumpyIndex):
+            for name, value in (item.split('=') for item in self.search_params.split(',') if item):
+                if name in ('threads', 'block_size'):
+                    setattr(index, name, int(value))
+                else:
+                    print(f"NumPy 引擎忽略搜索参数 {name}")
+            return
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None and ivf.direct_map.type != faiss.DirectMap.Array:
+            ivf.set_direct_map_type(faiss.DirectMap.Array)
+        if self.search_params:
+            faiss.ParameterSpace().set_index_parameters(index, self.search_params)
+
+    def _set_index(self, index, tombstones=()):
+        """
+        替换当前索引（调用方持有 self._lock）。
+        HNSW 等不支持删除向量的索引类型改用墓碑：删除或覆盖时记录旧向量的内部位置，
+        搜索时过滤，compact 时清除。_positions 记录每个图片ID当前有效的内部位置
+        """
+        self._configure(index)
+        # 替换后旧索引随即释放，先取出倒排表文件名
+        old_lists = ondisk_lists(self.index) if getattr(self, 'index', None) is not None else None
+        old_file = old_lists.filename if old_lists is not None else None
+        new_lists = ondisk_lists(index)
+        self.index = index
+        if old_file and (new_lists is None or new_lists.filename != old_file):
+            # 旧索引的倒排表文件不再使用
+            try:
+                os.remove(old_file)
+            except OSError:
+                pass
+        self._tombstones = {int(position) for position in tombstones}
+        self._tombstone_selector = None
+        # 二值码只用于初筛，距离和重建都以原始向量为准
+        self.binary_stage = faiss is not None and isinstance(base_index(index), faiss.IndexLSH)
+        # IVF 的直接映射只支持按内部ID数组删除，经过 IndexIDMap2 转换后无法删除，同样使用墓碑
+        if faiss is not None and isinstance(base_index(index), (faiss.IndexHNSW, faiss.IndexNSG, faiss.IndexIVF)):
+            id_map = faiss.vector_to_array(index.id_map)
+            # 同一图片ID出现多次时，位置靠后的是最新写入的向量
+            self._positions = {int(image_id): position for position, image_id in enumerate(id_map)
+                               if position not in self._tombstones}
+        else:
+            self._positions = None
+
+    def _remove_ids(self, ids) -> int:
+        """从索引删除向量（调用方持有 self._lock），不支持删除的索引类型记录墓碑"""
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        if self._positions is None:
+            return self.index.remove_ids(ids)
+        removed = 0
+        for image_id in ids:
+            position = self._positions.pop(int(image_id), None)
+            if position is not None:
+                self._tombstones.add(position)
+                removed += 1
+        if removed:
+            self._tombstone_selector = None
+        return removed
+
+    def _add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        """写入向量（调用方持有 self._lock，且已删除同ID的旧向量）；索引尚未训练时先用这批向量训练"""
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not self.index.is_trained:
+            self._train(vectors)
+        start = self.index.ntotal
+        self.index.add_with_ids(vectors, ids)
+        if self._positions is not None:
+            for offset, image_id in enumerate(ids):
+                self._positions[int(image_id)] = start + offset
+
+    def _train(self, vectors: np.ndarray):
+        if len(vectors) > INDEX_TRAIN_SIZE:
+            vectors = vectors[np.random.default_rng(0).choice(len(vectors), INDEX_TRAIN_SIZE, replace=False)]
+        start = time.time()
+        self.index.train(vectors)
+        print(f"索引 {self.index_factory} 训练完成，使用 {len(vectors)} 个样本，耗时 {time.time() - start:.2f} 秒。")
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray):
+        """用给定向量重建索引（需要训练的索引类型以这些向量训练），替换当前索引"""
+        with self._lock:
+            self._set_index(self._new_index())
+            if len(ids):
+                self._add_with_ids(vectors, ids)
+                self._release_lists()
+            self.generation += 1
+
+    def _release_lists(self):
+        """批量写入后释放磁盘倒排表的全部页面（调用方持有 self._lock）"""
+        if self.list_cache is not None and ondisk_lists(self.index) is not None:
+            self.list_cache.release_all(ondisk_lists(self.index))
+
+    def live_ids(self) -> np.ndarray:
+        """索引中有效（未删除）的 product_images.id，升序"""
+        with self._lock:
+            if self._positions is not None:
+                return np.array(sorted(self._positions), dtype=np.int64)
+            if isinstance(self.index, NumpyIndex):
+                return self.index.live_ids()
+            return np.sort(faiss.vector_to_array(self.index.id_map))
+
+    def _load_vectors(self):
+        """
+        从 product_images 全量加载向量。按 id 分块读取并写入新索引，内存中同时只有一块原始向量；
+        需要训练的索引类型先用随机抽取的最多 INDEX_TRAIN_SIZE 个向量训练
+        """
+        loaded = 0
+        # 全量读取耗时与数据量成正比，不设语句超时；各次读取在同一连接（同一事务快照）中进行
+        with self.db.connect(statement_timeout_ms=0) as conn:
+            # 先读取变更日志位置，再读取向量
+            max_seq = int(conn.exec_driver_sql("SELECT COALESCE(MAX(seq), 0) FROM index_changes").scalar())
+            partition_values = self._fetch_partition_values(conn)
+            
+            with self._lock:
+                # 重建而不是在现有索引上追加，多次调用（例如手动刷新索引）也能保证索引是干净的
+                self._set_index(self._new_index())
+                if not self.index.is_trained:
+                    self._train_from_db(conn)
+                if self.hash_index is not None:
+                    self.hash_index.clear()
+                if self.partitions is not None:
+                    self.partitions.clear()
+                self._product_representatives = {}
+                self._representative_product = {}
+                for rows in self._iter_image_rows(conn):
+                    loaded += len(rows)
+                    if self.hash_index is not None:
+                        self.hash_index.update((row[0], row[2]) for row in rows)
+                    if self.representatives is not None:
+                        rows = self._choose_representatives(rows)
+                    ids = np.array([row[0] for row in rows], dtype=np.int64)
+                    vectors = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                    self._add_with_ids(vectors, ids)
+                    self._release_lists()
+                    if self.partitions is not None:
+                        self.partitions.update(ids, [partition_values.get(int(db_id)) for db_id in ids])
+                self.generation += 1
+                # 加载时可能有序号更小的事务尚未提交，回看一段日志；
+                # 变更按图片当前状态应用，重复应用是幂等的
+                self.last_change_seq = max(0, max_seq - INDEX_SYNC_BATCH_SIZE)
+                self._pending_gaps = {}
+                self._last_sync = time.monotonic()
+        
+        if self.representatives is not None:
+            print(f"成功加载 {self.ntotal} 个向量到索引（{loaded} 张图片中每个商品的代表图片）。")
+        else:
+            print(f"成功加载 {loaded} 个向量到索引。")
+
+    def _iter_image_rows(self, conn):
+        """
+        按块读取 product_images 的 (id, vector, image_hash, product_id)。
+        启用代表图片时按商品排序，同一商品的图片总在同一块中
+        """
+        if self.representatives is None:
+            last_id = 0
+            while True:
+                rows = conn.exec_driver_sql(
+                    "SELECT id, vector, image_hash, product_id FROM product_images WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, INDEX_LOAD_CHUNK_SIZE)).fetchall()
+                if not rows:
+                    return
+                yield rows
+                last_id = rows[-1][0]
+        last_product, last_id = 0, 0
+        carry = []  # 上一块末尾、可能还有后续图片的商品
+        while True:
+            rows = conn.exec_driver_sql(
+                "SELECT id, vector, image_hash, product_id FROM product_images "
+                "WHERE product_id > %s OR (product_id = %s AND id > %s) ORDER BY product_id, id LIMIT %s",
+                (last_product, last_product, last_id, INDEX_LOAD_CHUNK_SIZE)).fetchall()
+            if len(rows) < INDEX_LOAD_CHUNK_SIZE:
+                if carry or rows:
+                    yield carry + list(rows)
+                return
+            last_id, last_product = rows[-1][0], rows[-1][3]
+            rows = carry + list(rows)
+            split = next(i for i, row in enumerate(rows) if row[3] == last_product)
+            carry = rows[split:]
+            if split:
+                yield rows[:split]
+
+    def _choose_representatives(self, rows) -> list:
+        """
+        从按商品排序、包含商品全部图片的行中选出每个商品的代表图片，并更新商品与代表图片的对应关系（调用方持有 self._lock）
+        """
+        chosen = []
+        for product_id, group in itertools.groupby(rows, key=lambda row: row[3]):
+            group = list(group)
+            vectors = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in group])
+            picked = [group[i] for i in select_representatives(vectors, self.representatives, self.representative_threshold)]
+            for image_id in self._product_representatives.pop(product_id, ()):
+                self._representative_product.pop(image_id, None)
+            self._product_representatives[product_id] = [row[0] for row in picked]
+            self._representative_product.update((row[0], product_id) for row in picked)
+            chosen.extend(picked)
+        return chosen
+
+    def representative_ids(self) -> Optional[np.ndarray]:
+        """当前索引的代表图片ID（升序），未启用代表图片时返回 None"""
+        if self.representatives is None:
+            return None
+        with self._lock:
+            return np.array(sorted(self._representative_product), dtype=np.int64)
+
+    def _train_from_db(self, conn):
+        """从 product_images 随机抽取训练样本训练当前索引（调用方持有 self._lock）"""
+        ids = np.array([row[0] for row in conn.exec_driver_sql("SELECT id FROM product_images").fetchall()],
+                       dtype=np.int64)
+        if len(ids) == 0:
+            return
+        if len(ids) > INDEX_TRAIN_SIZE:
+            ids = np.sort(np.random.default_rng(0).choice(ids, INDEX_TRAIN_SIZE, replace=False))
+        samples = []
+        for start in range(0, len(ids), INDEX_LOAD_CHUNK_SIZE):
+            chunk = [int(image_id) for image_id in ids[start:start + INDEX_LOAD_CHUNK_SIZE]]
+            rows = conn.exec_driver_sql(
+                f"SELECT vector FROM product_images WHERE id IN ({','.join(['%s'] * len(chunk))})", tuple(chunk)).fetchall()
+            samples.extend(np.frombuffer(row[0], dtype=np.float32) for row in rows)
+        self._train(np.vstack(samples))
+
+    def start_sync(self):
+        """启动后台线程，定时追踪 index_changes 变更日志"""
+        if self._sync_thread and self._sync_thread.is_alive():
+            return
+        self._sync_stop.clear()
+        self._sync_thread = threading.Thread(target=self._sync_loop, name='index-change-sync', daemon=True)
+        self._sync_thread.start()
+
+    def stop_sync(self):
+        """停止后台同步线程"""
+        self._sync_stop.set()
+        self._sync_wakeup.set()
+        if self._sync_thread:
+            self._sync_thread.join(timeout=5)
+            self._sync_thread = None
+
+    def _notify_change(self):
+        """本进程写入 index_changes 后调用，唤醒同步线程立即处理"""
+        self._sync_wakeup.set()
+
+    def _sync_loop(self):
+        while not self._sync_stop.is_set():
+            self._sync_wakeup.wait(self.sync_interval)
+            self._sync_wakeup.clear()
+            if self._sync_stop.is_set():
+                break
+            try:
+                self.sync_changes()
+            except Exception as e:
+                print(f"同步索引变更时发生错误: {e}")
+            try:
+                self._maybe_snapshot()
+            except Exception as e:
+                print(f"生成索引快照时发生错误: {e}")
+
+    def _init_replication(self):
+        """
+        根据角色从快照 + WAL 启动；没有可用快照时从数据库全量加载。
+        同一目录只能有一个写入方，WAL 已被其他进程锁定时按跟随方启动
+        """
+        self._snapshots = SnapshotStore(os.path.join(self.replication_dir, 'snapshots'))
+        wal_dir = os.path.join(self.replication_dir, 'wal')
+        if self.replication_role != 'follower':
+            try:
+                self._wal = IndexWAL(wal_dir, fsync=INDEX_WAL_FSYNC)
+            except WALLockedError as e:
+                if self._require_leader:
+                    raise
+                print(f"{e}，按跟随方启动")
+                self.replication_role = 'follower'
+        if self.replication_role == 'follower':
+            if not self._bootstrap_from_snapshot():
+                # 还没有快照：先从数据库加载，再从头追踪 WAL（按最终状态重放是幂等的）
+                self._load_vectors()
+                self._wal_reader = WALReader(wal_dir, 0)
+            return
+        
+        if self._bootstrap_from_snapshot():
+            # 快照之后的 WAL 已重放，继续从对应的变更日志位置追踪数据库
+            self._wal_reader = None
+            self._wal.last_lsn = max(self._wal.last_lsn, self._snapshots.latest()['lsn'])
+            self.last_change_seq = max(0, self.last_change_seq - INDEX_SYNC_BATCH_SIZE)
+        else:
+            self._load_vectors()
+            self.snapshot()
+
+    def _bootstrap_from_snapshot(self) -> bool:
+        """加载最新快照并重放其后的 WAL 记录"""
+        meta = self._snapshots.latest()
+        if meta is None:
+            return False
+        start = time.time()
+        index = read_index(meta['path'])
+        if index.d != self.dimension:
+            print(f"快照维度 {index.d} 与索引维度 {self.dimension} 不一致，忽略快照")
+            return False
+        self._wal_reader = WALReader(os.path.join(self.replication_dir, 'wal'), meta['lsn'])
+        with self._lock:
+            self._set_index(index, meta.get('tombstones', ()))
+            self.last_change_seq = meta['change_seq']
+            self.generation += 1
+        replayed = self._replay(self._wal_reader.read())
+        self._rebuild_image_metadata()
+        self._last_sync = time.monotonic()
+        print(f"从快照 {meta['file']} 启动并重放 {replayed} 条WAL记录，索引共 {self.ntotal} 个向量，"
+              f"耗时 {time.time() - start:.2f} 秒。")
+        return True
+
+    def _rebuild_image_metadata(self):
+        """
+        快照和 WAL 只包含向量，从快照启动后按 product_images 重建 dHash 索引和商品与代表图片的对应关系。
+        只读取图片ID、商品ID和 image_hash，不读取向量；索引中的图片即为各商品当前的代表图片
+        """
+        if self.representatives is None and self.hash_index is None:
+            return
+        hash_index = HashIndex(self.hash_index.max_distance) if self.hash_index is not None else None
+        product_representatives: Dict[int, List[int]] = {}
+        representative_product: Dict[int, int] = {}
+        live = set(self.live_ids().tolist()) if self.representatives is not None else set()
+        last_id = 0
+        with self.db.connect(statement_timeout_ms=0) as conn:
+            while True:
+                rows = conn.exec_driver_sql(
+                    "SELECT id, product_id, image_hash FROM product_images WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, INDEX_LOAD_CHUNK_SIZE)).fetchall()
+                if not rows:
+                    break
+                if hash_index is not None:
+                    hash_index.update((row[0], row[2]) for row in rows)
+                for image_id, product_id, _ in rows:
+                    if image_id in live:
+                        product_representatives.setdefault(product_id, []).append(image_id)
+                        representative_product[image_id] = product_id
+                last_id = rows[-1][0]
+        with self._lock:
+            if hash_index is not None:
+                self.hash_index = hash_index
+            if self.representatives is not None:
+                self._product_representatives = product_representatives
+                self._representative_product = representative_product
+
+    def _replay(self, records) -> int:
+        """按顺序重放 WAL 记录，同一图片只保留最后一次操作的结果"""
+        latest = {}
+        change_seq = None
+        count = 0
+        for record in records:
+            latest[record.image_id] = record.vector if record.op == OP_UPSERT else None
+            change_seq = record.change_seq
+            count += 1
+        if not latest:
+            return 0
+        ids = np.array(sorted(latest), dtype=np.int64)
+        upserts = [(image_id, vector) for image_id, vector in latest.items() if vector is not None]
+        with self._lock:
+            self._remove_ids(ids)
+            if upserts:
+                self._add_with_ids(np.vstack([v for _, v in upserts]),
+                                        np.array([image_id for image_id, _ in upserts], dtype=np.int64))
+            self.last_change_seq = max(self.last_change_seq, change_seq)
+            self.generation += 1
+        return count
+
+    def _sync_from_wal(self) -> int:
+        """跟随方：读取 WAL 新增记录；需要的日志段已被截断时从最新快照重新启动"""
+        with self._sync_lock:
+            try:
+                processed = self._replay(self._wal_reader.read())
+            except WALTruncatedError as e:
+                print(f"{e}，从最新快照重新启动")
+                self._bootstrap_from_snapshot()
+                processed = 0
+            self._last_sync = time.monotonic()
+            return processed
+
+    def snapshot(self) -> Optional[dict]:
+        """
+        切出快照（仅写入方）。序列化在锁内完成（内存拷贝），写文件在锁外进行，
+        随后切换到新的 WAL 段并删除最旧快照之前的日志段。
+        """
+        if self._wal is None:
+            return None
+        with self._lock:
+            index_bytes = serialize_index(self.index)
+            lsn = self._wal.last_lsn
+            change_seq = self.last_change_seq
+            ntotal = self.ntotal
+            extra = {'tombstones': sorted(self._tombstones)} if self._tombstones else {}
+            self._wal.rotate()
+            self._mutations_since_snapshot = 0
+        meta = self._snapshots.write(index_bytes, lsn, change_seq, ntotal=ntotal, dimension=self.dimension,
+                                     index_factory=self.index_factory, **extra)
+        self._wal.truncate_before(self._snapshots.oldest_lsn())
+        self._last_snapshot = time.monotonic()
+        print(f"已生成索引快照 {meta['file']}（{ntotal} 个向量，LSN {lsn}）。")
+        return meta
+
+    def _maybe_snapshot(self):
+        if self._wal is None or self._mutations_since_snapshot == 0:
+            return
+        if (self._mutations_since_snapshot >= INDEX_SNAPSHOT_EVERY
+                or time.monotonic() - self._last_snapshot >= INDEX_SNAPSHOT_INTERVAL):
+            self.snapshot()
+
+    def _ensure_fresh(self):
+        """搜索前检查陈旧程度，超过 max_staleness 时先同步一次"""
+        if time.monotonic() - self._last_sync <= self.max_staleness:
+            return
+        try:
+            self.sync_changes()
+        except Exception as e:
+            print(f"搜索前同步索引变更失败，使用现有索引: {e}")
+
+    def sync_changes(self) -> int:
+        """
+        从 index_changes 读取 last_change_seq 之后的变更并增量应用到索引。
+        变更只记录图片ID，应用时按 product_images 的当前状态处理：
+        行存在则（重新）加入索引，不存在则从索引移除，因此重复或乱序应用都是安全的。
+        Returns:
+            int: 本次处理的变更条数
+        """
+        if self._wal_reader is not None:
+            return self._sync_from_wal()
+        with self._sync_lock, self.db.connect() as conn:
+            processed = 0
+            while True:
+                changes = self._fetch_changes(conn)
+                if not changes:
+                    break
+                image_ids = set()
+                for seq, image_id in changes:
+                    self._track_seq(seq)
+                    image_ids.add(int(image_id))
+                self._apply_image_changes(conn, image_ids)
+                # 结束只读事务，下一批查询能看到最新已提交的数据
+                conn.commit()
+                processed += len(changes)
+                if len(changes) < INDEX_SYNC_BATCH_SIZE:
+                    break
+            
+            # 超时的空洞视为已回滚的事务
+            now = time.monotonic()
+            for seq, first_seen in list(self._pending_gaps.items()):
+                if now - first_seen > INDEX_CHANGE_GAP_TIMEOUT:
+                    del self._pending_gaps[seq]
+            self._last_sync = now
+            return processed
+
+    def _fetch_changes(self, conn) -> List[Tuple[int, int]]:
+        params = [self.last_change_seq]
+        sql = "SELECT seq, image_id FROM index_changes WHERE seq > %s"
+        if self._pending_gaps:
+            gaps = sorted(self._pending_gaps)
+            sql += f" OR seq IN ({','.join(['%s'] * len(gaps))})"
+            params.extend(gaps)
+        sql += " ORDER BY seq LIMIT %s"
+        params.append(INDEX_SYNC_BATCH_SIZE)
+        return list(conn.exec_driver_sql(sql, tuple(params)).fetchall())
+
+    def _track_seq(self, seq: int):
+        """推进 last_change_seq，并记录跳过的序号（可能对应尚未提交的事务）"""
+        seq = int(seq)
+        if seq in self._pending_gaps:
+            del self._pending_gaps[seq]
+            return
+        if seq <= self.last_change_seq:
+            return
+        missing = seq - self.last_change_seq - 1
+        if 0 < missing and len(self._pending_gaps) + missing <= INDEX_MAX_PENDING_GAPS:
+            now = time.monotonic()
+            for gap in range(self.last_change_seq + 1, seq):
+                self._pending_gaps[gap] = now
+        self.last_change_seq = seq
+
+    def _apply_image_changes(self, conn, image_ids):
+        """
+        按 product_images 当前状态把给定图片ID同步到索引。
+        启用代表图片时重新选出涉及商品的代表图片，索引中只替换这些商品的代表
+        """
+        if not image_ids:
+            return
+        ids = sorted(image_ids)
+        placeholders = ','.join(['%s'] * len(ids))
+        rows = conn.exec_driver_sql(f"SELECT id, vector, image_hash, product_id FROM product_images WHERE id IN ({placeholders})", tuple(ids)).fetchall()
+        indexed_rows = rows
+        products = set()
+        if self.representatives is not None:
+            with self._lock:
+                # 已删除的图片查不到商品，从代表图片的对应关系中找
+                products = {row[3] for row in rows} | {self._representative_product[image_id] for image_id in ids
+                                                       if image_id in self._representative_product}
+            indexed_rows = []
+            if products:
+                product_placeholders = ','.join(['%s'] * len(products))
+                indexed_rows = conn.exec_driver_sql(
+                    f"SELECT id, vector, image_hash, product_id FROM product_images WHERE product_id IN ({product_placeholders}) "
+                    f"ORDER BY product_id, id", tuple(sorted(products))).fetchall()
+        partition_values = self._fetch_partition_values(conn, sorted({row[0] for row in indexed_rows} | set(ids)))
+        
+        with self._lock:
+            removed = set(ids)
+            if self.representatives is not None:
+                for product_id in products:
+                    removed.update(self._product_representatives.get(product_id, ()))
+                indexed_rows = self._choose_representatives(indexed_rows)
+                for product_id in products - {row[3] for row in indexed_rows}:
+                    # 商品已没有图片
+                    for image_id in self._product_representatives.pop(product_id, ()):
+                        self._representative_product.pop(image_id, None)
+            present = {row[0] for row in indexed_rows}
+            self._remove_ids(sorted(removed | present))
+            if indexed_rows:
+                vectors = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in indexed_rows])
+                self._add_with_ids(vectors, np.array([row[0] for row in indexed_rows], dtype=np.int64))
+            if self.hash_index is not None:
+                self.hash_index.remove(ids)
+                self.hash_index.update((row[0], row[2]) for row in rows)
+            if self.partitions is not None:
+                self.partitions.remove(sorted(removed | present))
+                self.partitions.update([row[0] for row in indexed_rows],
+                                       [partition_values.get(row[0]) for row in indexed_rows])
+            self.generation += 1
+            if self._wal is not None:
+                # 与索引修改在同一把锁内写 WAL，保证快照时索引内容与 LSN 一致
+                records = [(self.last_change_seq, OP_UPSERT, row[0], np.frombuffer(row[1], dtype=np.float32))
+                           for row in indexed_rows]
+                records += [(self.last_change_seq, OP_REMOVE, image_id, None)
+                            for image_id in sorted(removed - present)]
+                self._wal.append(records)
+                self._mutations_since_snapshot += len(records)
+        print(f"已同步 {len(ids)} 个图片的索引变更，当前索引共 {self.ntotal} 个向量。")
+
+    def _fetch_partition_values(self, conn, image_ids=None) -> Dict[int, Any]:
+        """图片ID -> 所属商品的分区列取值；未启用分区时返回空字典"""
+        if self.partitions is None:
+            return {}
+        # partition_column 已在初始化时校验为 products 表的列
+        sql = (f"SELECT pi.id, p.{self.partition_column} FROM product_images pi "
+               f"JOIN products p ON p.id = pi.product_id")
+        if image_ids is None:
+            rows = conn.exec_driver_sql(sql).fetchall()
+        else:
+            placeholders = ','.join(['%s'] * len(image_ids))
+            rows = conn.exec_driver_sql(f"{sql} WHERE pi.id IN ({placeholders})", tuple(image_ids)).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def partition_stats(self) -> Optional[dict]:
+        """各分区的向量数，未启用分区时返回 None"""
+        if self.partitions is None:
+            return None
+        with self._lock:
+            sizes = self.partitions.sizes()
+        return {'column': self.partition_column, 'count': len(sizes), 'sizes': sizes}
+
+    def extract_feature(self, image_path: str) -> np.ndarray:
+        """提取图片特征向量（归一化），由 self.embedder 完成"""
+        return self.embedder.embed_image(image_path)
+    
+    def add_product(self, product: ProductInfo, image_path: str):
+        """
+        添加商品及其图片到索引
+        Args:
+            product: 商品信息
+            image_path: 商品图片路径
+        """
+        try:
+            # 特征提取要调用外部 API，先于借出连接完成，避免长时间占用连接池
+            feature = self.extract_feature(image_path)
+            hash_value = image_hash(image_path)
+            
+            with self.db.connect() as conn:
+                # 存储商品信息
+                conn.exec_driver_sql(
+                    "INSERT INTO products (name, attributes, price, description) VALUES (%s, %s, %s, %s) ON CONFLICT (id) DO UPDATE SET name = %s, attributes = %s, price = %s, description = %s",
+                    (
+                        product.name,
+                        json.dumps(product.attributes),
+                        product.price,
+                        product.description,
+                        product.name,
+                        json.dumps(product.attributes),
+                        product.price,
+                        product.description
+                    )
+                )
+                
+                # 存储图片信息和向量ID的映射
+                conn.exec_driver_sql(
+                    "INSERT INTO product_images (product_id, image_path, vector, image_hash) VALUES (%s, %s, %s, %s) ON DUPLICATE KEY UPDATE product_id = %s, vector = %s, image_hash = %s",
+                    (product.id, image_path, feature.tobytes(), hash_value, product.id, feature.tobytes(), hash_value)
+                )
+                
+                # 在同一事务中写入变更日志，FAISS索引由同步流程统一更新
+                image_id = conn.exec_driver_sql("SELECT id FROM product_images WHERE image_path = %s", (image_path,)).scalar()
+                conn.exec_driver_sql(
+                    "INSERT INTO index_changes (op, image_id) VALUES ('add', %s)",
+                    (image_id,)
+                )
+                
+                conn.commit()
+            self._notify_change()
+        except SQLAlchemyError as e:
+            print(f"添加商品时发生错误: {e}")
+            raise
+    
+    def search(self, query_image_path: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        搜索相似商品
+        Args:
+            query_image_path: 查询图片路径
+            top_k: 返回结果数量
+        Returns:
+            List[Dict[str, Any]]: 商品信息字典列表
+        """
+        results = []
+        
+        # 提取查询图片特征
+        print(f"正在提取查询图片特征: {query_image_path}")
+        query_feature = self.extract_feature(query_image_path)
+        query_feature = query_feature.reshape(1, -1).astype('float32')
+        print(f"查询向量范数: {np.linalg.norm(query_feature)}")
+        
+        # FAISS搜索
+        self._ensure_fresh()
+        print(f"开始FAISS搜索，索引中共有{self.ntotal}个向量")
+        with SEARCH_STAGE_SECONDS.time(stage='faiss_search'), span('faiss.search', k=top_k, ntotal=self.ntotal):
+            distances, indices = self.search_vectors(query_feature, top_k)
+        print(f"搜索结果 - distances: {distances}, indices: {indices}")
+        
+        # 使用ORM查询匹配的产品
+        hydration_start = time.perf_counter()
+        try:
+            for i, (distance, vector_id) in enumerate(zip(distances[0], indices[0])):
+                if vector_id == -1:  # 没有找到匹配的向量
+                    continue
+                    
+                # 查询匹配图片的商品信息 (vector_id 即 product_images.id)
+                product_image = ProductImage.query.filter_by(id=int(vector_id)).first()
+                
+                if product_image:
+                    # 获取关联的产品
+                    product = product_image.product
+                    
+                    if product:
+                        similarity_score = float(1 / (1 + distance)) # 确保转换为原生 float
+                        results.append({
+                            'product_id': product.id,
+                            'similarity': similarity_score,
+                            'image_path': product_image.image_path
+                        })
+            
+        except Exception as e:
+            print(f"搜索商品时发生错误: {e}")
+            raise
+        SEARCH_STAGE_SECONDS.observe(time.perf_counter() - hydration_start, stage='db_hydration')
+            
+        return results
+
+    def _distance_to_similarity(self, distance: float) -> float:
+        """将距离转换为相似度得分 (0-1范围，越高越好)。"""
+        # L2 距离的简单转换，可以根据需要调整
+        if distance < 0: # 距离不应为负，但以防万一
+            return 0.0
+        return 1 / (1 + distance)
+
+    @property
+    def ntotal(self) -> int:
+        """索引中的有效向量数量（不含墓碑）"""
+        return self.index.ntotal - len(self._tombstones)
+
+    def search_vectors(self, query_vectors: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        用特征向量直接搜索
+        Args:
+            query_vectors: (n, dimension) 查询向量
+            top_k: 每个查询返回的结果数量
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (distances, ids)，ids 为 product_images.id，不足 top_k 时以 -1 填充
+        """
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32).reshape(-1, self.dimension)
+        if self._batcher is not None:
+            return self._batcher.search(query_vectors, top_k)
+        return self._search_direct(query_vectors, top_k)
+
+    def _search_direct(self, query_vectors: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            binary_stage = self.binary_stage
+            candidates = max(top_k, self.rerank_candidates) if binary_stage else top_k
+            if not self._tombstones:
+                distances, ids = self.index.search(query_vectors, candidates)
+            else:
+                distances, ids = self._search_excluding_tombstones(query_vectors, candidates)
+            if self.list_cache is not None:
+                self._touch_lists(query_vectors)
+        return self._finish_search(query_vectors, distances, ids, top_k, binary_stage)
+
+    def _finish_search(self, query_vectors: np.ndarray, distances: np.ndarray, ids: np.ndarray, top_k: int,
+                       binary_stage: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """展开代表图片或按原始向量重排候选，不持有 self._lock（读取原始向量在锁外进行）"""
+        if self.expand_representatives:
+            return self._rerank(query_vectors, self._expand_representatives(ids), top_k)
+        if not binary_stage:
+            return distances, ids
+        return self._rerank(query_vectors, ids, top_k)
+
+    def _expand_representatives(self, candidate_ids: np.ndarray) -> np.ndarray:
+        """把命中的代表图片换成其商品的全部图片，每行以 -1 填充到相同长度"""
+        representatives = sorted({int(image_id) for image_id in candidate_ids.ravel() if image_id >= 0})
+        if not representatives:
+            return candidate_ids
+        with self.db.connect() as conn:
+            rows = conn.exec_driver_sql(
+                f"SELECT r.id, pi.id FROM product_images r JOIN product_images pi ON pi.product_id = r.product_id "
+                f"WHERE r.id IN ({','.join(['%s'] * len(representatives))})", tuple(representatives)).fetchall()
+        members: Dict[int, List[int]] = {}
+        for representative, image_id in rows:
+            members.setdefault(representative, []).append(image_id)
+        expanded = [sorted({member for image_id in row_ids if image_id >= 0
+                            for member in members.get(int(image_id), [int(image_id)])}) for row_ids in candidate_ids]
+        result = np.full((len(expanded), max(1, max(len(row) for row in expanded))), -1, dtype=np.int64)
+        for row, image_ids in enumerate(expanded):
+            result[row, :len(image_ids)] = image_ids
+        return result
+
+    def _rerank(self, query_vectors: np.ndarray, candidate_ids: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """按原始向量的 L2 距离重排二值初筛或展开代表图片后的候选，结果格式与 faiss.Index.search 相同"""
+        distances = np.full((len(query_vectors), top_k), np.inf, dtype=np.float32)
+        ids = np.full((len(query_vectors), top_k), -1, dtype=np.int64)
+        found_ids, vectors = self.vector_source(np.unique(candidate_ids[candidate_ids >= 0]))
+        if len(found_ids) == 0:
+            return distances, ids
+        order = np.argsort(found_ids)
+        found_ids, vectors = found_ids[order], vectors[order]
+        for row, (query, row_ids) in enumerate(zip(query_vectors, candidate_ids)):
+            pos = np.minimum(np.searchsorted(found_ids, row_ids), len(found_ids) - 1)
+            # 数据库中已删除、索引尚未同步的候选直接跳过
+            pos = pos[(row_ids >= 0) & (found_ids[pos] == row_ids)]
+            row_distances = ((vectors[pos] - query) ** 2).sum(axis=1)
+            best = np.argsort(row_distances, kind='stable')[:top_k]
+            distances[row, :len(best)] = row_distances[best]
+            ids[row, :len(best)] = found_ids[pos[best]]
+        return distances, ids
+
+    def reconstruct_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """按图片ID取回向量；二值初筛索引无法还原原始向量，从 vector_source 读取"""
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        if not self.binary_stage:
+            with self._lock:
+                return self.index.reconstruct_batch(ids)
+        found_ids, vectors = self.vector_source(np.unique(ids))
+        order = np.argsort(found_ids)
+        found_ids, vectors = found_ids[order], vectors[order]
+        pos = np.minimum(np.searchsorted(found_ids, ids), max(len(found_ids) - 1, 0))
+        missing = ids if len(found_ids) == 0 else ids[found_ids[pos] != ids]
+        if len(missing):
+            raise KeyError(f"无法读取图片 {missing[:10].tolist()} 的原始向量")
+        return vectors[pos]
+
+    def _transform_queries(self, query_vectors: np.ndarray) -> np.ndarray:
+        """按索引的降维变换投影查询向量，没有变换时原样返回（调用方持有 self._lock）"""
+        inner = faiss.downcast_index(self.index.index)
+        if isinstance(inner, faiss.IndexPreTransform):
+            for position in range(inner.chain.size()):
+                query_vectors = faiss.downcast_VectorTransform(inner.chain.at(position)).apply(query_vectors)
+        return query_vectors
+
+    def _touch_lists(self, query_vectors: np.ndarray):
+        """记录本次搜索探测的磁盘倒排表，超出内存预算时释放冷门倒排表（调用方持有 self._lock）"""
+        invlists = ondisk_lists(self.index)
+        if invlists is None:
+            return
+        ivf = faiss.extract_index_ivf(self.index)
+        _, list_nos = ivf.quantizer.search(self._transform_queries(query_vectors), ivf.nprobe)
+        self.list_cache.touch(invlists, np.unique(list_nos))
+
+    def _search_excluding_tombstones(self, query_vectors: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """在内层索引上按内部位置过滤墓碑后搜索，再映射回 product_images.id（调用方持有 self._lock）"""
+        if self._tombstone_selector is None:
+            self._tombstone_selector = faiss.IDSelectorNot(
+                faiss.IDSelectorBatch(np.array(sorted(self._tombstones), dtype=np.int64)))
+        return self._search_inner(query_vectors, top_k, self._tombstone_selector)
+
+    def _search_inner(self, query_vectors: np.ndarray, top_k: int, selector) -> Tuple[np.ndarray, np.ndarray]:
+        """在内层索引上只搜索选择器接受的内部位置，再映射回 product_images.id（调用方持有 self._lock）"""
+        # 降维变换不在 ID 选择器的作用范围内，先投影查询再在底层索引上搜索
+        query_vectors = self._transform_queries(query_vectors)
+        inner = base_index(self.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+        elif isinstance(inner, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        distances, positions = inner.search(query_vectors, top_k, params=params)
+        id_map = faiss.rev_swig_ptr(self.index.id_map.data(), self.index.id_map.size())
+        return distances, np.where(positions >= 0, id_map[np.maximum(positions, 0)], -1)
+
+    def add_vectors(self, ids: np.ndarray, vectors: np.ndarray):
+        """直接写入（或覆盖）内存索引中的向量，不经过数据库"""
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        with self._lock:
+            self._remove_ids(ids)
+            self._add_with_ids(vectors, ids)
+            self.generation += 1
+
+    def remove_vectors(self, ids: np.ndarray) -> int:
+        """从内存索引中删除向量，不经过数据库"""
+        with self._lock:
+            removed = self._remove_ids(ids)
+            self.generation += 1
+        return removed
+
+    def search_similar_images(self, image_path: str, top_k: int = 10, filters: Optional[dict] = None) -> list:
+        """
+        以图搜图
+        Args:
+            image_path: 查询图片路径
+            top_k: 返回的结果数量
+            filters: 过滤条件，目前只支持分区列，如 {'factory_name': ['工厂A', '工厂B']}，只在这些分区中搜索
+        """
+        partitions = self._resolve_partitions(filters)
+        if self._single_flight is None:
+            return self._search_similar_images(image_path, top_k, partitions)
+        key = (_file_digest(image_path), top_k, partitions)
+        results = self._single_flight.do(key, lambda: self._search_similar_images(image_path, top_k, partitions))
+        # 合并的请求共享同一个结果列表，各自返回副本
+        return [dict(item) for item in results]
+
+    def _resolve_partitions(self, filters: Optional[dict]) -> Optional[Tuple[str, ...]]:
+        """把过滤条件转换为要搜索的分区值，没有过滤条件时返回 None（搜索全库）"""
+        if not filters:
+            return None
+        unsupported = set(filters) - {self.partition_column}
+        if unsupported:
+            raise ValueError(f"不支持按 {', '.join(sorted(unsupported))} 过滤，"
+                             f"当前分区列为 {self.partition_column or '无'}")
+        values = filters[self.partition_column]
+        if isinstance(values, str):
+            values = [values]
+        return tuple(sorted({str(value) for value in values}))
+
+    def _search_similar_images(self, image_path: str, top_k: int, partitions: Optional[Tuple[str, ...]] = None) -> list:
+        self._ensure_fresh()
+        if self.ntotal == 0:
+            return []
+        exact = self._search_by_hash(image_path, top_k, partitions)
+        if len(exact) >= top_k:
+            return exact[:top_k]
+        if not exact:
+            return self._search_by_vector(image_path, top_k, partitions)
+        # 几乎相同的图片排在最前面，其余名额由向量检索补足；多取 len(exact) 个以便去掉重复的图片
+        seen = {item['image_path'] for item in exact}
+        nearest = [item for item in self._search_by_vector(image_path, top_k + len(exact), partitions)
+                   if item['image_path'] not in seen]
+        return exact + nearest[:top_k - len(exact)]
+
+    def _search_by_vector(self, image_path: str, top_k: int, partitions: Optional[Tuple[str, ...]] = None) -> list:
+        query_feature = self.extract_feature(image_path)
+        cache = self.result_cache
+        if cache is not None:
+            # 先读取 generation，搜索期间索引发生变化时写入的结果会在下次查找时失效
+            generation = self.generation
+            key = query_key(query_feature, top_k, {self.partition_column: partitions} if partitions is not None else None)
+            with SEARCH_STAGE_SECONDS.time(stage='cache_lookup'), span('cache.lookup') as cache_span:
+                cached = cache.get(key, generation, self._product_versions)
+                if cache_span is not None:
+                    cache_span.attributes['hit'] = cached is not None
+            if cached is not None:
+                return [dict(item) for item in cached]
+        if partitions is None:
+            with SEARCH_STAGE_SECONDS.time(stage='faiss_search'), span('faiss.search', k=top_k, ntotal=self.ntotal):
+                distances, faiss_indices = self.search_vectors(query_feature.reshape(1, -1), top_k)
+        else:
+            with SEARCH_STAGE_SECONDS.time(stage='faiss_search'), span('faiss.search', k=top_k, partitions=len(partitions)):
+                distances, faiss_indices = self.search_partitions(query_feature.reshape(1, -1), top_k, partitions)
+        with SEARCH_STAGE_SECONDS.time(stage='db_hydration'), span('index.hydrate'):
+            results = self._hydrate_results(faiss_indices[0], distances[0])
+        if cache is not None and results:
+            versions = self._product_versions([item['product_id'] for item in results])
+            cache.put(key, generation, [dict(item) for item in results], versions)
+        return results
+
+    def search_partitions(self, query_vectors: np.ndarray, top_k: int, partitions) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        只在给定分区中搜索，返回格式与 search_vectors 相同。
+        在主索引上用 ID 选择器只保留分区内的图片；不支持选择器的索引类型（PQ、二值初筛、NSG、NumpyIndex）
+        先多取候选再过滤
+        """
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32).reshape(-1, self.dimension)
+        with self._lock:
+            allowed = self.partitions.members(partitions)
+            binary_stage = self.binary_stage
+            candidates = max(top_k, self.rerank_candidates) if binary_stage else top_k
+            if len(allowed) == 0:
+                return (np.full((len(query_vectors), top_k), np.inf, dtype=np.float32),
+                        np.full((len(query_vectors), top_k), -1, dtype=np.int64))
+            if isinstance(base_index(self.index), SELECTOR_INDEX_TYPES):
+                distances, ids = self._search_selected(query_vectors, candidates, allowed)
+            else:
+                distances, ids = self._search_post_filter(query_vectors, candidates, allowed)
+            if self.list_cache is not None:
+                self._touch_lists(query_vectors)
+        return self._finish_search(query_vectors, distances, ids, top_k, binary_stage)
+
+    def _search_selected(self, query_vectors: np.ndarray, top_k: int, allowed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """只搜索 allowed 中的图片（调用方持有 self._lock）"""
+        if self._positions is not None:
+            # 使用墓碑的索引按内部位置选择，已删除的旧位置不在 _positions 中
+            positions = np.array([self._positions[image_id] for image_id in allowed.tolist()
+                                  if image_id in self._positions], dtype=np.int64)
+            return self._search_inner(query_vectors, top_k, faiss.IDSelectorBatch(positions))
+        # 选择器作用于底层索引的内部位置，经 id_map 换算为图片ID后再判断
+        batch = faiss.IDSelectorBatch(allowed)
+        return self._search_inner(query_vectors, top_k, faiss.IDSelectorTranslated(self.index.id_map, batch))
+
+    def _search_post_filter(self, query_vectors: np.ndarray, top_k: int, allowed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """按分区占比多取候选后只保留 allowed 中的图片，不足时扩大候选数直到覆盖全库（调用方持有 self._lock）"""
+        total = self.index.ntotal
+        fetch = min(total, max(top_k * 4, top_k * total // len(allowed)))
+        while True:
+            distances, ids = self.index.search(query_vectors, fetch)
+            keep = np.isin(ids, allowed)
+            if fetch >= total or (keep.sum(axis=1) >= top_k).all():
+                break
+            fetch = min(total, fetch * 4)
+        result_distances = np.full((len(query_vectors), top_k), np.inf, dtype=np.float32)
+        result_ids = np.full((len(query_vectors), top_k), -1, dtype=np.int64)
+        for row in range(len(query_vectors)):
+            columns = np.flatnonzero(keep[row])[:top_k]
+            result_distances[row, :len(columns)] = distances[row, columns]
+            result_ids[row, :len(columns)] = ids[row, columns]
+        return result_distances, result_ids
+
+    def _search_by_hash(self, image_path: str, top_k: int, partitions: Optional[Tuple[str, ...]] = None) -> list:
+        """按 dHash 查找商品库中几乎相同的图片，不足 top_k 个时由调用方用向量检索补足"""
+        if self.hash_index is None or len(self.hash_index) == 0:
+            return []
+        with SEARCH_STAGE_SECONDS.time(stage='phash_lookup'), span('phash.lookup') as lookup_span:
+            try:
+                matches = self.hash_index.search(image_hash(image_path), top_k if partitions is None else len(self.hash_index))
+            except Exception as e:
+                print(f"计算查询图片的感知哈希失败，使用向量检索: {e}")
+                matches = []
+            if partitions is not None:
+                with self._lock:
+                    matches = [match for match in matches if self.partitions.partition_of(match[0]) in partitions][:top_k]
+            if lookup_span is not None:
+                lookup_span.attributes['matches'] = len(matches)
+        CACHE_REQUESTS.inc(cache='phash', result='hit' if matches else 'miss')
+        if not matches:
+            return []
+        with SEARCH_STAGE_SECONDS.time(stage='db_hydration'), span('index.hydrate'):
+            return self._hydrate_results(np.array([image_id for image_id, _ in matches], dtype=np.int64),
+                                         np.array([distance for _, distance in matches], dtype=np.float32),
+                                         self._hash_similarity)
+
+    def _hash_similarity(self, distance: float) -> float:
+        """汉明距离换算为相似度：1 - 距离 / 哈希位数，完全相同为 1.0，阈值内的匹配都高于向量检索的结果"""
+        return 1.0 - distance / HASH_BITS
+
+    def _product_versions(self, product_ids: List[int]) -> Dict[int, Any]:
+        """按主键查询商品的 updated_at，用于核对缓存结果中的商品是否被修改或删除"""
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return {}
+        with self.db.connect() as conn:
+            placeholders = ','.join(['%s'] * len(product_ids))
+            rows = conn.exec_driver_sql(f"SELECT id, updated_at FROM products WHERE id IN ({placeholders})",
+                                        tuple(product_ids)).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def _hydrate_results(self, faiss_ids: np.ndarray, distances: np.ndarray,
+                         to_similarity: Optional[Callable[[float], float]] = None) -> list:
+        """
+        根据搜索得到的 product_images.id 查询商品ID和图片路径
+        Args:
+            to_similarity: 距离换算为相似度的函数，默认按 L2 距离换算（_distance_to_similarity）
+        """
+        to_similarity = to_similarity or self._distance_to_similarity
+        product_images_ids_to_fetch = []
+        # 使用字典临时存储每个 product_images.id 对应的原始距离
+        temp_distance_map = {}
+
+        for i in range(len(faiss_ids)):
+            product_image_db_id = int(faiss_ids[i]) # 这是 product_images.id
+            dist = float(distances[i])
+            if product_image_db_id == -1:  # 结果不足 top_k 时以 -1 填充
+                continue
+            product_images_ids_to_fetch.append(product_image_db_id)
+            temp_distance_map[product_image_db_id] = dist
+
+        if not product_images_ids_to_fetch:
+            return []
+
+        final_results = []
+        try:
+            with self.db.connect() as conn:
+                # 为 IN 子句构建占位符
+                placeholders = ','.join(['%s'] * len(product_images_ids_to_fetch))
+                sql = f"SELECT id, product_id, image_path FROM product_images WHERE id IN ({placeholders})"
+                
+                db_rows = conn.exec_driver_sql(sql, tuple(product_images_ids_to_fetch)).mappings().all()
+
+                for row in db_rows:
+                    product_image_id = row['id'] # product_images.id
+                    distance = temp_distance_map.get(product_image_id)
+                    
+                    if distance is not None:
+                        similarity = to_similarity(distance)
+                        final_results.append({
+                            'product_id': row['product_id'],       # products.id
+                            'image_path': row['image_path'], # product_images.image_path
+                            'similarity': similarity
+                        })
+        except SQLAlchemyError as e:
+            print(f"数据库查询错误 (_hydrate_results): {e}")
+            # 根据错误处理策略，可能返回空列表或重新抛出异常
+            return []
+        
+        # 按相似度降序排序结果
+        final_results.sort(key=lambda x: x['similarity'], reverse=True)
+        
+        return final_results
+    
+    def warm_up(self, num_queries: Optional[int] = None) -> dict:
+        """
+        预热索引：逐页读取向量数据，再用索引中已有的向量执行若干次搜索，
+        让部署后的首批请求不再承担缺页和 FAISS 的延迟分配
+        Args:
+            num_queries: 合成查询数，默认取 INDEX_WARMUP_QUERIES
+        Returns:
+            dict: 预热后的状态，同 warmup_status()
+        """
+        num_queries = INDEX_WARMUP_QUERIES if num_queries is None else num_queries
+        self.warmup_state = 'warming'
+        self.warmup_error = None
+        start = time.perf_counter()
+        try:
+            touched = self._touch_pages()
+            queries = self._warmup_queries(num_queries)
+            if len(queries):
+                # 单条与批量查询各执行一次，覆盖批处理线程和多查询两条路径
+                self.search_vectors(queries[:1], 10)
+                self.search_vectors(queries, 10)
+        except Exception as e:
+            self.warmup_state = 'failed'
+            self.warmup_error = str(e)
+            print(f"索引预热失败: {e}")
+            raise
+        self.warmup_seconds = time.perf_counter() - start
+        self.warmup_state = 'ready'
+        print(f"索引预热完成：读取 {touched} 字节向量数据，执行 {len(queries)} 次合成查询，耗时 {self.warmup_seconds:.2f} 秒。")
+        return self.warmup_status()
+
+    def warmup_status(self) -> dict:
+        """预热状态及索引概况，供 /readyz 使用"""
+        return {
+            'state': self.warmup_state,
+            'warmup_seconds': self.warmup_seconds,
+            'error': self.warmup_error,
+            'generation': self.generation,
+            'ntotal': int(self.ntotal),
+            'partitions': len(self.partitions) if self.partitions is not None else None,
+            'ondisk': self.list_cache.stats() if self.list_cache is not None else None,
+            'representatives': ({'products': len(self._product_representatives),
+                                 'images': len(self._representative_product)}
+                                if self.representatives is not None else None),
+        }
+
+    def _touch_pages(self) -> int:
+        """按页读取索引的向量存储，返回涉及的字节数；没有连续向量存储的索引类型返回 0"""
+        with self._lock:
+            inner = base_index(self.index)
+            if isinstance(inner, NumpyIndex):
+                view = inner.storage.reshape(-1).view(np.uint8)
+                int(view[::PAGE_SIZE].sum())
+                return int(view.size)
+            if isinstance(inner, faiss.IndexHNSW):
+                inner = faiss.downcast_index(inner.storage)
+            codes = getattr(inner, 'codes', None)
+            if codes is None or codes.size() == 0:
+                return 0
+            view = faiss.rev_swig_ptr(codes.data(), codes.size())
+            # 每页读一个字节即可触发缺页，不复制数据
+            int(view[::PAGE_SIZE].sum())
+            return codes.size()
+
+    def _warmup_queries(self, num_queries: int) -> np.ndarray:
+        """从索引中抽取已有向量作为合成查询，分布与真实查询接近"""
+        with self._lock:
+            if self.ntotal == 0 or num_queries <= 0:
+                return np.empty((0, self.dimension), dtype=np.float32)
+            ids = self.live_ids()
+            sample = np.random.default_rng().choice(ids, size=min(num_queries, len(ids)), replace=False)
+        return self.reconstruct_vectors(sample)
+
+    def save_index(self, index_path: str):
+        """保存FAISS索引到文件，存在墓碑时一并写入 <index_path>.tombstones.npy"""
+        with self._lock:
+            if isinstance(self.index, NumpyIndex):
+                with open(index_path, 'wb') as f:
+                    f.write(self.index.serialize().tobytes())
+            else:
+                faiss.write_index(self.index, index_path)
+            tombstones_path = index_path + '.tombstones.npy'
+            if self._tombstones:
+                np.save(tombstones_path, np.array(sorted(self._tombstones), dtype=np.int64))
+            elif os.path.exists(tombstones_path):
+                os.remove(tombstones_path)
+    
+    def load_index(self, index_path: str):
+        """从文件加载FAISS索引"""
+        index = read_index(index_path)
+        tombstones_path = index_path + '.tombstones.npy'
+        tombstones = np.load(tombstones_path) if os.path.exists(tombstones_path) else ()
+        with self._lock:
+            self._set_index(index, tombstones)
+            self.generation += 1
+
+    def __del__(self):
+        if getattr(self, '_owns_engine', False):
+            self.db.engine.dispose()
+        if getattr(self, '_wal', None) is not None:
+            self._wal.close()
@@ -0,0 +1,197 @@
+"""
+商品导入与建索引的吞吐基准测试。
+
+生成合成商品目录（CSV + 按商品名分文件夹的图片），依次调用 /api/products/upload_csv
+和 /api/products/build-vector-index，特征提取使用模拟延迟的 FakeEmbedder，
+报告每秒商品数、每秒图片数以及各阶段（读取 CSV、数据库查询/提交、复制图片、特征提取）的耗时。
+
+用法:
+    python -m product_search.ingest_benchmark --products 500 --images-per-product 3
+    python -m product_search.ingest_benchmark --products 200 --embed-latency-ms 300 --output ingest.json
+    python -m product_search.ingest_benchmark --database-url mysql+pymysql://root:pw@localhost/bench
+
+默认使用临时目录中的 SQLite 文件数据库；--database-url 指向本地 MySQL 时会在该库中建表并写入数据，
+请使用专门的空测试库（商品ID从1开始，重复运行前需清空）。
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+def generate_catalog(workdir: str, num_products: int, images_per_product: int, image_size: int = 256,
+                     start_id: int = 1, seed: int = 0):
+    """
+    生成合成商品目录
+    Returns:
+        (csv_path, images_folder): images_folder/<商品名>/ 下为该商品的图片，与 upload_csv 的约定一致
+    """
+    from PIL import Image
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    images_folder = os.path.join(workdir, 'images')
+    os.makedirs(images_folder, exist_ok=True)
+    csv_path = os.path.join(workdir, 'catalog.csv')
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'name', 'price', 'sale_price', 'factory_name', '颜色', '尺码', '风格'])
+        for offset in range(num_products):
+            product_id = start_id + offset
+            name = f'基准商品{product_id:07d}'
+            writer.writerow([product_id, name, f'{rng.uniform(50, 500):.2f}', f'{rng.uniform(30, 400):.2f}',
+                             f'工厂{product_id % 17}', rng.choice(['红', '蓝', '黑']), 'S,M,L', '通勤'])
+            folder = os.path.join(images_folder, name)
+            os.makedirs(folder, exist_ok=True)
+            for i in range(images_per_product):
+                # 随机色块加噪声，保证每张图片内容（以及 FakeEmbedder 生成的向量）不同
+                base = rng.integers(0, 256, 3, dtype=np.uint8)
+                noise = rng.integers(0, 32, (image_size, image_size, 3), dtype=np.uint8)
+                Image.fromarray(base + noise, 'RGB').save(os.path.join(folder, f'{i}.jpg'), quality=85)
+    return csv_path, images_folder
+
+def _read_sse_events(response):
+    events = []
+    for chunk in response.response:
+        text = chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        for line in text.splitlines():
+            if line.startswith('data: '):
+                events.append(json.loads(line[len('data: '):]))
+    return events
+
+def _breakdown(timings: dict, wall: float) -> dict:
+    """各阶段耗时及占比，未计入任何阶段的时间记为 other"""
+    stages = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    stages['other'] = round(max(wall - sum(timings.values()), 0.0), 4)
+    return {stage: {'seconds': seconds, 'share': round(seconds / wall, 4) if wall else 0.0}
+            for stage, seconds in stages.items()}
+
+def run(num_products: int, images_per_product: int, database_url: str = None, workdir: str = None,
+        image_size: int = 256, embed_latency_ms: float = 200, embed_jitter_ms: float = 50) -> dict:
+    """
+    生成目录并执行导入和建索引，返回可直接序列化为 JSON 的报告
+    Args:
+        database_url: SQLAlchemy 数据库 URL，默认为 workdir 下的 SQLite 文件
+        workdir: 目录、图片和上传文件的存放位置，默认使用临时目录并在结束后删除
+    """
+    cleanup = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='ingest-bench-')
+    database_url = database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    # 以下配置在导入应用和索引模块时读取，必须先于导入设置
+    os.environ.update({
+        'TEST_DATABASE_URL': database_url,
+        'INDEX_EMBEDDER': 'fake',
+        'FAKE_EMBEDDING_LATENCY_MS': str(embed_latency_ms),
+        'FAKE_EMBEDDING_JITTER_MS': str(embed_jitter_ms),
+        'INDEX_SYNC_INTERVAL': '0',
+        'INDEX_WARMUP': '0',
+        'INDEX_REPLICATION_DIR': '',
+    })
+    os.environ.pop('INDEX_SERVER_ADDRESS', None)
+    from app import create_app
+    from models import db
+    from product_search import get_product_index
+
+    try:
+        start = time.perf_counter()
+        csv_path, images_folder = generate_catalog(workdir, num_products, images_per_product, image_size)
+        generate_seconds = time.perf_counter() - start
+
+        app = create_app('testing')
+        app.config['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+        client = app.test_client()
+        with app.app_context():
+            db.create_all()
+
+            with open(csv_path, 'rb') as f:
+                payload = {'csv_file': (io.BytesIO(f.read()), 'catalog.csv'), 'images_folder': images_folder}
+            start = time.perf_counter()
+            response = client.post('/api/products/upload_csv', data=payload, content_type='multipart/form-data')
+            import_seconds = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError(f"upload_csv 失败: {response.get_data(as_text=True)}")
+            import_stats = response.get_json()['stats']
+
+            start = time.perf_counter()
+            response = client.get('/api/products/build-vector-index')
+            events = _read_sse_events(response)
+            build_seconds = time.perf_counter() - start
+            complete = next((e for e in events if e['type'] == 'complete'), None)
+            if complete is None:
+                raise RuntimeError(f"建索引失败: {events[-1] if events else '无响应'}")
+
+            index = get_product_index(db.engine)
+            sync_seconds = None
+            if db.engine.dialect.name == 'mysql':
+                # 变更日志的 SQL 使用 MySQL 语法，SQLite 上不测量索引追平耗时
+                start = time.perf_counter()
+                index.sync_changes()
+                sync_seconds = round(time.perf_counter() - start, 4)
+            embedder_stats = index.embedder.stats()
+            dialect = db.engine.dialect.name
+            db.session.remove()
+
+        images = import_stats['images']
+        return {
+            'dataset': {
+                'products': num_products,
+                'images_per_product': images_per_product,
+                'image_size': image_size,
+                'database': dialect,
+                'generate_seconds': round(generate_seconds, 3),
+            },
+            'embedder': {'latency_ms': embed_latency_ms, 'jitter_ms': embed_jitter_ms, **embedder_stats},
+            'import': {
+                'seconds': round(import_seconds, 3),
+                'success': import_stats['success'],
+                'failed': import_stats['failed'],
+                'images': images,
+                'products_per_sec': round(import_stats['success'] / import_seconds, 2),
+                'images_per_sec': round(images / import_seconds, 2),
+                'stages': _breakdown(import_stats['timings'], import_seconds),
+            },
+            'build_index': {
+                'seconds': round(build_seconds, 3),
+                'products': complete['products_processed'],
+                'images': complete['images_indexed'],
+                'errors': len(complete['errors']),
+                'products_per_sec': round(complete['products_processed'] / build_seconds, 2),
+                'images_per_sec': round(complete['images_indexed'] / build_seconds, 2),
+                'stages': _breakdown(complete['timings'], build_seconds),
+                'sync_seconds': sync_seconds,
+                'ntotal_after_sync': int(index.ntotal) if sync_seconds is not None else None,
+            },
+        }
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='商品导入与建索引吞吐基准测试')
+    parser.add_argument('--products', type=int, default=200, help='合成商品数')
+    parser.add_argument('--images-per-product', type=int, default=3)
+    parser.add_argument('--image-size', type=int, default=256, help='合成图片边长（像素）')
+    parser.add_argument('--database-url', help='SQLAlchemy 数据库 URL，默认使用临时 SQLite 文件')
+    parser.add_argument('--workdir', help='保留生成的目录和上传文件的位置，默认使用临时目录并在结束后删除')
+    parser.add_argument('--embed-latency-ms', type=float, default=200, help='模拟的特征提取延迟（毫秒）')
+    parser.add_argument('--embed-jitter-ms', type=float, default=50, help='特征提取延迟的随机波动（毫秒）')
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    args = parser.parse_args(argv)
+
+    report = run(args.products, args.images_per_product, args.database_url, args.workdir,
+                 args.image_size, args.embed_latency_ms, args.embed_jitter_ms)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"结果已写入 {args.output}")
+    else:
+        print(output)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+进程内指标与 Prometheus 文本格式输出。
+
+计数器、仪表和直方图都保存在本进程内存中，记录一次只是一次加锁的加法（直方图另加一次二分查找），
+可以放在搜索热路径上。GET /metrics 按 Prometheus 文本格式（0.0.4）输出；
+多个 gunicorn worker 各自计数，由 Prometheus 按实例抓取后聚合。
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# 默认直方图分桶（秒），覆盖从亚毫秒级的 FAISS 搜索到数秒级的外部 API 调用
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels: dict) -> Tuple:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.type_name}'
+        yield from self._samples()
+
+    def _samples(self):
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """只增不减的计数"""
+    type_name = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+class Gauge(_Metric):
+    """
+    可增可减的当前值；传入 callback 时在输出时调用它取值（用于索引大小等已有状态），
+    callback 返回 None 或抛出异常时不输出该指标
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], Optional[float]]] = None, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                return
+            if value is not None:
+                yield f'{self.name} {_format_value(value)}'
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+class Histogram(_Metric):
+    """按固定分桶累计观测值的分布（Prometheus 的 _bucket/_sum/_count）"""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # 每个标签组合: [各分桶计数（非累计，最后一个为 +Inf）, 总和]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][position] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 块的耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _index_value(attribute: str):
+    # 只读取已创建的索引，抓取指标不会触发索引加载
+    from . import peek_product_index
+    index = peek_product_index()
+    return None if index is None else getattr(index, attribute)
+
+# 图片搜索各阶段: upload_read（保存上传图片）、faiss_search、db_hydration（查询图片记录）、
+# phash_lookup（感知哈希查找）、cache_lookup（结果缓存）、product_lookup（查询商品）、serialization（生成响应）；特征提取的阶段见 EMBEDDING_STAGE_SECONDS
+SEARCH_STAGE_SECONDS = Histogram('product_search_stage_seconds', '图片搜索各阶段耗时', ['stage'])
+SEARCH_SECONDS = Histogram('product_search_request_seconds', '图片搜索请求总耗时')
+SEARCH_REQUESTS = Counter('product_search_requests_total', '图片搜索请求数', ['status'])
+
+# 特征提取: preprocess（图片解码与编码）、rate_limit_wait（限速等待与重试退避）、api_call（调用接口）
+EMBEDDING_STAGE_SECONDS = Histogram('embedding_stage_seconds', '特征提取各阶段耗时', ['backend', 'stage'])
+EMBEDDING_REQUESTS = Counter('embedding_requests_total', '特征提取调用数', ['backend', 'status'])
+DASHSCOPE_ERRORS = Counter('dashscope_errors_total', 'DashScope 接口错误数', ['reason'])
+
+# 导入吞吐: source 为 csv（upload_csv 导入商品和复制图片）或 index（提取特征写入 product_images）
+INGEST_PRODUCTS = Counter('ingest_products_total', '导入的商品数', ['source'])
+INGEST_IMAGES = Counter('ingest_images_total', '导入的图片数', ['source'])
+INGEST_STAGE_SECONDS = Counter('ingest_stage_seconds_total', '导入各阶段累计耗时（秒）', ['source', 'stage'])
+
+# 缓存命中: cache 为缓存名称（search_results、phash、ivf_lists 磁盘倒排表），result 为 hit、miss 或 stale（条目已失效：索引 generation 变化、过期或商品已被修改）
+CACHE_REQUESTS = Counter('cache_requests_total', '缓存查询数', ['cache', 'result'])
+
+# 相同查询合并: role 为 leader（实际执行）、follower（共享结果）或 timeout（等待超时后自行执行）
+COALESCE_REQUESTS = Counter('search_coalesce_requests_total', '相同查询的并发合并情况', ['role'])
+
+INDEX_VECTORS = Gauge('product_index_vectors', '向量索引中的向量数', callback=lambda: _index_value('ntotal'))
+INDEX_GENERATION = Gauge('product_index_generation', '向量索引内容版本', callback=lambda: _index_value('generation'))
+
+def render() -> str:
+    return REGISTRY.render()
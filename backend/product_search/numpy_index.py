@@ -0,0 +1,192 @@
+"""
+纯 NumPy 实现的精确检索引擎。
+
+没有可用的 faiss 安装包的平台，或排查 faiss 问题时，VectorProductIndex 可以改用该引擎
+（index_factory 为 NumpyFlat 或 NumpyFlat16；无法导入 faiss 时自动使用 NumpyFlat）。
+NumpyIndex 实现了 VectorProductIndex 用到的 faiss.IndexIDMap2 接口子集:
+    - 向量按行连续存放在 float32（或 float16，内存减半）数组中，行号到 product_images.id 的映射与有效标记另存
+    - 搜索按块计算 ||x||^2 - 2 q·x + ||q||^2（矩阵乘积走 BLAS），每块用 argpartition 取前 k 个再合并，
+      块分给线程池并行计算（矩阵乘积期间释放 GIL）
+    - 删除只标记无效行，无效行超过一半时压缩数组
+"""
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+METRIC_L2 = 1  # 与 faiss.METRIC_L2 相同
+NUMPY_BLOCK_SIZE = 65536  # 每块的向量数，单块距离矩阵占用 查询数 * block_size * 4 字节
+NUMPY_FACTORIES = {'NumpyFlat': 'float32', 'NumpyFlat16': 'float16'}
+
+class NumpyIndex:
+    """按ID增删的精确 L2 索引，接口与 faiss.IndexIDMap2(faiss.IndexFlatL2) 一致。不加锁，由调用方保护写入"""
+    MAGIC = b'NUMPYIDX'
+
+    def __init__(self, d: int, dtype: str = 'float32', block_size: int = NUMPY_BLOCK_SIZE, threads: int = 1):
+        """
+        Args:
+            d: 向量维度
+            dtype: 存储类型 float32 或 float16，计算时按块转换为 float32
+            block_size: 每块的向量数
+            threads: 并行计算的线程数
+        """
+        self.d = d
+        self.dtype = np.dtype(dtype)
+        self.block_size = block_size
+        self.threads = threads
+        self.metric_type = METRIC_L2
+        self.is_trained = True
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._vectors = np.empty((0, self.d), dtype=self.dtype)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._live = np.empty(0, dtype=bool)
+        self._size = 0
+        self._rows: Dict[int, int] = {}
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._rows)
+
+    @property
+    def storage(self) -> np.ndarray:
+        """已使用的向量存储（含已删除的行）"""
+        return self._vectors[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._vectors.nbytes + self._norms.nbytes + self._ids.nbytes + self._live.nbytes)
+
+    def train(self, vectors: np.ndarray):
+        """精确索引不需要训练"""
+
+    def _reserve(self, count: int):
+        capacity = len(self._vectors)
+        if self._size + count <= capacity:
+            return
+        capacity = max(self._size + count, capacity * 2, 1024)
+        for name in ('_vectors', '_norms', '_ids', '_live'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.d)
+        ids = np.asarray(ids, dtype=np.int64)
+        self.remove_ids(ids)
+        self._reserve(len(ids))
+        start, end = self._size, self._size + len(ids)
+        self._vectors[start:end] = vectors
+        # 范数按存储后的值计算，与搜索时使用的向量一致
+        stored = self._vectors[start:end].astype(np.float32)
+        self._norms[start:end] = np.einsum('ij,ij->i', stored, stored)
+        self._ids[start:end] = ids
+        self._live[start:end] = True
+        self._rows.update((int(image_id), row) for row, image_id in enumerate(ids, start=start))
+        self._size = end
+
+    def remove_ids(self, ids: Iterable[int]) -> int:
+        removed = 0
+        for image_id in np.asarray(ids, dtype=np.int64).ravel():
+            row = self._rows.pop(int(image_id), None)
+            if row is not None:
+                self._live[row] = False
+                removed += 1
+        if removed and self._size - len(self._rows) > max(self._size // 2, 1024):
+            self._compact()
+        return removed
+
+    def _compact(self):
+        keep = np.flatnonzero(self._live[:self._size])
+        for name in ('_vectors', '_norms', '_ids', '_live'):
+            setattr(self, name, np.ascontiguousarray(getattr(self, name)[keep]))
+        self._size = len(keep)
+        self._rows = {int(image_id): row for row, image_id in enumerate(self._ids)}
+
+    def live_ids(self) -> np.ndarray:
+        return np.sort(self._ids[:self._size][self._live[:self._size]])
+
+    def reconstruct_batch(self, ids: np.ndarray) -> np.ndarray:
+        rows = [self._rows[int(image_id)] for image_id in np.asarray(ids, dtype=np.int64).ravel()]
+        return self._vectors[rows].astype(np.float32)
+
+    def _search_block(self, query_vectors: np.ndarray, query_norms: np.ndarray, start: int, top_k: int):
+        end = min(start + self.block_size, self._size)
+        block = self._vectors[start:end]
+        if block.dtype != np.float32:
+            block = block.astype(np.float32)
+        distances = query_vectors @ block.T
+        distances *= -2
+        distances += self._norms[start:end]
+        distances += query_norms[:, None]
+        np.maximum(distances, 0, out=distances)
+        distances[:, ~self._live[start:end]] = np.inf
+        k = min(top_k, end - start)
+        rows = np.argpartition(distances, k - 1, axis=1)[:, :k] if k < end - start else \
+            np.broadcast_to(np.arange(end - start), distances.shape)
+        return np.take_along_axis(distances, rows, axis=1), rows + start
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='numpy-index')
+            return self._pool
+
+    def search(self, query_vectors: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        精确搜索
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (L2 距离的平方, ID)，不足 top_k 时距离为 inf、ID 为 -1
+        """
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32).reshape(-1, self.d)
+        count = len(query_vectors)
+        distances = np.full((count, top_k), np.inf, dtype=np.float32)
+        ids = np.full((count, top_k), -1, dtype=np.int64)
+        if top_k <= 0 or self._size == 0 or count == 0:
+            return distances, ids
+        query_norms = np.einsum('ij,ij->i', query_vectors, query_vectors)
+        starts = range(0, self._size, self.block_size)
+        if self.threads > 1 and len(starts) > 1:
+            parts = list(self._executor().map(lambda start: self._search_block(query_vectors, query_norms, start, top_k), starts))
+        else:
+            parts = [self._search_block(query_vectors, query_norms, start, top_k) for start in starts]
+        block_distances = np.hstack([part[0] for part in parts])
+        block_rows = np.hstack([part[1] for part in parts])
+        order = np.argsort(block_distances, axis=1, kind='stable')[:, :top_k]
+        best = np.take_along_axis(block_distances, order, axis=1)
+        rows = np.take_along_axis(block_rows, order, axis=1)
+        width = best.shape[1]
+        distances[:, :width] = best
+        ids[:, :width] = np.where(np.isfinite(best), self._ids[rows], -1)
+        return distances, ids
+
+    def serialize(self) -> np.ndarray:
+        """序列化为字节数组（只保存有效行），与 faiss.serialize_index 的返回类型相同"""
+        live = self._live[:self._size]
+        buffer = io.BytesIO()
+        buffer.write(self.MAGIC)
+        np.savez(buffer, d=self.d, dtype=str(self.dtype), ids=self._ids[:self._size][live],
+                 vectors=self._vectors[:self._size][live])
+        return np.frombuffer(buffer.getvalue(), dtype=np.uint8)
+
+    @classmethod
+    def deserialize(cls, data, block_size: int = NUMPY_BLOCK_SIZE, threads: int = 1) -> 'NumpyIndex':
+        data = bytes(data)
+        if not data.startswith(cls.MAGIC):
+            raise ValueError("不是 NumpyIndex 序列化数据")
+        with np.load(io.BytesIO(data[len(cls.MAGIC):])) as arrays:
+            index = cls(int(arrays['d']), str(arrays['dtype']), block_size, threads)
+            index.add_with_ids(arrays['vectors'], arrays['ids'])
+        return index
+
+    @classmethod
+    def is_serialized(cls, path: str) -> bool:
+        with open(path, 'rb') as f:
+            return f.read(len(cls.MAGIC)) == cls.MAGIC
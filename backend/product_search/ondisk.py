@@ -0,0 +1,146 @@
+"""
+磁盘倒排表。
+
+IVF 类索引的内存主要是倒排表中的向量编码，粗量化器（聚类中心）只占 nlist * dimension * 4 字节。
+配置 INDEX_ONDISK_DIR 后，倒排表改用 faiss.OnDiskInvertedLists 存放在该目录的文件中并以 mmap 访问，
+常驻内存的只有粗量化器和ID映射，商品库可以远大于容器内存。
+
+mmap 读过的页会一直计入进程内存，直到内核回收。ListCache 按最近使用记录每次搜索探测的倒排表，
+总大小超过内存预算（INDEX_ONDISK_CACHE_MB）时对最久未用的倒排表调用 madvise(MADV_DONTNEED)
+释放其页面，热点倒排表留在内存中，延迟可预期。
+"""
+import ctypes
+import ctypes.util
+import glob
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from .metrics import CACHE_REQUESTS
+
+_PAGE_SIZE = mmap.PAGESIZE
+_ID_SIZE = 8  # 倒排表中每个向量的ID（int64）
+_file_seq = 0
+_file_lock = threading.Lock()
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _madvise = _libc.madvise
+    _madvise.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+except (OSError, AttributeError):
+    _madvise = None
+
+def _extract_ivf(index):
+    if faiss is None or not isinstance(index, faiss.Index):
+        return None
+    return faiss.try_extract_index_ivf(index)
+
+def ondisk_lists(index) -> Optional['faiss.OnDiskInvertedLists']:
+    """索引使用的磁盘倒排表，不是 IVF 或倒排表在内存中时返回 None"""
+    ivf = _extract_ivf(index)
+    if ivf is None:
+        return None
+    invlists = faiss.downcast_InvertedLists(ivf.invlists)
+    return invlists if isinstance(invlists, faiss.OnDiskInvertedLists) else None
+
+def attach_ondisk_lists(index, directory: str) -> Optional[str]:
+    """
+    把空 IVF 索引的倒排表换成目录中新建的磁盘文件
+    Returns:
+        Optional[str]: 倒排表文件路径，索引不是 IVF 类型时返回 None
+    """
+    global _file_seq
+    ivf = _extract_ivf(index)
+    if ivf is None:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    with _file_lock:
+        _file_seq += 1
+        # 每个进程（gunicorn worker）各自的索引使用不同的文件
+        path = os.path.join(directory, f"lists-{os.getpid()}-{_file_seq}.ivfdata")
+    invlists = faiss.OnDiskInvertedLists(ivf.nlist, ivf.code_size, path)
+    ivf.replace_invlists(invlists, True)
+    invlists.thisown = False  # 由索引释放
+    return path
+
+def remove_stale_files(directory: str):
+    """删除已退出进程留下的倒排表文件"""
+    for path in glob.glob(os.path.join(directory, 'lists-*.ivfdata')):
+        try:
+            pid = int(os.path.basename(path).split('-')[1])
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            os.remove(path)
+        except (ValueError, IndexError, PermissionError, OSError):
+            continue
+
+class ListCache:
+    """磁盘倒排表的常驻内存预算，按最近使用释放冷门倒排表的页面。不加锁，由 VectorProductIndex 的锁保护"""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._lists: 'OrderedDict[int, int]' = OrderedDict()  # 倒排表编号 -> 字节数
+        self._resident = 0
+        self._mapping = None  # (地址, 文件大小)，文件扩容后重新映射，之前的记录全部失效
+        self.evictions = 0
+
+    def _list_range(self, invlists, list_no: int):
+        entry = invlists.lists.at(int(list_no))
+        return int(entry.offset), int(entry.capacity) * (invlists.code_size + _ID_SIZE)
+
+    def _check_mapping(self, invlists):
+        mapping = (int(invlists.ptr), int(invlists.totsize))
+        if mapping != self._mapping:
+            self._mapping = mapping
+            self._lists.clear()
+            self._resident = 0
+
+    def touch(self, invlists, list_nos: Iterable[int]):
+        """记录搜索探测的倒排表，超出预算时释放最久未用的倒排表"""
+        self._check_mapping(invlists)
+        for list_no in list_nos:
+            list_no = int(list_no)
+            if list_no < 0:
+                continue
+            size = self._list_range(invlists, list_no)[1]
+            old = self._lists.pop(list_no, None)
+            CACHE_REQUESTS.inc(cache='ivf_lists', result='miss' if old is None else 'hit')
+            self._lists[list_no] = size
+            self._resident += size - (old or 0)
+        while self._resident > self.budget_bytes and len(self._lists) > 1:
+            list_no, size = self._lists.popitem(last=False)
+            self._resident -= size
+            self._release(invlists, *self._list_range(invlists, list_no))
+            self.evictions += 1
+
+    def release_all(self, invlists):
+        """释放整个文件的页面，用于全量写入之后"""
+        self._check_mapping(invlists)
+        self._lists.clear()
+        self._resident = 0
+        self._release(invlists, 0, int(invlists.totsize))
+
+    def _release(self, invlists, offset: int, length: int):
+        if _madvise is None or length <= 0:
+            return
+        # MAP_SHARED 文件映射上的 MADV_DONTNEED 只解除映射，脏页仍会写回文件
+        start = int(invlists.ptr) + offset
+        aligned = start - start % _PAGE_SIZE
+        length = min(start + length, int(invlists.ptr) + int(invlists.totsize)) - aligned
+        if length > 0:
+            _madvise(aligned, length, mmap.MADV_DONTNEED)
+
+    def stats(self) -> dict:
+        return {
+            'budget_bytes': self.budget_bytes,
+            'resident_bytes': self._resident,
+            'lists': len(self._lists),
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,70 @@
+"""
+按商品属性划分的索引分区。
+
+采购通常只在一个工厂（factory_name）或一个季节（launch_season）内找货，全库搜索既浪费也会被其他分区的结果挤占。
+配置 INDEX_PARTITION_COLUMN 后，VectorProductIndex 按该 Product 列的取值记录每张图片所属的分区，
+带过滤条件的搜索仍在主索引上进行，用 ID 选择器只保留相关分区的图片（见 VectorProductIndex.search_partitions）。
+分区只保存图片ID，不另存向量，主索引的类型（SQ8、IVF、磁盘倒排表等）和内存配置对分区搜索同样有效。
+"""
+from typing import Dict, Iterable, Optional, Sequence, Set
+
+import numpy as np
+
+NULL_PARTITION = ''  # 该列为空的商品
+
+class PartitionSet:
+    """分区值 -> 图片ID集合，以及图片ID -> 分区值。不加锁，由 VectorProductIndex 的锁保护"""
+
+    def __init__(self):
+        self._members: Dict[str, Set[int]] = {}
+        self._image_partition: Dict[int, str] = {}
+        self._arrays: Dict[str, np.ndarray] = {}  # 分区成员的升序数组，分区变化时失效
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def clear(self):
+        self._members.clear()
+        self._image_partition.clear()
+        self._arrays.clear()
+
+    def partition_of(self, image_id: int) -> Optional[str]:
+        return self._image_partition.get(int(image_id))
+
+    def remove(self, ids: Iterable[int]):
+        for image_id in ids:
+            value = self._image_partition.pop(int(image_id), None)
+            if value is None:
+                continue
+            members = self._members[value]
+            members.discard(int(image_id))
+            self._arrays.pop(value, None)
+            if not members:
+                del self._members[value]
+
+    def update(self, ids: Sequence[int], values: Sequence[Optional[str]]):
+        """写入（或移动到新分区）图片，values 为每张图片所属商品的分区列取值"""
+        self.remove(ids)
+        for image_id, value in zip(ids, values):
+            value = NULL_PARTITION if value is None else str(value)
+            self._members.setdefault(value, set()).add(int(image_id))
+            self._image_partition[int(image_id)] = value
+            self._arrays.pop(value, None)
+
+    def members(self, values: Iterable[str]) -> np.ndarray:
+        """给定分区中全部图片的ID，升序"""
+        arrays = []
+        for value in set(values):
+            if value not in self._members:
+                continue
+            if value not in self._arrays:
+                self._arrays[value] = np.array(sorted(self._members[value]), dtype=np.int64)
+            arrays.append(self._arrays[value])
+        if not arrays:
+            return np.empty(0, dtype=np.int64)
+        return arrays[0] if len(arrays) == 1 else np.sort(np.concatenate(arrays))
+
+    def sizes(self) -> Dict[str, int]:
+        """每个分区的图片数，按数量降序"""
+        return dict(sorted(((value, len(members)) for value, members in self._members.items()),
+                           key=lambda item: (-item[1], item[0])))
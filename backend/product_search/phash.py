@@ -0,0 +1,106 @@
+"""
+感知哈希预索引。
+
+很多查询图片就是商品库里的图片被重新保存或压缩后再上传的，这类查询按感知哈希就能找到原图。
+每张商品图片保存一个 64 位 dHash（product_images.image_hash），搜索时先计算查询图片的 dHash，
+在内存中按汉明距离查找；距离不超过 max_distance 的视为同一张图片排在结果最前面，其余名额由向量检索补足。
+
+查找使用多索引哈希（multi-index hashing）: 把 64 位切成 max_distance + 1 段，按抽屉原理，
+距离不超过 max_distance 的两个哈希至少有一段完全相同，因此只需比较至少一段命中的候选。
+"""
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+_HASH_SIZE = 8
+
+def image_hash(image_path: str) -> int:
+    """
+    计算图片的 dHash: 缩放为 9x8 灰度图，比较每行相邻像素的明暗
+    Returns:
+        int: 有符号 64 位整数，可直接存入 BIGINT 列
+    """
+    with Image.open(image_path) as img:
+        pixels = np.asarray(img.convert('L').resize((_HASH_SIZE + 1, _HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << HASH_BITS) - 1)).count('1')
+
+class HashIndex:
+    """图片ID到 dHash 的内存索引，支持增删与汉明距离范围查找，线程安全"""
+
+    def __init__(self, max_distance: int = 4):
+        """
+        Args:
+            max_distance: 视为同一张图片的最大汉明距离
+        """
+        self.max_distance = max_distance
+        segments = max_distance + 1
+        bounds = [round(i * HASH_BITS / segments) for i in range(segments + 1)]
+        self._segments = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self._hashes: Dict[int, int] = {}
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in self._segments]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def _keys(self, value: int):
+        value &= (1 << HASH_BITS) - 1
+        return [(value >> start) & mask for start, mask in self._segments]
+
+    def _discard(self, image_id: int):
+        old = self._hashes.pop(image_id, None)
+        if old is None:
+            return
+        for table, key in zip(self._tables, self._keys(old)):
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.discard(image_id)
+                if not bucket:
+                    del table[key]
+
+    def update(self, items: Iterable[Tuple[int, int]]):
+        """写入 (图片ID, dHash)，dHash 为 None 时移除该图片"""
+        with self._lock:
+            for image_id, value in items:
+                self._discard(image_id)
+                if value is None:
+                    continue
+                self._hashes[image_id] = value
+                for table, key in zip(self._tables, self._keys(value)):
+                    table.setdefault(key, set()).add(image_id)
+
+    def remove(self, image_ids: Iterable[int]):
+        with self._lock:
+            for image_id in image_ids:
+                self._discard(image_id)
+
+    def clear(self):
+        with self._lock:
+            self._hashes.clear()
+            for table in self._tables:
+                table.clear()
+
+    def search(self, value: int, top_k: int = 10) -> List[Tuple[int, int]]:
+        """
+        查找汉明距离不超过 max_distance 的图片
+        Returns:
+            List[Tuple[int, int]]: (图片ID, 距离)，按距离升序，最多 top_k 个
+        """
+        with self._lock:
+            candidates = set()
+            for table, key in zip(self._tables, self._keys(value)):
+                candidates.update(table.get(key, ()))
+            matches = [(image_id, hamming(value, self._hashes[image_id])) for image_id in candidates]
+        matches = [(image_id, distance) for image_id, distance in matches if distance <= self.max_distance]
+        matches.sort(key=lambda item: (item[1], item[0]))
+        return matches[:top_k]
@@ -0,0 +1,182 @@
+"""
+按需的请求级性能剖析。
+
+默认关闭，关闭时不注册任何请求钩子。对 PROFILE_ENDPOINTS 中的接口（默认图片搜索和 CSV 导入），
+以下请求会被剖析：
+    请求头 X-Profile 等于 ADMIN_TOKEN（线上排查单个慢请求）
+    按 PROFILE_SAMPLE_RATE 抽样的请求
+剖析方式由 PROFILE_MODE 决定:
+    sampling  后台线程每隔 PROFILE_INTERVAL_MS 采样一次请求线程的调用栈，输出折叠栈（.folded），
+              可直接用 flamegraph.pl、speedscope 或 inferno 生成火焰图，对请求本身几乎没有额外开销
+    cprofile  使用 cProfile 记录全部函数调用，输出 .prof（pstats 格式，可用 snakeviz 查看），开销较大
+结果写入 PROFILE_DIR，每个文件附带同名 .json 元数据，通过 /api/admin/profiles 列出和下载。
+"""
+import cProfile
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import List, Optional
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))  # 抽样剖析的请求比例
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sampling')  # sampling 或 cprofile
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))  # 采样间隔（毫秒）
+PROFILE_ENDPOINTS = [path for path in os.getenv('PROFILE_ENDPOINTS', '/api/products/search,/api/products/upload_csv').split(',') if path]
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'profiles'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 100))  # 最多保留的剖析结果数，超出时删除最早的
+
+def profiling_enabled() -> bool:
+    return bool(ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+class StackSampler:
+    """定时采样指定线程的调用栈，按折叠栈格式累计"""
+
+    def __init__(self, thread_id: int, interval_ms: Optional[float] = None):
+        self.thread_id = thread_id
+        self.interval = (PROFILE_INTERVAL_MS if interval_ms is None else interval_ms) / 1000.0
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """折叠栈格式: 每行 "根;...;叶 次数" """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+class RequestProfiler:
+    """剖析单个请求，finish 时把结果写入 PROFILE_DIR"""
+
+    def __init__(self, endpoint: str, reason: str, mode: Optional[str] = None):
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.endpoint = endpoint
+        self.reason = reason
+        self.mode = mode or PROFILE_MODE
+        self._sampler = None
+        self._profile = None
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = StackSampler(threading.get_ident()).start()
+        return self
+
+    def finish(self, status_code: Optional[int] = None, directory: str = None) -> dict:
+        duration = time.perf_counter() - self._start
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        if self._profile is not None:
+            self._profile.disable()
+            filename = f'{self.profile_id}.prof'
+            self._profile.dump_stats(os.path.join(directory, filename))
+            samples = None
+        else:
+            self._sampler.stop()
+            filename = f'{self.profile_id}.folded'
+            with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+                f.write(self._sampler.folded())
+            samples = self._sampler.samples
+        meta = {
+            'id': self.profile_id,
+            'file': filename,
+            'mode': self.mode,
+            'endpoint': self.endpoint,
+            'reason': self.reason,
+            'status_code': status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'samples': samples,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        with open(os.path.join(directory, f'{self.profile_id}.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        _prune(directory)
+        return meta
+
+def _prune(directory: str):
+    metas = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in metas[:max(len(metas) - PROFILE_MAX_FILES, 0)]:
+        profile_id = name[:-len('.json')]
+        for suffix in ('.json', '.folded', '.prof'):
+            path = os.path.join(directory, profile_id + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+def list_profiles(directory: str = None) -> List[dict]:
+    """已保存的剖析结果元数据，最新的在前"""
+    directory = directory or PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                profiles.append(json.load(f))
+    return profiles
+
+def should_profile(path: str, header_token: Optional[str]) -> Optional[str]:
+    """
+    判断请求是否需要剖析
+    Returns:
+        触发原因 'header' 或 'sampled'，不需要时返回 None
+    """
+    if path not in PROFILE_ENDPOINTS:
+        return None
+    if ADMIN_TOKEN and header_token == ADMIN_TOKEN:
+        return 'header'
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return 'sampled'
+    return None
+
+def init_app(app):
+    """未配置 ADMIN_TOKEN 且未开启抽样时不注册任何钩子"""
+    from flask import request, g
+
+    if not profiling_enabled():
+        return
+
+    @app.before_request
+    def _start_profile():
+        reason = should_profile(request.path, request.headers.get('X-Profile'))
+        if reason:
+            g.request_profiler = RequestProfiler(request.path, reason).start()
+
+    @app.after_request
+    def _finish_profile(response):
+        profiler = g.pop('request_profiler', None)
+        if profiler is not None:
+            try:
+                meta = profiler.finish(response.status_code)
+                response.headers['X-Profile-Id'] = meta['id']
+            except Exception as e:
+                app.logger.error(f"保存请求剖析结果失败: {e}")
+        return response
@@ -0,0 +1,305 @@
+"""
+向量索引复制：本地预写日志 (WAL) 与快照。
+
+写入方（leader）把每次应用到索引的变更追加到 WAL，并定期切出快照；
+跟随方（follower，例如共享同一存储卷的其他 Pod）从最新快照启动并重放 WAL 尾部，
+无需全量扫描 product_images。
+
+目录结构:
+    <dir>/wal/wal-<起始LSN>.log          按快照切分的日志段
+    <dir>/wal/leader.lock                写入方持有的排他锁，同一目录只能有一个写入方
+    <dir>/snapshots/snapshot-<LSN>.faiss  FAISS 索引（含 product_images.id）
+    <dir>/snapshots/snapshot-<LSN>.json   快照元数据，最后写入，作为快照完成的标记
+"""
+import json
+import os
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 flock，不做互斥
+    fcntl = None
+
+WAL_MAGIC = b'PSWAL001'
+# lsn, change_seq, op, image_id, payload_len
+RECORD_HEADER = struct.Struct('<QQBqI')
+RECORD_CRC = struct.Struct('<I')
+
+OP_UPSERT = 1
+OP_REMOVE = 2
+
+@dataclass
+class WALRecord:
+    """WAL 中的一条变更记录"""
+    lsn: int  # 日志序号，每条记录单调递增
+    change_seq: int  # 写入时已应用到的 index_changes.seq
+    op: int
+    image_id: int
+    vector: Optional[np.ndarray] = None
+
+class WALLockedError(Exception):
+    """WAL 目录已被其他写入方（其他 worker 或 Pod）锁定"""
+
+def _segment_name(start_lsn: int) -> str:
+    return f"wal-{start_lsn:020d}.log"
+
+def _segment_start(name: str) -> int:
+    return int(name[len('wal-'):-len('.log')])
+
+class IndexWAL:
+    """
+    追加写的变更日志，按段存储，每条记录带 CRC 校验，读到不完整的尾部记录即停止。
+    打开时对目录中的 leader.lock 加排他锁（flock），直到 close；已被其他进程锁定时抛出 WALLockedError
+    """
+
+    def __init__(self, directory: str, fsync: bool = False):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._lock_file = self._acquire_lock()
+        self.last_lsn = 0
+        self.last_change_seq = 0
+        segments = self.segments()
+        if segments:
+            # 刚切换的新段可能还没有记录，段名本身记录了起始 LSN
+            self.last_lsn = _segment_start(segments[-1]) - 1
+            reader = WALReader(directory, 0)
+            for record in reader.scan_segment(segments[-1]):
+                self.last_lsn = record.lsn
+                self.last_change_seq = record.change_seq
+            # 截掉崩溃时写了一半的尾部记录，保证之后追加的记录可读
+            path = os.path.join(directory, segments[-1])
+            if os.path.getsize(path) > reader._offset:
+                with open(path, 'r+b') as f:
+                    f.truncate(reader._offset)
+
+    def _acquire_lock(self):
+        lock_file = open(os.path.join(self.directory, 'leader.lock'), 'a')
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise WALLockedError(f"WAL 目录 {self.directory} 已有其他写入方")
+        return lock_file
+
+    def segments(self) -> List[str]:
+        """按起始 LSN 排序的日志段文件名"""
+        names = [n for n in os.listdir(self.directory) if n.startswith('wal-') and n.endswith('.log')]
+        return sorted(names, key=_segment_start)
+
+    def _open_segment(self, start_lsn: int):
+        path = os.path.join(self.directory, _segment_name(start_lsn))
+        is_new = not os.path.exists(path)
+        f = open(path, 'ab')
+        if is_new:
+            f.write(WAL_MAGIC)
+            f.flush()
+        return f
+
+    def append(self, records: List[Tuple[int, int, int, Optional[np.ndarray]]]) -> int:
+        """
+        追加一批记录
+        Args:
+            records: (change_seq, op, image_id, vector) 列表，删除操作的 vector 为 None
+        Returns:
+            int: 最后一条记录的 LSN
+        """
+        if not records:
+            return self.last_lsn
+        if self._file is None:
+            segments = self.segments()
+            start = _segment_start(segments[-1]) if segments else self.last_lsn + 1
+            self._file = self._open_segment(start)
+        buf = bytearray()
+        for change_seq, op, image_id, vector in records:
+            self.last_lsn += 1
+            payload = b'' if vector is None else np.asarray(vector, dtype=np.float32).tobytes()
+            header = RECORD_HEADER.pack(self.last_lsn, change_seq, op, image_id, len(payload))
+            buf += header + payload + RECORD_CRC.pack(zlib.crc32(header + payload))
+            self.last_change_seq = change_seq
+        self._file.write(buf)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        return self.last_lsn
+
+    def rotate(self):
+        """结束当前段，后续记录写入以 last_lsn + 1 开头的新段"""
+        if self._file is not None:
+            self._file.close()
+        self._file = self._open_segment(self.last_lsn + 1)
+
+    def truncate_before(self, lsn: int):
+        """删除所有记录都不超过 lsn 的日志段（下一段的起始 LSN <= lsn + 1）"""
+        segments = self.segments()
+        for name, next_name in zip(segments, segments[1:]):
+            if _segment_start(next_name) <= lsn + 1:
+                os.remove(os.path.join(self.directory, name))
+
+    def read_from(self, after_lsn: int) -> Iterator[WALRecord]:
+        """读取 LSN 大于 after_lsn 的全部完整记录"""
+        reader = WALReader(self.directory, after_lsn)
+        yield from reader.read()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            # 关闭文件即释放 flock
+            self._lock_file.close()
+            self._lock_file = None
+
+class WALReader:
+    """
+    增量读取 WAL，记住读取位置，供跟随方定时追踪。
+    写入方可能正在写尾部记录，不完整的记录留到下次再读。
+    """
+
+    def __init__(self, directory: str, after_lsn: int = 0):
+        self.directory = directory
+        self.last_lsn = after_lsn
+        self._segment = None
+        self._offset = 0
+
+    def _segments(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        names = [n for n in os.listdir(self.directory) if n.startswith('wal-') and n.endswith('.log')]
+        return sorted(names, key=_segment_start)
+
+    def read(self) -> Iterator[WALRecord]:
+        segments = self._segments()
+        if self._segment is not None and self._segment not in segments:
+            # 当前段已被快照截断，需要从快照重新启动
+            raise WALTruncatedError(f"WAL 段 {self._segment} 已被删除")
+        if self._segment is None:
+            # 第一次读取：从包含 last_lsn + 1 的段开始
+            candidates = [n for n in segments if _segment_start(n) <= self.last_lsn + 1]
+            if not candidates and segments:
+                raise WALTruncatedError(f"WAL 中已没有 LSN {self.last_lsn + 1} 之前的记录")
+            start_segments = candidates[-1:] if candidates else segments[:1]
+            if not start_segments:
+                return
+            self._segment = start_segments[0]
+            self._offset = len(WAL_MAGIC)
+        for name in segments[segments.index(self._segment):]:
+            if name != self._segment:
+                self._segment = name
+                self._offset = len(WAL_MAGIC)
+            yield from self._read_segment(name)
+
+    def scan_segment(self, name: str) -> Iterator[WALRecord]:
+        """从头读取单个日志段"""
+        self._segment = name
+        self._offset = len(WAL_MAGIC)
+        yield from self._read_segment(name)
+
+    def _read_segment(self, name: str) -> Iterator[WALRecord]:
+        path = os.path.join(self.directory, name)
+        with open(path, 'rb') as f:
+            if f.read(len(WAL_MAGIC)) != WAL_MAGIC:
+                raise ValueError(f"无效的 WAL 文件: {path}")
+            f.seek(self._offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                lsn, change_seq, op, image_id, payload_len = RECORD_HEADER.unpack(header)
+                payload = f.read(payload_len)
+                crc = f.read(RECORD_CRC.size)
+                if len(payload) < payload_len or len(crc) < RECORD_CRC.size:
+                    return  # 尾部记录尚未写完
+                if RECORD_CRC.unpack(crc)[0] != zlib.crc32(header + payload):
+                    # 崩溃留下的半条记录，之后的内容不可信
+                    print(f"WAL 记录校验失败，停止读取: {path} @ {self._offset}")
+                    return
+                self._offset = f.tell()
+                if lsn <= self.last_lsn:
+                    continue
+                self.last_lsn = lsn
+                vector = np.frombuffer(payload, dtype=np.float32) if payload_len else None
+                yield WALRecord(lsn, change_seq, op, image_id, vector)
+
+class WALTruncatedError(Exception):
+    """跟随方落后太多，需要的 WAL 段已随快照删除"""
+
+class SnapshotStore:
+    """快照目录，保存 FAISS 索引及其对应的 WAL 位置"""
+
+    def __init__(self, directory: str, keep: int = 2):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def list(self) -> List[dict]:
+        """返回已完成的快照元数据，按 LSN 升序"""
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if name.startswith('snapshot-') and name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name), 'r') as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                meta['path'] = os.path.join(self.directory, meta['file'])
+                if os.path.exists(meta['path']):
+                    snapshots.append(meta)
+        return sorted(snapshots, key=lambda m: m['lsn'])
+
+    def latest(self) -> Optional[dict]:
+        snapshots = self.list()
+        return snapshots[-1] if snapshots else None
+
+    def write(self, index_bytes: np.ndarray, lsn: int, change_seq: int, **extra) -> dict:
+        """
+        写入快照。索引文件和元数据都先写临时文件再原子替换，
+        元数据最后写入，读取方只会看到完整的快照。
+        Args:
+            index_bytes: faiss.serialize_index 的结果
+            lsn: 快照包含的最后一条 WAL 记录
+            change_seq: 快照对应的 index_changes.seq
+        """
+        base = f"snapshot-{lsn:020d}"
+        index_path = os.path.join(self.directory, base + '.faiss')
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(index_bytes.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_path)
+
+        meta = {
+            'file': base + '.faiss',
+            'lsn': lsn,
+            'change_seq': change_seq,
+            'created_at': time.time(),
+            **extra
+        }
+        meta_path = os.path.join(self.directory, base + '.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        self._prune()
+        meta['path'] = index_path
+        return meta
+
+    def _prune(self):
+        for meta in self.list()[:-self.keep]:
+            base = os.path.splitext(meta['path'])[0]
+            for path in (base + '.json', base + '.faiss'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def oldest_lsn(self) -> Optional[int]:
+        snapshots = self.list()
+        return snapshots[0]['lsn'] if snapshots else None
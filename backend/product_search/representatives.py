@@ -0,0 +1,56 @@
+"""
+每个商品的代表图片。
+
+同一商品常有多张几乎相同的 good_img，全部放进索引只会增加内存和搜索耗时。
+配置 INDEX_REPRESENTATIVES 后，索引只收录每个商品的最多 N 张代表图片，product_images 仍保存全部向量:
+    1. 以与其他图片平均相似度最高的图片（medoid）为第一张代表
+    2. 反复加入与现有代表最不相似的图片，直到达到 N 张，或所有图片与某张代表的余弦相似度都不低于阈值
+    3. 按最近代表分组，把每组的代表换成组内 medoid，重复到不再变化（k-medoids）
+这样索引规模取决于商品有多少种不同的外观，而不是照片数量。
+开启 INDEX_REPRESENTATIVE_EXPAND 时，搜索命中代表图片后读取其商品的全部图片，按原始向量重排。
+"""
+from typing import List
+
+import numpy as np
+
+KMEDOIDS_ITERATIONS = 5
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def select_representatives(vectors: np.ndarray, max_count: int, threshold: float) -> List[int]:
+    """
+    选出一个商品的代表图片
+    Args:
+        vectors: 商品全部图片的向量
+        max_count: 最多选出的代表数
+        threshold: 与代表的余弦相似度不低于该值的图片视为同一外观
+    Returns:
+        List[int]: 代表图片在 vectors 中的行号，升序
+    """
+    count = len(vectors)
+    if count <= 1:
+        return list(range(count))
+    normalized = _normalize(vectors)
+    similarity = normalized @ normalized.T
+    chosen = [int(np.argmax(similarity.mean(axis=1)))]
+    nearest = similarity[chosen[0]].copy()  # 每张图片与最近代表的相似度
+    while len(chosen) < max_count and nearest.min() < threshold:
+        row = int(np.argmin(nearest))
+        chosen.append(row)
+        np.maximum(nearest, similarity[row], out=nearest)
+
+    for _ in range(KMEDOIDS_ITERATIONS):
+        assignment = np.argmax(similarity[:, chosen], axis=1)
+        medoids = []
+        for cluster in range(len(chosen)):
+            members = np.flatnonzero(assignment == cluster)
+            if len(members):
+                medoids.append(int(members[np.argmax(similarity[np.ix_(members, members)].sum(axis=1))]))
+        if sorted(medoids) == sorted(chosen):
+            break
+        chosen = medoids
+    return sorted(chosen)
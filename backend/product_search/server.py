@@ -0,0 +1,223 @@
+"""
+独立的向量索引服务进程。
+
+一个进程持有 VectorProductIndex，所有 Web worker 通过 Unix socket 或本机 TCP
+以紧凑的二进制协议访问，避免每个 worker 各自加载一份完整索引和数据库连接。
+
+用法:
+    python -m product_search.server --address unix:///tmp/product_index.sock
+    python -m product_search.server --address 127.0.0.1:5055
+
+协议（小端序）:
+    请求帧: <body_len:u32><request_id:u32><opcode:u8><body>
+    响应帧: <body_len:u32><request_id:u32><status:u8><body>
+同一连接上的请求按顺序处理、按顺序响应，客户端可以连续发送多个请求再依次读取（流水线）。
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+FRAME_HEADER = struct.Struct('<IIB')
+
+OP_PING = 0
+OP_SEARCH = 1  # body: <k:u32><n:u32><n*d float32>  -> <n:u32><k:u32><n*k float32 距离><n*k int64 ID><ntotal:u64><generation:u64>
+OP_ADD = 2     # body: <n:u32><n int64 ID><n*d float32>  -> <n:u32>
+OP_REMOVE = 3  # body: <n:u32><n int64 ID>  -> <removed:u32>
+OP_STATS = 4   # body: 空  -> JSON
+OP_SYNC = 5    # body: 空  -> <processed:u32>
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+COUNT = struct.Struct('<I')
+SEARCH_HEADER = struct.Struct('<II')
+SEARCH_STATS = struct.Struct('<QQ')  # 搜索响应末尾附带的索引状态，客户端无需另发 OP_STATS
+
+DEFAULT_ADDRESS = 'unix:///tmp/product_index.sock'
+
+def parse_address(address: str):
+    """
+    解析服务地址
+    Returns:
+        (family, addr): Unix socket 返回 (AF_UNIX, 路径)，TCP 返回 (AF_INET, (host, port))
+    """
+    if address.startswith('unix://'):
+        return socket.AF_UNIX, address[len('unix://'):]
+    if address.startswith('/'):
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+def recv_exact(sock_file, size: int) -> bytes:
+    data = sock_file.read(size)
+    if data is None or len(data) < size:
+        raise ConnectionError('连接已关闭')
+    return data
+
+def encode_search_request(queries: np.ndarray, k: int) -> bytes:
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    return SEARCH_HEADER.pack(k, queries.shape[0]) + queries.tobytes()
+
+def decode_search_response(body: bytes):
+    n, k = SEARCH_HEADER.unpack_from(body)
+    offset = SEARCH_HEADER.size
+    distances = np.frombuffer(body, dtype=np.float32, count=n * k, offset=offset).reshape(n, k)
+    offset += n * k * 4
+    ids = np.frombuffer(body, dtype=np.int64, count=n * k, offset=offset).reshape(n, k)
+    return distances, ids
+
+def decode_search_stats(body: bytes):
+    """搜索响应末尾的 (ntotal, generation)，旧版服务没有附带时返回 None"""
+    n, k = SEARCH_HEADER.unpack_from(body)
+    offset = SEARCH_HEADER.size + n * k * 12
+    if len(body) < offset + SEARCH_STATS.size:
+        return None
+    return SEARCH_STATS.unpack_from(body, offset)
+
+def encode_ids(ids) -> bytes:
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    return COUNT.pack(len(ids)) + ids.tobytes()
+
+class IndexRequestHandler(socketserver.StreamRequestHandler):
+    """每个连接一个线程，顺序处理该连接上的请求帧"""
+
+    def setup(self):
+        super().setup()
+        if self.server.address_family == socket.AF_INET:
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        while True:
+            try:
+                header = self.rfile.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                body_len, request_id, opcode = FRAME_HEADER.unpack(header)
+                body = recv_exact(self.rfile, body_len) if body_len else b''
+            except (ConnectionError, OSError):
+                return
+            try:
+                status, response = STATUS_OK, self.server.dispatch(opcode, body)
+            except Exception as e:
+                status, response = STATUS_ERROR, str(e).encode('utf-8')
+            try:
+                self.wfile.write(FRAME_HEADER.pack(len(response), request_id, status) + response)
+                self.wfile.flush()
+            except OSError:
+                return
+
+class IndexServerMixin:
+    """持有索引并响应 search/add/remove 请求的服务"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def init_index(self, index, address: str):
+        self.index = index
+        self.address = address
+        self.started_at = time.time()
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    def dispatch(self, opcode: int, body: bytes) -> bytes:
+        with self._count_lock:
+            self.request_count += 1
+        d = self.index.dimension
+        if opcode == OP_SEARCH:
+            k, n = SEARCH_HEADER.unpack_from(body)
+            if len(body) != SEARCH_HEADER.size + n * d * 4:
+                raise ValueError(f"查询向量维度与索引维度 {d} 不一致")
+            queries = np.frombuffer(body, dtype=np.float32, count=n * d, offset=SEARCH_HEADER.size).reshape(n, d)
+            self.index._ensure_fresh()
+            distances, ids = self.index.search_vectors(queries, k)
+            return (SEARCH_HEADER.pack(n, k)
+                    + np.ascontiguousarray(distances, dtype=np.float32).tobytes()
+                    + np.ascontiguousarray(ids, dtype=np.int64).tobytes()
+                    + SEARCH_STATS.pack(int(self.index.ntotal), int(self.index.generation)))
+        if opcode == OP_ADD:
+            (n,) = COUNT.unpack_from(body)
+            if len(body) != COUNT.size + n * 8 + n * d * 4:
+                raise ValueError(f"向量维度与索引维度 {d} 不一致")
+            ids = np.frombuffer(body, dtype=np.int64, count=n, offset=COUNT.size)
+            vectors = np.frombuffer(body, dtype=np.float32, count=n * d, offset=COUNT.size + n * 8).reshape(n, d)
+            self.index.add_vectors(ids, vectors)
+            return COUNT.pack(n)
+        if opcode == OP_REMOVE:
+            (n,) = COUNT.unpack_from(body)
+            ids = np.frombuffer(body, dtype=np.int64, count=n, offset=COUNT.size)
+            return COUNT.pack(int(self.index.remove_vectors(ids)))
+        if opcode == OP_STATS:
+            return json.dumps(self.stats()).encode('utf-8')
+        if opcode == OP_SYNC:
+            return COUNT.pack(int(self.index.sync_changes()))
+        if opcode == OP_PING:
+            return b''
+        raise ValueError(f"未知操作码: {opcode}")
+
+    def stats(self) -> dict:
+        stats = {
+            'ntotal': int(self.index.ntotal),
+            'dimension': self.index.dimension,
+            'generation': self.index.generation,
+            'last_change_seq': self.index.last_change_seq,
+            'requests': self.request_count,
+            'uptime': time.time() - self.started_at,
+            'pid': os.getpid(),
+            'warmup': getattr(self.index, 'warmup_state', None),
+        }
+        batcher = getattr(self.index, '_batcher', None)
+        if batcher is not None:
+            stats['batching'] = batcher.stats()
+        if getattr(self.index, 'db', None) is not None:
+            stats['db'] = self.index.db.stats()
+        return stats
+
+class UnixIndexServer(IndexServerMixin, socketserver.ThreadingUnixStreamServer):
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+class TCPIndexServer(IndexServerMixin, socketserver.ThreadingTCPServer):
+    pass
+
+def create_index_server(index, address: str = DEFAULT_ADDRESS):
+    """按地址类型创建 Unix socket 或 TCP 索引服务"""
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            os.remove(addr)  # 清理上次异常退出留下的 socket 文件
+        server = UnixIndexServer(addr, IndexRequestHandler)
+    else:
+        server = TCPIndexServer(addr, IndexRequestHandler)
+    server.init_index(index, address)
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='向量索引服务')
+    parser.add_argument('--address', default=os.getenv('INDEX_SERVER_ADDRESS', DEFAULT_ADDRESS),
+                        help='监听地址，unix:///path/to.sock 或 host:port')
+    args = parser.parse_args(argv)
+
+    from .index import VectorProductIndex, limit_faiss_threads
+    limit_faiss_threads()
+    index = VectorProductIndex()
+    index.warm_up()
+    server = create_index_server(index, args.address)
+    print(f"向量索引服务已启动: {args.address}（{index.ntotal} 个向量）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        index.stop_sync()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+预计算相似商品。
+
+商品详情页的"相似商品"如果实时计算，每次浏览都要调用一次特征提取和搜索。
+这里用 product_images 中已存储的向量批量搜索索引，为每个商品保存前 K 个相似商品到 product_similarities:
+    full         为全部商品重新计算
+    incremental  只处理 index_changes 中上次计算之后有图片变化的商品，以及新结果中可能需要
+                 把这些商品加入自己列表的邻居商品；删除了图片的商品还要重算把它列为相似商品的商品。
+                 已删除的商品由外键级联删除
+商品的相似度取两个商品所有图片之间的最高相似度，换算方式与图片搜索一致。
+
+用法:
+    python -m product_search.admin build-similar [--full] [--loop 300]
+"""
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+from .index import INDEX_CHANGE_GAP_TIMEOUT
+
+SIMILAR_TOP_K = 20  # 每个商品保存的相似商品数
+SIMILAR_FANOUT = 4  # 每张图片搜索 top_k * fanout 个近邻，保证去重到商品后仍有足够结果
+SIMILAR_BATCH_SIZE = 256  # 每批处理的商品数
+
+def _placeholders(values) -> str:
+    return ','.join(['%s'] * len(values))
+
+def _load_product_vectors(conn, product_ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """读取商品的全部图片向量，返回 (每行所属商品ID, 向量)"""
+    rows = conn.exec_driver_sql(
+        f"SELECT product_id, vector FROM product_images WHERE product_id IN ({_placeholders(product_ids)})",
+        tuple(product_ids)).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    return (np.array([row[0] for row in rows], dtype=np.int64),
+            np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]))
+
+def _image_products(conn, image_ids: Iterable[int]) -> Dict[int, int]:
+    image_ids = sorted(set(int(image_id) for image_id in image_ids if image_id != -1))
+    if not image_ids:
+        return {}
+    rows = conn.exec_driver_sql(
+        f"SELECT id, product_id FROM product_images WHERE id IN ({_placeholders(image_ids)})", tuple(image_ids)).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+def compute_neighbors(index, conn, product_ids: List[int], top_k: int = SIMILAR_TOP_K) -> Dict[int, List[Tuple[int, float]]]:
+    """
+    用已存储的向量批量搜索，计算商品的相似商品
+    Args:
+        index: VectorProductIndex
+        conn: 数据库连接
+    Returns:
+        {商品ID: [(相似商品ID, 相似度), ...]}，按相似度降序，最多 top_k 个
+    """
+    owners, vectors = _load_product_vectors(conn, product_ids)
+    neighbors: Dict[int, Dict[int, float]] = {product_id: {} for product_id in product_ids}
+    if len(owners) == 0 or index.ntotal == 0:
+        return {product_id: [] for product_id in product_ids}
+    distances, image_ids = index.search_vectors(vectors, top_k * SIMILAR_FANOUT + 1)
+    image_products = _image_products(conn, image_ids.ravel())
+    for owner, row_distances, row_ids in zip(owners, distances, image_ids):
+        best = neighbors[int(owner)]
+        for distance, image_id in zip(row_distances, row_ids):
+            other = image_products.get(int(image_id))
+            if other is None or other == owner:
+                continue
+            similarity = index._distance_to_similarity(float(distance))
+            if similarity > best.get(other, -1.0):
+                best[other] = similarity
+    return {product_id: sorted(best.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+            for product_id, best in neighbors.items()}
+
+def _save(conn, neighbors: Dict[int, List[Tuple[int, float]]], change_seq: int):
+    product_ids = list(neighbors)
+    conn.exec_driver_sql(f"DELETE FROM product_similarities WHERE product_id IN ({_placeholders(product_ids)})",
+                         tuple(product_ids))
+    rows = [(product_id, other, rank, round(similarity, 6), change_seq)
+            for product_id, items in neighbors.items() for rank, (other, similarity) in enumerate(items, start=1)]
+    if rows:
+        conn.exec_driver_sql(
+            "INSERT INTO product_similarities (product_id, similar_product_id, `rank`, similarity, change_seq) "
+            "VALUES (%s, %s, %s, %s, %s)", rows)
+
+def _read_watermark(conn) -> int:
+    """上次增量计算处理到的 index_changes.seq"""
+    seq = conn.exec_driver_sql("SELECT change_seq FROM product_similarity_state WHERE id = 1").scalar()
+    if seq is None:
+        # 状态表为空（刚升级的数据库），沿用相似商品结果中记录的序号
+        seq = conn.exec_driver_sql("SELECT COALESCE(MAX(change_seq), 0) FROM product_similarities").scalar()
+    return int(seq)
+
+def _write_watermark(conn, change_seq: int):
+    """记录已处理到的序号。没有写入任何相似商品（例如只有删除）时也要推进，否则每轮都会重复扫描同一段变更"""
+    updated = conn.exec_driver_sql("UPDATE product_similarity_state SET change_seq = %s WHERE id = 1", (change_seq,))
+    if updated.rowcount == 0:
+        conn.exec_driver_sql("INSERT INTO product_similarity_state (id, change_seq) VALUES (1, %s)", (change_seq,))
+
+def _age_seconds(created_at) -> float:
+    if created_at is None:
+        return float('inf')
+    if isinstance(created_at, str):  # SQLite 返回字符串
+        created_at = datetime.fromisoformat(created_at)
+    return (datetime.now() - created_at).total_seconds()
+
+def _changed_products(conn, since_seq: int) -> Tuple[Set[int], Set[int], int]:
+    """
+    index_changes 中 since_seq 之后有图片变化的商品、其中删除过图片的商品，以及可以推进到的 seq。
+    seq 在事务开始写入时分配、提交后才可见，缺失的 seq 可能属于尚未提交的事务。与索引同步一样，
+    空洞之后的记录写入不到 INDEX_CHANGE_GAP_TIMEOUT 秒时把进度停在空洞之前，下次从空洞处重新扫描（重算是幂等的），
+    超时的空洞视为已回滚的事务
+    """
+    rows = conn.exec_driver_sql(
+        "SELECT ic.seq, ic.op, COALESCE(pi.product_id, ic.product_id), ic.created_at FROM index_changes ic "
+        "LEFT JOIN product_images pi ON pi.id = ic.image_id WHERE ic.seq > %s ORDER BY ic.seq", (since_seq,)).fetchall()
+    changed, removed = set(), set()
+    watermark, advancing = since_seq, True
+    for seq, op, product_id, created_at in rows:
+        if advancing and seq > watermark + 1 and _age_seconds(created_at) <= INDEX_CHANGE_GAP_TIMEOUT:
+            advancing = False
+        if advancing:
+            watermark = seq
+        if product_id is None:
+            continue  # 删除的图片没有记录所属商品，无法确定受影响的商品
+        changed.add(product_id)
+        if op == 'remove':
+            removed.add(product_id)
+    return changed, removed, watermark
+
+def _listed_by(conn, product_ids: Set[int]) -> Set[int]:
+    """相似商品列表中包含这些商品的商品"""
+    if not product_ids:
+        return set()
+    ids = sorted(product_ids)
+    rows = conn.exec_driver_sql(
+        f"SELECT DISTINCT product_id FROM product_similarities WHERE similar_product_id IN ({_placeholders(ids)})",
+        tuple(ids)).fetchall()
+    return {row[0] for row in rows}
+
+def _affected_neighbors(conn, neighbors: Dict[int, List[Tuple[int, float]]], top_k: int) -> Set[int]:
+    """新结果中的邻居商品，如果与变化商品的相似度能进入它自己的前 K 个，需要重新计算"""
+    candidates: Dict[int, float] = {}
+    for product_id, items in neighbors.items():
+        for other, similarity in items:
+            if other not in neighbors:
+                candidates[other] = max(candidates.get(other, -1.0), similarity)
+    if not candidates:
+        return set()
+    ids = sorted(candidates)
+    rows = conn.exec_driver_sql(
+        f"SELECT product_id, COUNT(*), MIN(similarity) FROM product_similarities "
+        f"WHERE product_id IN ({_placeholders(ids)}) GROUP BY product_id", tuple(ids)).fetchall()
+    current = {row[0]: (row[1], row[2]) for row in rows}
+    affected = set()
+    for other, similarity in candidates.items():
+        count, worst = current.get(other, (0, None))
+        if count < top_k or similarity > worst:
+            affected.add(other)
+    return affected
+
+def build_similarities(index, full: bool = False, top_k: int = SIMILAR_TOP_K,
+                       batch_size: int = SIMILAR_BATCH_SIZE) -> dict:
+    """
+    计算并写入 product_similarities
+    Args:
+        index: 已加载的 VectorProductIndex
+        full: 是否为全部商品重新计算，否则只处理上次计算之后有变化的商品
+    """
+    start = time.time()
+    with index.db.connect(statement_timeout_ms=0) as conn:
+        changed, removed, max_seq = _changed_products(conn, _read_watermark(conn))
+        if full:
+            pending = [row[0] for row in conn.exec_driver_sql(
+                "SELECT DISTINCT product_id FROM product_images ORDER BY product_id").fetchall()]
+        else:
+            # 删除了图片的商品可能仍留在其他商品的列表中，相似度已不再成立
+            pending = sorted(changed | _listed_by(conn, removed))
+
+    processed = 0
+    neighbors_updated = 0
+    for offset in range(0, len(pending), batch_size):
+        batch = pending[offset:offset + batch_size]
+        with index.db.connect(statement_timeout_ms=0) as conn:
+            neighbors = compute_neighbors(index, conn, batch, top_k)
+            if not full:
+                # 变化的商品可能需要出现在邻居商品的列表中
+                affected = sorted(_affected_neighbors(conn, neighbors, top_k))
+                if affected:
+                    neighbors.update(compute_neighbors(index, conn, affected, top_k))
+                    neighbors_updated += len(affected)
+            _save(conn, neighbors, max_seq)
+            conn.commit()
+        processed += len(batch)
+    with index.db.connect() as conn:
+        _write_watermark(conn, max_seq)
+        conn.commit()
+
+    result = {
+        'mode': 'full' if full else 'incremental',
+        'products': processed,
+        'neighbors_updated': neighbors_updated,
+        'change_seq': max_seq,
+        'seconds': round(time.time() - start, 2),
+    }
+    print(f"相似商品计算完成（{result['mode']}）: {processed} 个商品，"
+          f"另更新 {neighbors_updated} 个邻居商品，耗时 {result['seconds']} 秒。")
+    return result
+
+def run_forever(index, interval: float, top_k: int = SIMILAR_TOP_K):
+    """后台任务: 每隔 interval 秒同步索引并增量更新"""
+    while True:
+        try:
+            index.sync_changes()
+            build_similarities(index, full=False, top_k=top_k)
+        except Exception as e:
+            print(f"增量更新相似商品失败: {e}")
+        time.sleep(interval)
@@ -0,0 +1,85 @@
+"""
+相同查询的并发合并（single-flight）。
+
+同一张图片在短时间内被很多人同时上传搜索时，每个请求都会各自调用一次特征提取和 FAISS 搜索。
+SingleFlight 让同一个键同时只执行一次: 第一个到达的请求（leader）负责执行，
+其余请求（follower）等待它的 Future 并共享结果或异常。
+follower 最多等待 timeout 秒，超时后自行执行，避免一个卡住的调用拖住所有相同的请求。
+"""
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Hashable, Optional, TypeVar
+
+from .metrics import COALESCE_REQUESTS
+
+T = TypeVar('T')
+
+class SingleFlight:
+    """按键合并并发调用，线程安全"""
+
+    def __init__(self, timeout: float = 30.0):
+        """
+        Args:
+            timeout: follower 等待 leader 的最长时间（秒）
+        """
+        self.timeout = timeout
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+
+    def do(self, key: Hashable, fn: Callable[[], T], timeout: Optional[float] = None) -> T:
+        """
+        执行 fn，同一键已有调用在执行时等待并返回它的结果
+        Args:
+            key: 合并键，如图片内容哈希与 top_k
+            fn: 无参数的调用
+            timeout: 本次等待的最长时间（秒），默认取 self.timeout
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            COALESCE_REQUESTS.inc(role='follower')
+            try:
+                return future.result(self.timeout if timeout is None else timeout)
+            except FutureTimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                COALESCE_REQUESTS.inc(role='timeout')
+                print(f"等待相同查询超时（{self.timeout if timeout is None else timeout} 秒），单独执行")
+                return fn()
+
+        COALESCE_REQUESTS.inc(role='leader')
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'timeouts': self.timeouts,
+            }
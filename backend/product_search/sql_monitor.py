@@ -0,0 +1,275 @@
+"""
+SQL 慢查询日志与 N+1 检测。
+
+通过 SQLAlchemy 的 cursor 执行事件统计所有 Engine（ORM 与索引连接池）上的语句:
+    每个请求的语句数与耗时，按语句形状（去掉参数和字面量后的 SQL）分组；
+    同一形状在一个请求中执行超过 SQL_N_PLUS_ONE_THRESHOLD 次时记为 N+1 并打印警告；
+    单条语句超过 SQL_SLOW_MS 时打印慢查询日志，并由后台线程另借一个连接执行 EXPLAIN 记录执行计划
+    （同一形状每 SQL_EXPLAIN_INTERVAL 秒最多 EXPLAIN 一次，不阻塞遇到慢查询的请求）。
+汇总结果通过 /api/admin/sql 查看；测试中可用 capture_queries() 断言语句数量。
+"""
+import contextvars
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+SQL_MONITOR_ENABLED = os.getenv('SQL_MONITOR_ENABLED', '1') == '1'
+SQL_SLOW_MS = float(os.getenv('SQL_SLOW_MS', 200))  # 慢查询阈值（毫秒）
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 10))  # 同一形状在一个请求中的最大执行次数
+SQL_EXPLAIN_INTERVAL = float(os.getenv('SQL_EXPLAIN_INTERVAL', 300))  # 同一形状两次 EXPLAIN 的最短间隔（秒）
+SQL_SLOW_LOG_SIZE = 100  # 保留的最近慢查询条数
+SQL_EXPLAIN_QUEUE_SIZE = 100  # 等待 EXPLAIN 的慢查询上限，超出时不再 EXPLAIN
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|:\w+|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+def statement_shape(statement: str) -> str:
+    """去掉参数、字面量和 IN 列表长度后的语句，用于把同一条代码发出的查询归为一组"""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('(?...)', shape)
+    return ' '.join(shape.split())
+
+class QueryStats:
+    """一个请求（或 capture_queries 块）内执行的语句"""
+
+    def __init__(self, name: str = ''):
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Dict[str, list] = {}  # 形状 -> [次数, 总耗时秒]
+
+    def record(self, shape: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        entry = self.shapes.get(shape)
+        if entry is None:
+            self.shapes[shape] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def repeated(self, threshold: Optional[int] = None) -> List[dict]:
+        """执行次数超过阈值的语句形状（疑似 N+1）"""
+        threshold = SQL_N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return [{'statement': shape, 'count': count, 'total_ms': round(seconds * 1000, 3)}
+                for shape, (count, seconds) in self.shapes.items() if count > threshold]
+
+    def count_matching(self, pattern: str) -> int:
+        """形状中包含 pattern（忽略大小写）的语句执行次数"""
+        pattern = pattern.lower()
+        return sum(count for shape, (count, _) in self.shapes.items() if pattern in shape.lower())
+
+class SQLMonitor:
+    """进程级汇总: 按接口统计语句数，记录 N+1 和最近的慢查询"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._explain_queue = queue.Queue(SQL_EXPLAIN_QUEUE_SIZE)
+        self._explain_thread = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.endpoints: Dict[str, dict] = {}
+            self.n_plus_one: Dict[tuple, dict] = {}
+            self.slow_queries = deque(maxlen=SQL_SLOW_LOG_SIZE)
+            self._explained_at: Dict[str, float] = {}
+            self.explain_dropped = 0
+
+    def finish_request(self, stats: QueryStats):
+        repeated = stats.repeated()
+        with self._lock:
+            entry = self.endpoints.setdefault(stats.name, {'requests': 0, 'queries': 0, 'max_queries': 0, 'seconds': 0.0})
+            entry['requests'] += 1
+            entry['queries'] += stats.count
+            entry['max_queries'] = max(entry['max_queries'], stats.count)
+            entry['seconds'] += stats.seconds
+            for item in repeated:
+                key = (stats.name, item['statement'])
+                found = self.n_plus_one.setdefault(key, {'endpoint': stats.name, 'statement': item['statement'],
+                                                         'requests': 0, 'max_count': 0})
+                found['requests'] += 1
+                found['max_count'] = max(found['max_count'], item['count'])
+        for item in repeated:
+            print(f"[SQL N+1] {stats.name}: 同一语句执行 {item['count']} 次（{item['total_ms']:.1f} ms）: {item['statement'][:200]}")
+
+    def record_slow(self, endpoint: str, statement: str, parameters, seconds: float, engine):
+        shape = statement_shape(statement)
+        entry = {
+            'endpoint': endpoint,
+            'statement': ' '.join(statement.split())[:2000],
+            'duration_ms': round(seconds * 1000, 3),
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'explain': None,  # 由后台线程补上
+        }
+        now = time.monotonic()
+        with self._lock:
+            self.slow_queries.append(entry)
+            last = self._explained_at.get(shape)
+            should_explain = last is None or now - last >= SQL_EXPLAIN_INTERVAL
+            if should_explain:
+                self._explained_at[shape] = now
+        print(f"[SQL 慢查询] {endpoint or '-'} {entry['duration_ms']:.1f} ms: {entry['statement'][:500]}")
+        if should_explain:
+            # EXPLAIN 需要再借一个连接，连接池紧张时在请求线程中执行会拖慢甚至卡住本已很慢的请求
+            self._start_explainer()
+            try:
+                self._explain_queue.put_nowait((entry, engine, statement, parameters))
+            except queue.Full:
+                with self._lock:
+                    self.explain_dropped += 1
+                    self._explained_at.pop(shape, None)
+
+    def _start_explainer(self):
+        with self._lock:
+            if self._explain_thread is None:
+                self._explain_thread = threading.Thread(target=self._run_explains, name='sql-explain', daemon=True)
+                self._explain_thread.start()
+
+    def _run_explains(self):
+        while True:
+            item = self._explain_queue.get()
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            entry, engine, statement, parameters = item
+            try:
+                explain = explain_statement(engine, statement, parameters)
+            except Exception as e:
+                print(f"EXPLAIN 失败: {e}")
+                continue
+            if not explain:
+                continue
+            with self._lock:
+                entry['explain'] = explain
+            print(f"[SQL 慢查询] EXPLAIN {entry['statement'][:200]}")
+            for row in explain:
+                print(f"    EXPLAIN {row}")
+
+    def flush(self, timeout: float = 5):
+        """等待已排队的 EXPLAIN 全部完成"""
+        self._start_explainer()
+        done = threading.Event()
+        self._explain_queue.put(done)
+        done.wait(timeout)
+
+    def summary(self) -> dict:
+        with self._lock:
+            endpoints = {
+                name: {**entry, 'avg_queries': round(entry['queries'] / entry['requests'], 2),
+                       'avg_ms': round(entry['seconds'] / entry['requests'] * 1000, 3),
+                       'seconds': round(entry['seconds'], 4)}
+                for name, entry in self.endpoints.items()
+            }
+            return {
+                'slow_ms': SQL_SLOW_MS,
+                'n_plus_one_threshold': SQL_N_PLUS_ONE_THRESHOLD,
+                'endpoints': endpoints,
+                'n_plus_one': sorted(self.n_plus_one.values(), key=lambda item: -item['max_count']),
+                'slow_queries': list(reversed(self.slow_queries)),
+                'explain_dropped': self.explain_dropped,
+            }
+
+MONITOR = SQLMonitor()
+
+def explain_statement(engine, statement: str, parameters) -> Optional[List[dict]]:
+    """在另一个连接上 EXPLAIN 该语句，只处理 SELECT；失败时返回 None"""
+    if not statement.lstrip().upper().startswith('SELECT'):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    token = _explaining.set(True)
+    try:
+        with engine.connect() as conn:
+            result = conn.exec_driver_sql(prefix + statement, parameters or ())
+            return [{key: (str(value) if value is not None else None) for key, value in row.items()}
+                    for row in result.mappings().all()]
+    except Exception as e:
+        print(f"EXPLAIN 失败: {e}")
+        return None
+    finally:
+        _explaining.reset(token)
+
+_current_stats = contextvars.ContextVar('sql_query_stats', default=None)
+_explaining = contextvars.ContextVar('sql_explaining', default=False)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('sql_monitor_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('sql_monitor_start')
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    if _explaining.get():
+        return
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement_shape(statement), seconds)
+    if seconds * 1000 >= SQL_SLOW_MS and not executemany:
+        MONITOR.record_slow(stats.name if stats is not None else '', statement, parameters, seconds, conn.engine)
+
+_hooked = False
+
+def instrument_sqlalchemy():
+    """为所有 SQLAlchemy Engine 注册语句统计"""
+    global _hooked
+    if _hooked:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _hooked = True
+
+@contextmanager
+def capture_queries(name: str = 'capture'):
+    """
+    统计 with 块内执行的语句，供测试断言查询次数，例如:
+        with capture_queries() as stats:
+            client.get('/api/orders')
+        assert stats.count_matching('FROM customers') <= 1
+    """
+    instrument_sqlalchemy()
+    stats = QueryStats(name)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+def init_app(app):
+    """按请求统计语句数，请求结束时汇总并检测 N+1"""
+    from flask import request, g
+
+    if not SQL_MONITOR_ENABLED:
+        return
+    instrument_sqlalchemy()
+
+    @app.before_request
+    def _start_query_stats():
+        # capture_queries 块内（测试）发起的请求沿用外层统计
+        if _current_stats.get() is None:
+            name = f'{request.method} {request.url_rule.rule if request.url_rule else request.path}'
+            g.sql_stats_token = _current_stats.set(QueryStats(name))
+
+    @app.teardown_request
+    def _finish_query_stats(exc):
+        token = g.pop('sql_stats_token', None)
+        if token is None:
+            return
+        stats = _current_stats.get()
+        try:
+            _current_stats.reset(token)
+        except ValueError:
+            _current_stats.set(None)
+        if stats is not None:
+            MONITOR.finish_request(stats)
@@ -0,0 +1,363 @@
+"""
+轻量级请求追踪。
+
+每个请求对应一个 Trace，代码中用 span(name) 标出数据库查询、FAISS 搜索、外部 API 调用和文件读写。
+记录一个 span 只是两次计时和一次列表追加；请求结束时按名称汇总成 Server-Timing 响应头
+（浏览器开发者工具可直接查看），并把抽样命中的、或耗时超过阈值的请求交给后台线程批量导出：
+    TRACE_EXPORTER=jsonl  追加写入 TRACE_EXPORT_PATH（每行一个请求）
+    TRACE_EXPORTER=otlp   以 OTLP/HTTP JSON 格式 POST 到 TRACE_OTLP_ENDPOINT（如本地 collector 的 /v1/traces）
+请求头带 X-Trace: 1 时该请求总是导出。后台线程等没有活动 Trace 的地方，span() 不做任何记录。
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+TRACE_ENABLED = os.getenv('TRACE_ENABLED', '1') == '1'
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.01))  # 导出的请求比例
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', 1000))  # 超过该耗时（毫秒）的请求总是导出，<=0 表示不按耗时导出
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'jsonl')  # jsonl、otlp 或 none
+TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                                'data', 'traces', 'traces.jsonl'))
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_EXPORT_BATCH_SIZE = 64
+TRACE_EXPORT_INTERVAL = 2.0  # 秒
+TRACE_MAX_SPANS = 2000  # 单个请求最多记录的 span 数，避免长循环（如 CSV 导入）占用过多内存
+TRACE_QUEUE_SIZE = 1000  # 导出队列满时丢弃，不阻塞请求
+
+class Span:
+    __slots__ = ('name', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, name: str, start: float, attributes: dict):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+class Trace:
+    """一个请求内记录的全部 span"""
+
+    def __init__(self, name: str, sampled: bool = False):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.sampled = sampled
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.attributes = {}
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def summary(self) -> dict:
+        """按 span 名称汇总: {名称: (次数, 总耗时秒)}"""
+        totals = {}
+        for item in self.spans:
+            count, seconds = totals.get(item.name, (0, 0.0))
+            totals[item.name] = (count + 1, seconds + item.duration)
+        return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头，名称中的点号替换为下划线以符合 token 语法"""
+        parts = []
+        for name, (count, seconds) in self.summary().items():
+            token = name.replace('.', '_')
+            parts.append(f'{token};dur={seconds * 1000:.2f};desc="{name} x{count}"')
+        parts.append(f'total;dur={self.duration * 1000:.2f}')
+        return ', '.join(parts)
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'start': self.wall_start,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+            'dropped_spans': self.dropped,
+            'spans': [{
+                'name': item.name,
+                'offset_ms': round((item.start - self.start) * 1000, 3),
+                'duration_ms': round(item.duration * 1000, 3),
+                'attributes': item.attributes,
+                **({'error': item.error} if item.error else {}),
+            } for item in self.spans],
+        }
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def start_trace(name: str, force: bool = False):
+    """
+    开始追踪（通常在请求开始时调用）
+    Args:
+        force: 是否无视抽样总是导出
+    Returns:
+        contextvars token，传给 finish_trace；未启用追踪时返回 None
+    """
+    if not TRACE_ENABLED:
+        return None
+    sampled = force or random.random() < TRACE_SAMPLE_RATE
+    return _current_trace.set(Trace(name, sampled))
+
+def finish_trace(token) -> Optional[Trace]:
+    """结束追踪，按抽样或慢请求阈值决定是否导出，返回该 Trace"""
+    if token is None:
+        return None
+    trace = _current_trace.get()
+    try:
+        _current_trace.reset(token)
+    except ValueError:
+        # 流式响应在另一个 Context 中结束时无法用 token 还原
+        _current_trace.set(None)
+    if trace is None:
+        return None
+    trace.end = time.perf_counter()
+    if trace.sampled or (TRACE_SLOW_MS > 0 and trace.duration * 1000 >= TRACE_SLOW_MS):
+        exporter = get_exporter()
+        if exporter is not None:
+            exporter.submit(trace)
+    return trace
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    记录 with 块的耗时；没有活动 Trace 时不做任何事
+    Args:
+        name: 名称，如 db.query、faiss.search、dashscope.embedding、file.copy
+        attributes: 附加信息（会被导出，不要放敏感数据）
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    if len(trace.spans) >= TRACE_MAX_SPANS:
+        trace.dropped += 1
+        yield None
+        return
+    item = Span(name, time.perf_counter(), attributes)
+    trace.spans.append(item)
+    try:
+        yield item
+    except BaseException as e:
+        item.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        item.end = time.perf_counter()
+
+def record_span(name: str, start: float, end: float, **attributes):
+    """记录已知起止时间（time.perf_counter）的 span，用于事件回调等无法包住代码块的场景"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    if len(trace.spans) >= TRACE_MAX_SPANS:
+        trace.dropped += 1
+        return
+    item = Span(name, start, attributes)
+    item.end = end
+    trace.spans.append(item)
+
+class SpanExporter:
+    """后台线程按批导出 Trace，队列满时丢弃"""
+
+    def __init__(self, batch_size: int = TRACE_EXPORT_BATCH_SIZE, interval: float = TRACE_EXPORT_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue(TRACE_QUEUE_SIZE)
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def submit(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace.to_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5):
+        """等待已提交的 Trace 全部导出"""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch, waiters = [], []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self.export(batch)
+                    self.exported += len(batch)
+                except Exception as e:
+                    self.failed += len(batch)
+                    print(f"导出追踪数据失败: {e}")
+            for waiter in waiters:
+                waiter.set()
+
+    def export(self, traces: List[dict]):
+        raise NotImplementedError
+
+class JsonlSpanExporter(SpanExporter):
+    """追加写入本地 JSONL 文件，每行一个请求"""
+
+    def __init__(self, path: str = TRACE_EXPORT_PATH, **kwargs):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        super().__init__(**kwargs)
+
+    def export(self, traces: List[dict]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for trace in traces:
+                f.write(json.dumps(trace, ensure_ascii=False, default=str) + '\n')
+
+class OTLPSpanExporter(SpanExporter):
+    """以 OTLP/HTTP JSON 格式发送到 collector（如 OpenTelemetry Collector 或 Jaeger 的 4318 端口）"""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, service_name: str = 'product-crm', **kwargs):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        super().__init__(**kwargs)
+
+    def export(self, traces: List[dict]):
+        import requests
+        response = requests.post(self.endpoint, json=self.to_otlp(traces), timeout=5)
+        response.raise_for_status()
+
+    def to_otlp(self, traces: List[dict]) -> dict:
+        spans = []
+        for trace in traces:
+            start_ns = int(trace['start'] * 1e9)
+            root_id = uuid.uuid4().hex[:16]
+            spans.append(self._otlp_span(trace['trace_id'], root_id, None, trace['name'], start_ns,
+                                         trace['duration_ms'], trace['attributes'], None))
+            for item in trace['spans']:
+                spans.append(self._otlp_span(trace['trace_id'], uuid.uuid4().hex[:16], root_id, item['name'],
+                                             start_ns + int(item['offset_ms'] * 1e6), item['duration_ms'],
+                                             item['attributes'], item.get('error')))
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+            'scopeSpans': [{'scope': {'name': 'product_search.tracing'}, 'spans': spans}],
+        }]}
+
+    @staticmethod
+    def _otlp_span(trace_id, span_id, parent_id, name, start_ns, duration_ms, attributes, error) -> dict:
+        result = {
+            'traceId': trace_id,
+            'spanId': span_id,
+            'name': name,
+            'kind': 2 if parent_id is None else 1,  # SERVER / INTERNAL
+            'startTimeUnixNano': str(start_ns),
+            'endTimeUnixNano': str(start_ns + int(duration_ms * 1e6)),
+            'attributes': [{'key': key, 'value': {'stringValue': str(value)}} for key, value in attributes.items()],
+        }
+        if parent_id:
+            result['parentSpanId'] = parent_id
+        if error:
+            result['status'] = {'code': 2, 'message': error}
+        return result
+
+_exporter = None
+_exporter_pid = None
+_exporter_lock = threading.Lock()
+
+def get_exporter() -> Optional[SpanExporter]:
+    """本进程的导出器，首次导出时按 TRACE_EXPORTER 创建"""
+    global _exporter, _exporter_pid
+    if _exporter is None or _exporter_pid != os.getpid():
+        with _exporter_lock:
+            if _exporter is None or _exporter_pid != os.getpid():
+                if TRACE_EXPORTER == 'jsonl':
+                    _exporter = JsonlSpanExporter()
+                elif TRACE_EXPORTER == 'otlp':
+                    _exporter = OTLPSpanExporter()
+                else:
+                    _exporter = None
+                _exporter_pid = os.getpid()
+    return _exporter
+
+def set_exporter(exporter: Optional[SpanExporter]):
+    """替换本进程的导出器（测试或自定义 collector）"""
+    global _exporter, _exporter_pid
+    with _exporter_lock:
+        _exporter = exporter
+        _exporter_pid = os.getpid()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('trace_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('trace_query_start')
+    if not starts:
+        return
+    start = starts.pop()
+    record_span('db.query', start, time.perf_counter(), statement=' '.join(statement.split())[:200])
+
+_sqlalchemy_hooked = False
+
+def instrument_sqlalchemy():
+    """为所有 SQLAlchemy Engine（ORM 和索引连接池）的语句执行记录 db.query span"""
+    global _sqlalchemy_hooked
+    if _sqlalchemy_hooked:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _sqlalchemy_hooked = True
+
+def init_app(app):
+    """在 Flask 应用上启用请求追踪: 每个请求一个 Trace，响应带 Server-Timing 头"""
+    from flask import request, g
+
+    if not TRACE_ENABLED:
+        return
+    instrument_sqlalchemy()
+
+    @app.before_request
+    def _start_request_trace():
+        g.trace_token = start_trace(f'{request.method} {request.url_rule.rule if request.url_rule else request.path}',
+                                    force=request.headers.get('X-Trace') == '1')
+
+    @app.after_request
+    def _add_server_timing(response):
+        trace = current_trace()
+        if trace is not None:
+            trace.attributes['http.status_code'] = response.status_code
+            response.headers['Server-Timing'] = trace.server_timing()
+            # 抽样未命中的请求如果最终超过慢请求阈值也会导出，总是返回 ID 便于对照
+            response.headers['X-Trace-Id'] = trace.trace_id
+        return response
+
+    @app.teardown_request
+    def _finish_request_trace(exc):
+        token = g.pop('trace_token', None)
+        trace = current_trace()
+        if trace is not None and exc is not None:
+            trace.attributes['error'] = f'{type(exc).__name__}: {exc}'
+        finish_trace(token)
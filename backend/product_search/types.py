@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+from typing import Any, Dict
+
+@dataclass
+class ProductInfo:
+    """商品信息数据类"""
+    id: int
+    name: str
+    attributes: Dict[str, Any]  # 存储颜色、尺寸等属性
+    price: float
+    description: str
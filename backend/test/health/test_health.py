@@ -0,0 +1,61 @@
+import unittest
+import os
+import sys
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app import create_app
+from models import db
+
+class TestHealthEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_healthz(self):
+        """测试存活检查"""
+        response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['status'], 'ok')
+
+    def test_metrics(self):
+        """测试 /metrics 以 Prometheus 文本格式输出，且不会加载向量索引"""
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn('# TYPE product_search_stage_seconds histogram', response.get_data(as_text=True))
+        self.assertIsNone(__import__('product_search').peek_product_index())
+
+    def test_readyz_without_index(self):
+        """测试未启用向量索引时只检查数据库"""
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['checks']['database'], 'ok')
+        self.assertNotIn('index', response.json['checks'])
+
+    def test_readyz_waits_for_warmup(self):
+        """测试索引预热完成前返回 503，完成后返回 200 并报告索引概况"""
+        self.app.config['PRODUCT_INDEX_ENABLED'] = True
+        self.app.config['INDEX_WARMUP'] = True
+        with mock.patch('product_search.start_background_warmup'), \
+                mock.patch('product_search.get_index_status', return_value={'state': 'warming', 'error': None}):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json['checks']['index']['state'], 'warming')
+
+        ready = {'state': 'ready', 'warmup_seconds': 0.1, 'error': None, 'generation': 3, 'ntotal': 10}
+        with mock.patch('product_search.start_background_warmup'), \
+                mock.patch('product_search.get_index_status', return_value=ready):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['checks']['index']['ntotal'], 10)
+
+if __name__ == '__main__':
+    unittest.main()
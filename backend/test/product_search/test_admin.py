@@ -0,0 +1,50 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+from sqlalchemy import create_engine
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.index import VectorProductIndex
+from product_search.admin import compact, export_vectors, import_vectors, index_ids, iter_index_vectors
+
+class TestIndexAdmin(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite://')
+        self.index = self._empty_index()
+        self.ids = np.arange(100, 130, dtype=np.int64)
+        self.vectors = np.random.default_rng(0).random((30, 4), dtype=np.float32)
+        self.index.add_vectors(self.ids, self.vectors)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def _empty_index(self):
+        return VectorProductIndex(dimension=4, sync_interval=0, batch_max_size=1, replication_dir='',
+                                  engine=self.engine, autoload=False)
+
+    def test_export_import_roundtrip(self):
+        """测试分块导出 npy 后再导入，得到相同的 ID 和向量"""
+        output = os.path.join(self.tmpdir, 'export')
+        written = export_vectors(iter_index_vectors(self.index, chunk_size=7), 30, 4, output)
+        self.assertEqual(written, 30)
+
+        restored = self._empty_index()
+        self.assertEqual(import_vectors(restored, output, chunk_size=8), 30)
+        np.testing.assert_array_equal(index_ids(restored), self.ids)
+        np.testing.assert_array_equal(restored.index.reconstruct_batch(self.ids), self.vectors)
+
+    def test_compact_keeps_vectors(self):
+        """测试压缩后保留全部未删除的向量"""
+        self.index.remove_vectors(self.ids[:10])
+        generation = self.index.generation
+        result = compact(self.index, chunk_size=6)
+        self.assertEqual(result['ntotal'], 20)
+        self.assertGreater(self.index.generation, generation)
+        np.testing.assert_array_equal(self.index.index.reconstruct_batch(self.ids[10:]), self.vectors[10:])
+
+if __name__ == '__main__':
+    unittest.main()
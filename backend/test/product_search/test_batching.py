@@ -0,0 +1,89 @@
+import unittest
+import os
+import sys
+import threading
+from unittest import mock
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.batching import SearchBatcher
+from product_search import index as index_module
+
+def brute_force_search(matrix):
+    def search(queries, k):
+        distances = ((queries[:, None, :] - matrix[None, :, :]) ** 2).sum(-1)
+        order = np.argsort(distances, axis=1)[:, :k]
+        return np.take_along_axis(distances, order, 1), order.astype(np.int64)
+    return search
+
+class TestSearchBatcher(unittest.TestCase):
+    def setUp(self):
+        self.matrix = np.random.default_rng(0).random((100, 8), dtype=np.float32)
+        self.calls = []
+        search = brute_force_search(self.matrix)
+
+        def recording_search(queries, k):
+            self.calls.append(len(queries))
+            return search(queries, k)
+        self.batcher = SearchBatcher(recording_search, window_ms=50, max_batch=64)
+
+    def tearDown(self):
+        self.batcher.stop()
+
+    def test_concurrent_queries_are_merged(self):
+        """测试窗口内的并发查询合并为一次搜索，且各自拿到正确结果"""
+        results = {}
+        barrier = threading.Barrier(16)
+
+        def worker(i):
+            barrier.wait()
+            results[i] = self.batcher.search(self.matrix[i], 3)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertLess(len(self.calls), 16)
+        for i in range(16):
+            distances, ids = results[i]
+            self.assertEqual(ids.shape, (1, 3))
+            self.assertEqual(int(ids[0][0]), i)
+
+    def test_mixed_k_is_trimmed(self):
+        """测试不同 top_k 的查询合并后按各自的 k 截取"""
+        small = self.batcher.submit(self.matrix[1], 1)
+        large = self.batcher.submit(self.matrix[2], 5)
+        self.assertEqual(small.result()[1].shape, (1, 1))
+        self.assertEqual(large.result()[1].shape, (1, 5))
+
+    def test_errors_propagate(self):
+        """测试批量搜索出错时每个调用方都收到异常"""
+        def failing_search(queries, k):
+            raise RuntimeError('boom')
+        batcher = SearchBatcher(failing_search, window_ms=1)
+        try:
+            with self.assertRaises(RuntimeError):
+                batcher.search(self.matrix[0], 1)
+        finally:
+            batcher.stop()
+
+@unittest.skipIf(index_module.faiss is None, 'faiss 未安装')
+class TestFaissThreads(unittest.TestCase):
+    def setUp(self):
+        faiss = index_module.faiss
+        self.default_threads = faiss.omp_get_max_threads()
+        self.addCleanup(faiss.omp_set_num_threads, self.default_threads)
+
+    def test_only_serving_processes_limit_threads(self):
+        """测试创建索引不修改进程的 OpenMP 线程数，只有在线服务调用 limit_faiss_threads 时才限制"""
+        faiss = index_module.faiss
+        faiss.omp_set_num_threads(3)
+        index_module.VectorProductIndex(dimension=4, sync_interval=0, batch_max_size=1, replication_dir='', autoload=False)
+        self.assertEqual(faiss.omp_get_max_threads(), 3)
+        with mock.patch.object(index_module, 'FAISS_OMP_THREADS', 1):
+            index_module.limit_faiss_threads()
+        self.assertEqual(faiss.omp_get_max_threads(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
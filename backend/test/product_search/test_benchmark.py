@@ -0,0 +1,105 @@
+import unittest
+import os
+import sys
+import faiss
+import numpy as np
+from sqlalchemy import create_engine
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.index import VectorProductIndex, with_reduction
+from product_search.benchmark import run, synthetic_vectors
+
+class TestIndexBenchmark(unittest.TestCase):
+    def test_flat_recall_is_exact(self):
+        """测试平面索引的召回率为 1，近似索引的结果字段完整"""
+        vectors = synthetic_vectors(2000, dimension=32)
+        ids = np.arange(1, 2001, dtype=np.int64)
+        report = run(ids, vectors, ['Flat', 'HNSW16:efSearch=32', 'IVF32,Flat:nprobe=4'], num_queries=50)
+        results = {result['config']: result for result in report['results']}
+        self.assertEqual(results['Flat']['recall@10'], 1.0)
+        for result in report['results']:
+            self.assertEqual(result['ntotal'], 2000)
+            self.assertGreater(result['index_bytes'], 0)
+            self.assertIn('p99_ms', result['batched'])
+
+    def test_hnsw_removal_uses_tombstones(self):
+        """测试 HNSW 索引删除和更新向量后，搜索不再返回旧向量"""
+        engine = create_engine('sqlite://')
+        index = VectorProductIndex(dimension=8, sync_interval=0, batch_max_size=1, replication_dir='',
+                                   engine=engine, autoload=False, index_factory='HNSW16')
+        vectors = np.random.default_rng(0).random((50, 8), dtype=np.float32)
+        ids = np.arange(1, 51, dtype=np.int64)
+        index.build(ids, vectors)
+
+        index.remove_vectors(ids[:5])
+        self.assertEqual(index.ntotal, 45)
+        _, found = index.search_vectors(vectors[:5], 1)
+        self.assertFalse(np.isin(found, ids[:5]).any())
+
+        index.add_vectors(ids[:1], vectors[:1])
+        _, found = index.search_vectors(vectors[:1], 1)
+        self.assertEqual(found[0][0], 1)
+        self.assertEqual(index.ntotal, 46)
+        np.testing.assert_array_equal(np.sort(index.live_ids()), ids[np.r_[0, 5:50]])
+        engine.dispose()
+
+    def test_reduction_report(self):
+        """测试降维版本的召回损失与加速比字段"""
+        self.assertEqual(with_reduction('HNSW32', 128), 'PCA128,HNSW32')
+        self.assertEqual(with_reduction('IVF256,PQ16', 128, 'opq'), 'OPQ16_128,IVF256,PQ16')
+        self.assertEqual(with_reduction('PCA64,Flat', 128), 'PCA64,Flat')
+        self.assertEqual(with_reduction('Flat', 0), 'Flat')
+
+        vectors = synthetic_vectors(1000, dimension=32)
+        ids = np.arange(1, 1001, dtype=np.int64)
+        report = run(ids, vectors, ['Flat'], num_queries=20, reduce_dims=[16])
+        self.assertEqual([result['config'] for result in report['results']], ['Flat', 'PCA16,Flat'])
+        comparison = report['reduction'][0]
+        self.assertEqual(comparison['reduced_config'], 'PCA16,Flat')
+        self.assertGreaterEqual(comparison['recall_loss'], 0)
+        self.assertLess(comparison['index_bytes_ratio'], 1)
+        self.assertIn('batched_qps', comparison['speedup'])
+
+    def test_reduced_index_removal(self):
+        """测试带 PCA 变换的 HNSW 和 IVF 索引删除后不再返回旧向量"""
+        engine = create_engine('sqlite://')
+        vectors = np.random.default_rng(0).random((300, 16), dtype=np.float32)
+        ids = np.arange(1, 301, dtype=np.int64)
+        for factory in ('HNSW16', 'IVF4,Flat'):
+            index = VectorProductIndex(dimension=16, sync_interval=0, batch_max_size=1, replication_dir='',
+                                       engine=engine, autoload=False, index_factory=factory, reduce_dim=8)
+            index.build(ids, vectors)
+            index.remove_vectors(ids[:5])
+            self.assertEqual(index.ntotal, 295)
+            _, found = index.search_vectors(vectors[:5], 3)
+            self.assertFalse(np.isin(found, ids[:5]).any())
+        engine.dispose()
+
+    def test_binary_stage_reranks_with_original_vectors(self):
+        """测试二值初筛索引每张图片只保存 dimension/8 字节，结果按原始向量的 L2 距离重排"""
+        engine = create_engine('sqlite://')
+        vectors = synthetic_vectors(500, dimension=64)
+        ids = np.arange(1, 501, dtype=np.int64)
+        table = dict(zip(ids.tolist(), vectors))
+        source = lambda wanted: (np.array([i for i in wanted if i in table], dtype=np.int64),
+                                 np.array([table[i] for i in wanted if i in table], dtype=np.float32))
+        index = VectorProductIndex(dimension=64, sync_interval=0, batch_max_size=1, replication_dir='',
+                                   engine=engine, autoload=False, index_factory='ITQ,LSHt',
+                                   rerank_candidates=50, vector_source=source)
+        index.build(ids, vectors)
+        self.assertTrue(index.binary_stage)
+        self.assertEqual(faiss.downcast_index(faiss.downcast_index(index.index.index).index).code_size, 8)
+
+        distances, found = index.search_vectors(vectors[:3], 5)
+        np.testing.assert_array_equal(found[:, 0], ids[:3])
+        np.testing.assert_allclose(distances[:, 0], 0, atol=1e-4)
+        self.assertTrue((np.diff(distances, axis=1) >= 0).all())
+        np.testing.assert_array_equal(index.reconstruct_vectors(ids[[4, 2]]), vectors[[4, 2]])
+
+        # 数据库中已删除的候选不会返回
+        del table[1]
+        _, found = index.search_vectors(vectors[:1], 5)
+        self.assertNotIn(1, found[0])
+        engine.dispose()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.dedup import _normalize, cluster_products, iter_similar_pairs
+
+class TestDedup(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(50, 16)).astype(np.float32)
+        # 商品 100/101/102 各有一张几乎相同的图片，商品 103 的两张图片相同（同一商品内部不算重复）
+        self.vectors[10] = self.vectors[3] + 0.01
+        self.vectors[40] = self.vectors[3] - 0.01
+        self.vectors[21] = self.vectors[20]
+        self.image_ids = np.arange(1000, 1050, dtype=np.int64)
+        self.product_ids = np.arange(50, dtype=np.int64)
+        self.product_ids[[3, 10, 40]] = [100, 101, 102]
+        self.product_ids[[20, 21]] = 103
+
+    def test_blocked_pairs_match_full_matrix(self):
+        """测试分块计算与整体矩阵乘积得到相同的图片对"""
+        vectors = _normalize(self.vectors)
+        scores = vectors @ vectors.T
+        expected = {(a, b) for a, b in zip(*np.nonzero(scores >= 0.6)) if a < b}
+        found = set()
+        for rows_a, rows_b, _ in iter_similar_pairs(vectors, 0.6, block_size=7):
+            found.update(zip(rows_a.tolist(), rows_b.tolist()))
+        self.assertEqual(found, expected)
+
+    def test_cluster_products(self):
+        """测试跨商品的重复图片合并为一组"""
+        clusters = cluster_products(self.image_ids, self.product_ids, _normalize(self.vectors), 0.99, block_size=16)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual([m['product_id'] for m in clusters[0]], [100, 101, 102])
+        self.assertEqual({m['image_id'] for m in clusters[0]}, {1003, 1010, 1040})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.embedding import FakeEmbedder, create_embedder
+
+class TestFakeEmbedder(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_vectors_follow_image_content(self):
+        """测试同一内容得到相同的单位向量，不同内容得到不同向量"""
+        embedder = FakeEmbedder(dimension=16, latency_ms=0, jitter_ms=0)
+        first = embedder.embed_image(self._write('a.jpg', b'image-a'))
+        copy = embedder.embed_image(self._write('copy.jpg', b'image-a'))
+        other = embedder.embed_image(self._write('b.jpg', b'image-b'))
+        np.testing.assert_array_equal(first, copy)
+        self.assertFalse(np.allclose(first, other))
+        self.assertAlmostEqual(float(np.linalg.norm(first)), 1.0, places=5)
+        self.assertEqual(embedder.stats()['calls'], 3)
+
+    def test_unknown_backend(self):
+        """测试未知的特征提取后端会报错"""
+        self.assertIsInstance(create_embedder(8, 'fake'), FakeEmbedder)
+        with self.assertRaises(ValueError):
+            create_embedder(8, 'unknown')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.db import IndexDatabase, STATEMENT_TIMEOUT_OPTION, with_execution_time_hint
+
+class TestIndexDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir, 'index.db')}",
+                               poolclass=QueuePool, pool_size=1, max_overflow=0, pool_timeout=0.2)
+        self.db = IndexDatabase(engine)
+        with self.db.connect() as conn:
+            conn.exec_driver_sql("CREATE TABLE product_images (id INTEGER PRIMARY KEY, image_path TEXT)")
+            conn.exec_driver_sql("INSERT INTO product_images (id, image_path) VALUES (?, ?)", (1, 'a.jpg'))
+            conn.commit()
+
+    def tearDown(self):
+        self.db.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_connections_are_returned(self):
+        """测试连接用完即归还，多线程依次借用同一个连接池"""
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(5):
+                    with self.db.connect() as conn:
+                        conn.exec_driver_sql("SELECT image_path FROM product_images").fetchall()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        stats = self.db.stats()
+        self.assertEqual(stats['checkouts'], 21)
+        self.assertEqual(stats['pool_checkedout'], 0)
+
+    def test_checkout_timeout_is_counted(self):
+        """测试连接池耗尽时等待超时并计入统计"""
+        with self.db.connect():
+            with self.assertRaises(PoolTimeoutError):
+                with self.db.connect():
+                    pass
+        stats = self.db.stats()
+        self.assertEqual(stats['checkout_timeouts'], 1)
+        self.assertGreaterEqual(stats['wait_max_ms'], 0.0)
+
+    def test_uncommitted_changes_are_rolled_back(self):
+        """测试未提交的事务在归还连接时回滚"""
+        with self.db.connect() as conn:
+            conn.exec_driver_sql("DELETE FROM product_images")
+        with self.db.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("SELECT COUNT(*) FROM product_images").scalar(), 1)
+
+    def test_stats_on_non_queue_pool(self):
+        """测试 SingletonThreadPool 等 size 不是方法的连接池也能返回统计"""
+        db = IndexDatabase(create_engine('sqlite://'))
+        with db.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+        stats = db.stats()
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertNotIn('pool_size', stats)
+        db.engine.dispose()
+
+    def test_statement_timeout_stays_with_checkout(self):
+        """测试语句超时只属于本次借出的连接，同一连接池上之后的查询不带超时"""
+        with self.db.connect() as conn:
+            self.assertEqual(conn.get_execution_options()[STATEMENT_TIMEOUT_OPTION], self.db.statement_timeout_ms)
+        with self.db.connect(statement_timeout_ms=0) as conn:
+            self.assertEqual(conn.get_execution_options()[STATEMENT_TIMEOUT_OPTION], 0)
+        with self.db.engine.connect() as conn:
+            self.assertNotIn(STATEMENT_TIMEOUT_OPTION, conn.get_execution_options())
+
+    def test_execution_time_hint(self):
+        """测试只给 SELECT 加 MAX_EXECUTION_TIME 提示"""
+        self.assertEqual(with_execution_time_hint("  select id FROM product_images", 3000),
+                         "SELECT /*+ MAX_EXECUTION_TIME(3000) */ id FROM product_images")
+        self.assertEqual(with_execution_time_hint("SELECT 1", 0), "SELECT 1")
+        self.assertEqual(with_execution_time_hint("UPDATE products SET name = 'SELECT'", 3000),
+                         "UPDATE products SET name = 'SELECT'")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import numpy as np
+from PIL import Image
+from sqlalchemy import create_engine, event
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.server import create_index_server
+from product_search.client import IndexClient, IndexServerError, RemoteProductIndex
+from product_search.embedding import FakeEmbedder
+from product_search.types import ProductInfo
+
+class InMemoryIndex:
+    """只实现索引服务所需接口的内存索引，用暴力搜索代替 FAISS"""
+    dimension = 4
+    generation = 0
+    last_change_seq = 0
+
+    def __init__(self):
+        self.vectors = {}
+        self.sync_count = 0
+
+    @property
+    def ntotal(self):
+        return len(self.vectors)
+
+    def _ensure_fresh(self):
+        pass
+
+    def sync_changes(self):
+        self.sync_count += 1
+        return 0
+
+    def search_vectors(self, queries, k):
+        ids = np.array(sorted(self.vectors), dtype=np.int64)
+        matrix = np.vstack([self.vectors[i] for i in ids])
+        distances = ((queries[:, None, :] - matrix[None, :, :]) ** 2).sum(-1)
+        order = np.argsort(distances, axis=1)[:, :k]
+        return np.take_along_axis(distances, order, 1).astype(np.float32), ids[order]
+
+    def add_vectors(self, ids, vectors):
+        for image_id, vector in zip(ids, vectors):
+            self.vectors[int(image_id)] = np.array(vector)
+        self.generation += 1
+
+    def remove_vectors(self, ids):
+        removed = sum(1 for image_id in ids if self.vectors.pop(int(image_id), None) is not None)
+        self.generation += 1
+        return removed
+
+class TestIndexServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.address = f"unix://{os.path.join(self.tmp_dir, 'index.sock')}"
+        self.index = InMemoryIndex()
+        self.index.add_vectors([1, 2, 3], np.eye(3, 4, dtype=np.float32))
+        self.server = create_index_server(self.index, self.address)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = IndexClient(self.address, pool_size=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_search(self):
+        """测试搜索返回与 faiss 一致的 (distances, ids)"""
+        distances, ids = self.client.search(np.array([0, 1, 0, 0], dtype=np.float32), 2)
+        self.assertEqual(ids.shape, (1, 2))
+        self.assertEqual(int(ids[0][0]), 2)
+        self.assertAlmostEqual(float(distances[0][0]), 0.0)
+
+    def test_pipelined_search(self):
+        """测试流水线批量搜索按请求顺序返回结果"""
+        queries = [np.eye(3, 4, dtype=np.float32)[i] for i in (2, 0, 1)]
+        results = self.client.search_many(queries, 1)
+        self.assertEqual([int(ids[0][0]) for _, ids in results], [3, 1, 2])
+
+    def test_add_remove_stats(self):
+        """测试增删向量并通过 stats 查看数量"""
+        self.assertEqual(self.client.add([9], np.ones((1, 4), dtype=np.float32)), 1)
+        self.assertEqual(self.client.stats()['ntotal'], 4)
+        self.assertEqual(self.client.remove([9, 10]), 1)
+        self.assertEqual(self.client.stats()['ntotal'], 3)
+
+    def test_error_keeps_connection_usable(self):
+        """测试服务端返回错误后连接仍可继续使用"""
+        with self.assertRaises(IndexServerError):
+            self.client.search(np.ones((1, 5), dtype=np.float32), 1)
+        self.assertTrue(self.client.ping())
+
+    def test_pipeline_error_drains_responses(self):
+        """测试流水线中第一个请求出错时读完其余响应，连接归还后仍能正常使用"""
+        queries = [np.ones((1, 5), dtype=np.float32), np.eye(3, 4, dtype=np.float32)[1]]
+        with self.assertRaises(IndexServerError):
+            self.client.search_many(queries, 1)
+        for _ in range(3):
+            _, ids = self.client.search(np.eye(3, 4, dtype=np.float32)[2], 1)
+            self.assertEqual(int(ids[0][0]), 3)
+
+    def test_remote_warmup_status(self):
+        """测试 RemoteProductIndex 的预热状态来自索引服务，本进程没有的磁盘倒排表和代表图片返回 None"""
+        # 预热按 top_k=10 搜索，内存索引不会补齐不足的结果
+        self.index.add_vectors(range(4, 14), np.random.default_rng(0).random((10, 4), dtype=np.float32))
+        engine = create_engine('sqlite://')
+        remote = RemoteProductIndex(self.address, dimension=4, pool_size=1, engine=engine)
+        try:
+            status = remote.warmup_status()
+            self.assertEqual(status['ntotal'], 13)
+            self.assertIsNone(status['ondisk'])
+            self.assertIsNone(status['representatives'])
+            self.assertEqual(remote.warm_up(num_queries=2)['state'], 'ready')
+        finally:
+            remote.client.close()
+            engine.dispose()
+
+    def test_remote_stats_from_search_response(self):
+        """测试 RemoteProductIndex 从搜索响应读取 ntotal，搜索后不再单独请求 stats；大批量查询流水线发送"""
+        engine = create_engine('sqlite://')
+        remote = RemoteProductIndex(self.address, dimension=4, pool_size=1, engine=engine)
+        try:
+            self.assertEqual(remote.ntotal, 3)
+            _, ids = remote.search_vectors(np.eye(3, 4, dtype=np.float32)[1], 1)
+            self.assertEqual(int(ids[0][0]), 2)
+            requests = self.server.request_count
+            self.assertEqual((remote.ntotal, remote.generation), (3, 1))
+            self.assertEqual(self.server.request_count, requests)
+
+            self.index.add_vectors([4], np.ones((1, 4), dtype=np.float32))
+            queries = np.tile(np.vstack([np.eye(3, 4), np.ones((1, 4))]).astype(np.float32), (50, 1))
+            _, ids = remote.search_vectors(queries, 1)
+            self.assertEqual(ids.shape, (200, 1))
+            self.assertEqual(ids[:4, 0].tolist(), [1, 2, 3, 4])
+            self.assertEqual(self.server.request_count, requests + 4)
+            self.assertEqual((remote.ntotal, remote.generation), (4, 2))
+        finally:
+            remote.client.close()
+            engine.dispose()
+
+    def test_remote_add_product(self):
+        """测试 RemoteProductIndex 添加商品时写入数据库和变更日志，并通知索引服务同步"""
+        engine = create_engine('sqlite://')
+        # 索引代码按 MySQL 书写：%s 占位符和 ON DUPLICATE KEY UPDATE
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, params, context, many: (
+                         statement.replace('%s', '?').replace('ON DUPLICATE KEY UPDATE',
+                                                              'ON CONFLICT (image_path) DO UPDATE SET'), params),
+                     retval=True)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, attributes TEXT, "
+                                 "price REAL, description TEXT)")
+            conn.exec_driver_sql("CREATE TABLE product_images (id INTEGER PRIMARY KEY, product_id INT, "
+                                 "image_path TEXT UNIQUE, vector BLOB, image_hash INT)")
+            conn.exec_driver_sql("CREATE TABLE index_changes (seq INTEGER PRIMARY KEY, op TEXT, image_id INT)")
+        image_path = os.path.join(self.tmp_dir, 'product.png')
+        Image.fromarray(np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8)).save(image_path)
+        remote = RemoteProductIndex(self.address, dimension=4, pool_size=1, engine=engine)
+        remote.embedder = FakeEmbedder(4, latency_ms=0, jitter_ms=0)
+        try:
+            remote.add_product(ProductInfo(id=1, name='衬衫', attributes={}, price=99.0, description=''), image_path)
+            with engine.connect() as conn:
+                self.assertEqual(conn.exec_driver_sql("SELECT op, image_id FROM index_changes").fetchall(), [('add', 1)])
+            self.assertEqual(self.index.sync_count, 1)
+        finally:
+            remote.client.close()
+            engine.dispose()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class TestLazyImport(unittest.TestCase):
+    def test_blueprints_do_not_load_index(self):
+        """测试导入蓝图和 product_search 包时不加载 faiss 等重量级依赖"""
+        code = (
+            "import sys\n"
+            "import product_search\n"
+            "from blueprints.products import products_bp\n"
+            "from product_search import ProductInfo\n"
+            "heavy = [m for m in ('faiss', 'dashscope', 'pandas', 'openai', 'pypinyin', 'oss2') if m in sys.modules]\n"
+            "print(','.join(heavy))\n"
+        )
+        result = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.metrics import Counter, Histogram, Registry
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_histogram_text_format(self):
+        """测试直方图按累计分桶输出 _bucket/_sum/_count"""
+        histogram = Histogram('stage_seconds', '阶段耗时', ['stage'], buckets=(0.1, 1.0), registry=self.registry)
+        histogram.observe(0.05, stage='faiss_search')
+        histogram.observe(0.5, stage='faiss_search')
+        histogram.observe(5, stage='faiss_search')
+        lines = self.registry.render().splitlines()
+        self.assertIn('# TYPE stage_seconds histogram', lines)
+        self.assertIn('stage_seconds_bucket{stage="faiss_search",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="faiss_search",le="1"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="faiss_search",le="+Inf"} 3', lines)
+        self.assertIn('stage_seconds_sum{stage="faiss_search"} 5.55', lines)
+        self.assertIn('stage_seconds_count{stage="faiss_search"} 3', lines)
+
+    def test_counter_labels(self):
+        """测试计数器按标签累加，标签不匹配时报错"""
+        counter = Counter('errors_total', '错误数', ['reason'], registry=self.registry)
+        counter.inc(reason='rate_limit')
+        counter.inc(2, reason='rate_limit')
+        self.assertEqual(counter.value(reason='rate_limit'), 3)
+        self.assertIn('errors_total{reason="rate_limit"} 3', self.registry.render())
+        with self.assertRaises(ValueError):
+            counter.inc(status='ok')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import os
+import sys
+import faiss
+import numpy as np
+from sqlalchemy import create_engine
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.numpy_index import NumpyIndex
+from product_search.index import VectorProductIndex, serialize_index
+from product_search.admin import index_memory_bytes
+
+class TestNumpyIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.random((3000, 32), dtype=np.float32)
+        self.ids = np.arange(1, 3001, dtype=np.int64) * 10
+        self.queries = rng.random((20, 32), dtype=np.float32)
+        self.exact = faiss.IndexIDMap2(faiss.IndexFlatL2(32))
+        self.exact.add_with_ids(self.vectors, self.ids)
+
+    def test_matches_faiss_flat(self):
+        """测试分块、多线程和 float16 存储的结果与 faiss 平面索引一致"""
+        expected_distances, expected_ids = self.exact.search(self.queries, 10)
+        for index in (NumpyIndex(32), NumpyIndex(32, block_size=700, threads=4)):
+            index.add_with_ids(self.vectors, self.ids)
+            distances, ids = index.search(self.queries, 10)
+            np.testing.assert_array_equal(ids, expected_ids)
+            np.testing.assert_allclose(distances, expected_distances, rtol=1e-4, atol=1e-4)
+
+        half = NumpyIndex(32, 'float16', block_size=700)
+        half.add_with_ids(self.vectors, self.ids)
+        _, ids = half.search(self.queries, 10)
+        recall = np.mean([len(np.intersect1d(a, b)) / 10 for a, b in zip(ids, expected_ids)])
+        self.assertGreater(recall, 0.9)
+
+    def test_remove_and_serialize(self):
+        """测试删除、覆盖、不足 top_k 时的填充以及序列化往返"""
+        index = NumpyIndex(32, block_size=500)
+        index.add_with_ids(self.vectors, self.ids)
+        self.assertEqual(index.remove_ids(self.ids[:2000]), 2000)
+        self.assertEqual(index.ntotal, 1000)
+        index.add_with_ids(self.vectors[2000:2001] + 1, self.ids[2000:2001])
+        np.testing.assert_array_equal(index.live_ids(), self.ids[2000:])
+        np.testing.assert_allclose(index.reconstruct_batch(self.ids[2000:2001]), self.vectors[2000:2001] + 1)
+
+        _, ids = index.search(self.vectors[:1], 5)
+        self.assertFalse(np.isin(ids, self.ids[:2000]).any())
+
+        small = NumpyIndex(32)
+        small.add_with_ids(self.vectors[:3], self.ids[:3])
+        distances, ids = small.search(self.queries[:2], 5)
+        self.assertEqual((ids[:, 3:] == -1).sum(), 4)
+        self.assertTrue(np.isinf(distances[:, 3:]).all())
+
+        restored = NumpyIndex.deserialize(index.serialize())
+        np.testing.assert_array_equal(restored.live_ids(), index.live_ids())
+        np.testing.assert_array_equal(restored.search(self.queries, 5)[1], index.search(self.queries, 5)[1])
+
+    def test_vector_product_index(self):
+        """测试 VectorProductIndex 使用 NumPy 引擎时的搜索、删除、保存与统计"""
+        engine = create_engine('sqlite://')
+        index = VectorProductIndex(dimension=32, sync_interval=0, batch_max_size=1, replication_dir='',
+                                   engine=engine, autoload=False, index_factory='NumpyFlat',
+                                   search_params='threads=2,block_size=1000')
+        index.build(self.ids, self.vectors)
+        self.assertEqual(index.index.threads, 2)
+        _, found = index.search_vectors(self.vectors[:3], 1)
+        np.testing.assert_array_equal(found[:, 0], self.ids[:3])
+        index.remove_vectors(self.ids[:1])
+        self.assertEqual(index.ntotal, 2999)
+        self.assertGreaterEqual(index_memory_bytes(index), 3000 * 32 * 4)
+        self.assertGreater(serialize_index(index.index).size, 0)
+        self.assertEqual(index.warm_up(5)['state'], 'ready')
+        engine.dispose()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+from sqlalchemy import create_engine
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.index import VectorProductIndex
+from product_search.ondisk import ondisk_lists
+from product_search.admin import compact
+
+class TestOnDiskInvertedLists(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite://')
+        rng = np.random.default_rng(0)
+        self.vectors = rng.random((2000, 16), dtype=np.float32)
+        self.ids = np.arange(1, 2001, dtype=np.int64)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def _index(self, ondisk_dir, cache_mb=0):
+        return VectorProductIndex(dimension=16, sync_interval=0, batch_max_size=1, replication_dir='',
+                                  engine=self.engine, autoload=False, index_factory='IVF16,Flat',
+                                  search_params='nprobe=4', ondisk_dir=ondisk_dir, ondisk_cache_mb=cache_mb)
+
+    def test_results_match_memory_index(self):
+        """测试磁盘倒排表与内存倒排表的搜索结果一致，内存预算内只保留最近探测的倒排表"""
+        memory = self._index('')
+        ondisk = self._index(self.tmpdir)
+        memory.build(self.ids, self.vectors)
+        ondisk.build(self.ids, self.vectors)
+        self.assertIsNone(ondisk_lists(memory.index))
+        self.assertIsNotNone(ondisk_lists(ondisk.index))
+
+        _, expected = memory.search_vectors(self.vectors[:20], 5)
+        _, found = ondisk.search_vectors(self.vectors[:20], 5)
+        np.testing.assert_array_equal(found, expected)
+        # 预算为 0 时每次搜索后只保留一个倒排表
+        stats = ondisk.list_cache.stats()
+        self.assertEqual(stats['lists'], 1)
+        self.assertGreater(stats['evictions'], 0)
+
+        ondisk.remove_vectors(self.ids[:1])
+        _, found = ondisk.search_vectors(self.vectors[:1], 1)
+        self.assertNotEqual(found[0][0], 1)
+
+    def test_rebuild_replaces_file(self):
+        """测试重建索引后使用新的倒排表文件并删除旧文件"""
+        index = self._index(self.tmpdir, cache_mb=16)
+        index.build(self.ids, self.vectors)
+        old_file = ondisk_lists(index.index).filename
+        index.remove_vectors(self.ids[:10])
+        compact(index)
+        new_file = ondisk_lists(index.index).filename
+        self.assertNotEqual(new_file, old_file)
+        self.assertEqual(os.listdir(self.tmpdir), [os.path.basename(new_file)])
+        self.assertEqual(index.ntotal, 1990)
+        _, found = index.search_vectors(self.vectors[10:11], 1)
+        self.assertEqual(found[0][0], 11)
+
+if __name__ == '__main__':
+    unittest.main()
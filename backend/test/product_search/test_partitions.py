@@ -0,0 +1,69 @@
+import unittest
+import os
+import sys
+import numpy as np
+from sqlalchemy import create_engine
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.index import VectorProductIndex
+from product_search.partitions import PartitionSet
+
+class TestPartitionSet(unittest.TestCase):
+    def setUp(self):
+        self.ids = list(range(100, 112))
+        self.values = ['工厂A'] * 5 + ['工厂B'] * 4 + [None] * 3
+        self.partitions = PartitionSet()
+        self.partitions.update(self.ids, self.values)
+
+    def test_members(self):
+        """测试按分区取出图片ID，不存在的分区忽略"""
+        np.testing.assert_array_equal(self.partitions.members(['工厂B', '工厂A']), self.ids[:9])
+        np.testing.assert_array_equal(self.partitions.members(['', '不存在']), self.ids[9:])
+        self.assertEqual(len(self.partitions.members(['不存在'])), 0)
+
+    def test_move_and_remove(self):
+        """测试图片移动到新分区、删除后分区统计随之变化"""
+        self.assertEqual(self.partitions.sizes(), {'工厂A': 5, '工厂B': 4, '': 3})
+        self.partitions.members(['工厂A'])
+        self.partitions.update([100, 101], ['工厂B', '工厂C'])
+        self.partitions.remove(self.ids[9:])
+        self.assertEqual(self.partitions.sizes(), {'工厂B': 5, '工厂A': 3, '工厂C': 1})
+        self.assertEqual(self.partitions.partition_of(101), '工厂C')
+        self.assertIsNone(self.partitions.partition_of(110))
+        np.testing.assert_array_equal(self.partitions.members(['工厂A']), [102, 103, 104])
+
+class TestPartitionSearch(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        rng = np.random.default_rng(0)
+        self.vectors = rng.random((600, 16), dtype=np.float32)
+        self.ids = np.arange(1, 601, dtype=np.int64)
+        self.values = ['工厂A' if image_id % 3 == 0 else '工厂B' for image_id in self.ids]
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_search_uses_main_index(self):
+        """测试各类主索引上的分区搜索只返回分区内的图片，精确索引的结果与对分区暴力搜索一致"""
+        # 图片 3 属于工厂A，搜索前删除
+        in_a = np.array([value == '工厂A' for value in self.values]) & (self.ids != 3)
+        query = self.vectors[:4] + 0.01
+        exact = np.argsort(((query[:, None, :] - self.vectors[None, in_a]) ** 2).sum(-1), axis=1)[:, :5]
+        for factory in ('Flat', 'SQ8', 'HNSW16', 'IVF8,Flat', 'PQ4x4', 'NumpyFlat'):
+            index = VectorProductIndex(dimension=16, sync_interval=0, batch_max_size=1, replication_dir='',
+                                       engine=self.engine, autoload=False, index_factory=factory,
+                                       partition_column='factory_name')
+            index.build(self.ids, self.vectors)
+            index.partitions.update(self.ids, self.values)
+            index.remove_vectors(self.ids[2:3])
+            index.partitions.remove(self.ids[2:3])
+
+            _, found = index.search_partitions(query, 5, ('工厂A',))
+            self.assertTrue((found % 3 == 0).all(), factory)
+            self.assertNotIn(3, found)
+            if factory in ('Flat', 'NumpyFlat'):
+                np.testing.assert_array_equal(found, self.ids[in_a][exact])
+            _, found = index.search_partitions(query, 5, ('不存在',))
+            self.assertTrue((found == -1).all())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+from PIL import Image
+from sqlalchemy import create_engine, event
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.phash import HashIndex, image_hash, hamming
+from product_search.index import VectorProductIndex
+from product_search.embedding import FakeEmbedder
+
+class TestImageHash(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        # 平滑的渐变加少量噪声，接近真实商品图
+        x = np.linspace(0, 255, 256)
+        base = np.clip(np.add.outer(x, x) / 2 + rng.normal(0, 10, (256, 256)), 0, 255).astype(np.uint8)
+        self.original = os.path.join(self.tmpdir, 'original.png')
+        Image.fromarray(base).convert('RGB').save(self.original)
+        self.other = os.path.join(self.tmpdir, 'other.png')
+        Image.fromarray(base[:, ::-1]).convert('RGB').save(self.other)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_recompressed_copy_is_close(self):
+        """测试重新压缩和缩放后的图片哈希相近，不同图片相差较大"""
+        copy = os.path.join(self.tmpdir, 'copy.jpg')
+        with Image.open(self.original) as img:
+            img.resize((180, 180)).save(copy, quality=60)
+        value = image_hash(self.original)
+        self.assertTrue(-(1 << 63) <= value < (1 << 63))
+        self.assertLessEqual(hamming(value, image_hash(copy)), 4)
+        self.assertGreater(hamming(value, image_hash(self.other)), 10)
+
+class TestHashIndex(unittest.TestCase):
+    def test_search_within_distance(self):
+        """测试只返回距离不超过阈值的图片，并支持更新和删除"""
+        index = HashIndex(max_distance=4)
+        base = 0x0F0F_F0F0_1234_5678
+        index.update([(1, base), (2, base ^ 0b111), (3, base ^ 0xFFFF), (4, -1)])
+        self.assertEqual(index.search(base), [(1, 0), (2, 3)])
+        self.assertEqual(index.search(base, top_k=1), [(1, 0)])
+        self.assertEqual(index.search(-1 ^ 1), [(4, 1)])
+
+        index.update([(2, None)])
+        index.remove([1])
+        self.assertEqual(index.search(base), [])
+        self.assertEqual(len(index), 2)
+
+class TestHashSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite://')
+        # 索引代码按 MySQL 驱动的 %s 占位符书写
+        event.listen(self.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, params, context, many: (statement.replace('%s', '?'), params),
+                     retval=True)
+        self.index = VectorProductIndex(dimension=16, sync_interval=0, batch_max_size=1, replication_dir='',
+                                        engine=self.engine, autoload=False)
+        self.index.embedder = FakeEmbedder(16, latency_ms=0, jitter_ms=0)
+        self.index.result_cache = None
+        rng = np.random.default_rng(1)
+        self.paths = []
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE product_images (id INTEGER PRIMARY KEY, product_id INT, "
+                                 "image_path TEXT, vector BLOB, image_hash INT)")
+            conn.exec_driver_sql("CREATE TABLE index_changes (seq INTEGER PRIMARY KEY, op TEXT, image_id INT)")
+            for image_id in range(1, 6):
+                path = os.path.join(self.tmpdir, f'{image_id}.png')
+                Image.fromarray(rng.integers(0, 255, (8, 8), dtype=np.uint8)).resize((128, 128)).convert('RGB').save(path)
+                self.paths.append(path)
+                conn.exec_driver_sql("INSERT INTO product_images VALUES (?, ?, ?, ?, ?)",
+                                     (image_id, image_id, path, self.index.extract_feature(path).tobytes(), image_hash(path)))
+        self.index._load_vectors()
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_hash_hit_is_topped_up_with_vector_results(self):
+        """测试感知哈希命中时排在最前面，并由向量检索补足 top_k 个结果"""
+        copy = os.path.join(self.tmpdir, 'copy.jpg')
+        with Image.open(self.paths[0]) as img:
+            img.resize((100, 100)).save(copy, quality=70)
+        distance = hamming(image_hash(copy), image_hash(self.paths[0]))
+        self.assertLessEqual(distance, 4)
+
+        results = self.index.search_similar_images(copy, top_k=3)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['image_path'], self.paths[0])
+        self.assertAlmostEqual(results[0]['similarity'], 1 - distance / 64)
+        self.assertEqual(len({item['image_path'] for item in results}), 3)
+        self.assertTrue(all(item['similarity'] < results[0]['similarity'] for item in results[1:]))
+
+if __name__ == '__main__':
+    unittest.main()
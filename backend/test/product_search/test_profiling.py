@@ -0,0 +1,70 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import time
+from unittest import mock
+from flask import Flask, jsonify
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search import profiling
+from blueprints.admin import admin_bp
+
+def busy_search():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+class TestRequestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.patches = [
+            mock.patch.object(profiling, 'ADMIN_TOKEN', 'secret'),
+            mock.patch.object(profiling, 'PROFILE_DIR', self.tmpdir),
+            mock.patch.object(profiling, 'PROFILE_INTERVAL_MS', 1),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.app = Flask(__name__)
+        profiling.init_app(self.app)
+        self.app.register_blueprint(admin_bp)
+
+        @self.app.route('/api/products/search', methods=['POST'])
+        def search():
+            busy_search()
+            return jsonify([])
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_header_triggers_sampling_profile(self):
+        """测试带管理令牌的请求生成折叠栈文件，并可通过管理接口列出"""
+        response = self.client.post('/api/products/search', headers={'X-Profile': 'secret'})
+        profile_id = response.headers['X-Profile-Id']
+        with open(os.path.join(self.tmpdir, f'{profile_id}.folded')) as f:
+            folded = f.read()
+        self.assertIn('busy_search', folded)
+
+        listing = self.client.get('/api/admin/profiles', headers={'X-Admin-Token': 'secret'})
+        self.assertEqual(listing.json['profiles'][0]['id'], profile_id)
+        self.assertEqual(listing.json['profiles'][0]['reason'], 'header')
+        self.assertEqual(self.client.get('/api/admin/profiles').status_code, 403)
+
+    def test_cprofile_mode(self):
+        """测试 cProfile 模式输出 pstats 文件"""
+        with mock.patch.object(profiling, 'PROFILE_MODE', 'cprofile'):
+            response = self.client.post('/api/products/search', headers={'X-Profile': 'secret'})
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, f"{response.headers['X-Profile-Id']}.prof")))
+
+    def test_not_profiled_without_token(self):
+        """测试令牌错误或未带令牌时不剖析"""
+        response = self.client.post('/api/products/search', headers={'X-Profile': 'wrong'})
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(profiling.list_profiles(), [])
+
+if __name__ == '__main__':
+    unittest.main()
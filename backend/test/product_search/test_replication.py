@@ -0,0 +1,117 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.replication import IndexWAL, WALReader, WALTruncatedError, WALLockedError, SnapshotStore, OP_UPSERT, OP_REMOVE
+
+class TestIndexWAL(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wal_dir = os.path.join(self.tmp_dir, 'wal')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _vector(self, value):
+        return np.full(4, value, dtype=np.float32)
+
+    def test_append_and_read(self):
+        """测试追加记录后可以按 LSN 读回"""
+        wal = IndexWAL(self.wal_dir)
+        wal.append([(1, OP_UPSERT, 10, self._vector(1)), (2, OP_REMOVE, 11, None)])
+        wal.close()
+
+        records = list(IndexWAL(self.wal_dir).read_from(0))
+        self.assertEqual([(r.lsn, r.change_seq, r.op, r.image_id) for r in records],
+                         [(1, 1, OP_UPSERT, 10), (2, 2, OP_REMOVE, 11)])
+        np.testing.assert_array_equal(records[0].vector, self._vector(1))
+        self.assertIsNone(records[1].vector)
+
+    def test_reopen_truncates_torn_tail(self):
+        """测试重新打开时截掉写了一半的尾部记录，后续追加仍可读"""
+        wal = IndexWAL(self.wal_dir)
+        wal.append([(1, OP_UPSERT, 10, self._vector(1))])
+        wal.close()
+        segment = os.path.join(self.wal_dir, wal.segments()[-1])
+        with open(segment, 'ab') as f:
+            f.write(b'\x05' * 7)
+
+        wal = IndexWAL(self.wal_dir)
+        self.assertEqual(wal.last_lsn, 1)
+        wal.append([(2, OP_UPSERT, 12, self._vector(2))])
+        wal.close()
+        self.assertEqual([r.image_id for r in wal.read_from(0)], [10, 12])
+
+    def test_reader_tails_new_records(self):
+        """测试跟随方读取器只返回新增记录"""
+        wal = IndexWAL(self.wal_dir)
+        reader = WALReader(self.wal_dir, 0)
+        wal.append([(1, OP_UPSERT, 10, self._vector(1))])
+        self.assertEqual([r.lsn for r in reader.read()], [1])
+        wal.append([(2, OP_UPSERT, 11, self._vector(2))])
+        wal.rotate()
+        wal.append([(3, OP_REMOVE, 10, None)])
+        self.assertEqual([r.lsn for r in reader.read()], [2, 3])
+        self.assertEqual(list(reader.read()), [])
+        wal.close()
+
+    def test_single_writer_per_directory(self):
+        """测试同一目录只能打开一个写入方，关闭后其他进程才能接手"""
+        wal = IndexWAL(self.wal_dir)
+        wal.append([(1, OP_UPSERT, 10, self._vector(1))])
+        with self.assertRaises(WALLockedError):
+            IndexWAL(self.wal_dir)
+        wal.close()
+
+        wal = IndexWAL(self.wal_dir)
+        self.assertEqual(wal.append([(2, OP_UPSERT, 11, self._vector(2))]), 2)
+        wal.close()
+
+    def test_truncate_before_snapshot(self):
+        """测试快照后删除旧日志段，落后的读取器报告截断"""
+        wal = IndexWAL(self.wal_dir)
+        wal.append([(1, OP_UPSERT, 10, self._vector(1))])
+        lagging = WALReader(self.wal_dir, 0)
+        list(lagging.read())
+        wal.rotate()
+        wal.append([(2, OP_UPSERT, 11, self._vector(2))])
+        wal.truncate_before(1)
+        wal.close()
+
+        self.assertEqual(len(wal.segments()), 1)
+        self.assertEqual([r.lsn for r in WALReader(self.wal_dir, 1).read()], [2])
+        with self.assertRaises(WALTruncatedError):
+            list(lagging.read())
+        with self.assertRaises(WALTruncatedError):
+            list(WALReader(self.wal_dir, 0).read())
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_latest_and_prune(self):
+        """测试返回最新快照并只保留最近 keep 个"""
+        store = SnapshotStore(self.tmp_dir, keep=2)
+        for lsn in (5, 9, 12):
+            store.write(np.frombuffer(b'index-%d' % lsn, dtype=np.uint8), lsn, lsn * 10, ntotal=lsn)
+        self.assertEqual([m['lsn'] for m in store.list()], [9, 12])
+        latest = store.latest()
+        self.assertEqual(latest['change_seq'], 120)
+        with open(latest['path'], 'rb') as f:
+            self.assertEqual(f.read(), b'index-12')
+
+    def test_incomplete_snapshot_ignored(self):
+        """测试缺少元数据的快照文件不会被使用"""
+        store = SnapshotStore(self.tmp_dir)
+        with open(os.path.join(self.tmp_dir, 'snapshot-00000000000000000003.faiss'), 'wb') as f:
+            f.write(b'partial')
+        self.assertIsNone(store.latest())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.representatives import select_representatives
+
+class TestRepresentatives(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # 三种外观，每种 4 张带轻微噪声的照片
+        self.centers = rng.standard_normal((3, 32)).astype(np.float32)
+        self.vectors = np.vstack([center + 0.01 * rng.standard_normal((4, 32)).astype(np.float32)
+                                  for center in self.centers])
+
+    def test_one_representative_per_appearance(self):
+        """测试每种外观选出一张代表图片，达到阈值后不再多选"""
+        chosen = select_representatives(self.vectors, 10, 0.95)
+        self.assertEqual(len(chosen), 3)
+        self.assertEqual(sorted(row // 4 for row in chosen), [0, 1, 2])
+
+    def test_max_count_and_small_products(self):
+        """测试代表数不超过上限，单张图片的商品直接作为代表"""
+        self.assertEqual(len(select_representatives(self.vectors, 2, 0.95)), 2)
+        self.assertEqual(select_representatives(self.vectors[:1], 3, 0.95), [0])
+        self.assertEqual(select_representatives(self.vectors[:0], 3, 0.95), [])
+
+if __name__ == '__main__':
+    unittest.main()
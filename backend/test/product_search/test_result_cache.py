@@ -0,0 +1,59 @@
+import unittest
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.cache import SearchResultCache, query_key
+from product_search.metrics import CACHE_REQUESTS
+
+class TestSearchResultCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = SearchResultCache(max_entries=2, ttl=60, name='test_results')
+        self.versions = {1: '2024-01-01 00:00:00', 2: '2024-01-02 00:00:00'}
+        self.results = [{'product_id': 1, 'image_path': 'a.jpg', 'similarity': 0.9},
+                        {'product_id': 2, 'image_path': 'b.jpg', 'similarity': 0.5}]
+        self.key = query_key(np.ones(8, dtype=np.float32), 5)
+
+    def load_versions(self, product_ids):
+        return {product_id: self.versions[product_id] for product_id in product_ids if product_id in self.versions}
+
+    def test_hit(self):
+        """测试相同向量、k 和过滤条件命中缓存"""
+        self.assertIsNone(self.cache.get(self.key, 1, self.load_versions))
+        self.cache.put(self.key, 1, self.results, dict(self.versions))
+        same_key = query_key(np.ones(8, dtype=np.float64), 5, {})
+        self.assertEqual(self.cache.get(same_key, 1, self.load_versions), self.results)
+        self.assertIsNone(self.cache.get(query_key(np.ones(8), 10), 1, self.load_versions))
+        self.assertEqual(CACHE_REQUESTS.value(cache='test_results', result='hit'), 1)
+
+    def test_generation_change_invalidates(self):
+        """测试索引 generation 变化后旧结果失效，并计为 stale 而不是 miss"""
+        cache = SearchResultCache(max_entries=2, ttl=60, name='test_generation')
+        cache.put(self.key, 1, self.results, dict(self.versions))
+        self.assertIsNone(cache.get(self.key, 2, self.load_versions))
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(CACHE_REQUESTS.value(cache='test_generation', result='stale'), 1)
+        self.assertEqual(CACHE_REQUESTS.value(cache='test_generation', result='miss'), 0)
+        self.assertIsNone(cache.get(self.key, 2, self.load_versions))
+        self.assertEqual(CACHE_REQUESTS.value(cache='test_generation', result='miss'), 1)
+
+    def test_modified_product_is_stale(self):
+        """测试结果中的商品被修改或删除时视为未命中"""
+        self.cache.put(self.key, 1, self.results, dict(self.versions))
+        self.versions[2] = '2024-02-01 00:00:00'
+        self.assertIsNone(self.cache.get(self.key, 1, self.load_versions))
+        self.cache.put(self.key, 1, self.results, dict(self.versions))
+        del self.versions[1]
+        self.assertIsNone(self.cache.get(self.key, 1, self.load_versions))
+        self.assertEqual(self.cache.stats()['stale'], 2)
+
+    def test_lru_eviction(self):
+        """测试超过容量时淘汰最久未使用的条目"""
+        keys = [query_key(np.full(8, i, dtype=np.float32), 5) for i in range(3)]
+        for key in keys:
+            self.cache.put(key, 1, self.results, dict(self.versions))
+        self.assertIsNone(self.cache.get(keys[0], 1, self.load_versions))
+        self.assertIsNotNone(self.cache.get(keys[2], 1, self.load_versions))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import os
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import create_engine, event
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.index import VectorProductIndex
+from product_search.similar import build_similarities, _read_watermark
+
+class TestBuildSimilarities(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        # 索引代码按 MySQL 驱动的 %s 占位符书写
+        event.listen(self.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, params, context, many: (statement.replace('%s', '?'), params),
+                     retval=True)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE product_images (id INTEGER PRIMARY KEY, product_id INT, vector BLOB, image_hash INT)")
+            conn.exec_driver_sql("CREATE TABLE index_changes (seq INTEGER PRIMARY KEY, op TEXT, image_id INT, "
+                                 "product_id INT, created_at TIMESTAMP)")
+            conn.exec_driver_sql("CREATE TABLE product_similarities (id INTEGER PRIMARY KEY, product_id INT, "
+                                 "similar_product_id INT, `rank` INT, similarity FLOAT, change_seq BIGINT)")
+            conn.exec_driver_sql("CREATE TABLE product_similarity_state (id INTEGER PRIMARY KEY, change_seq BIGINT)")
+        self.index = VectorProductIndex(dimension=4, sync_interval=0, batch_max_size=1, replication_dir='',
+                                        engine=self.engine, autoload=False)
+        self.vectors = np.vstack([np.eye(3, 4), [[0.9, 0.1, 0, 0]]]).astype(np.float32)
+        self._add_images([(1, 1), (2, 2), (3, 3)])
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def _add_images(self, images, seq=None, created_at=None):
+        with self.engine.begin() as conn:
+            for image_id, product_id in images:
+                conn.exec_driver_sql("INSERT INTO product_images (id, product_id, vector) VALUES (?, ?, ?)",
+                                     (image_id, product_id, self.vectors[(image_id - 1) % len(self.vectors)].tobytes()))
+                conn.exec_driver_sql("INSERT INTO index_changes (seq, op, image_id, created_at) VALUES (?, 'add', ?, ?)",
+                                     (seq, image_id, created_at))
+        self.index.sync_changes()
+
+    def _similarities(self, product_id):
+        with self.engine.connect() as conn:
+            return dict(conn.exec_driver_sql("SELECT similar_product_id, similarity FROM product_similarities "
+                                             "WHERE product_id = ?", (product_id,)).fetchall())
+
+    def _watermark(self):
+        with self.engine.connect() as conn:
+            return _read_watermark(conn)
+
+    def test_watermark_advances_without_rows(self):
+        """测试只有删除、没有写入相似商品时，增量计算的进度仍然推进"""
+        result = build_similarities(self.index, full=False, top_k=2)
+        self.assertEqual(result['products'], 3)
+        self.assertEqual(self._watermark(), 3)
+
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM product_images WHERE id = 3")
+            conn.exec_driver_sql("INSERT INTO index_changes (op, image_id) VALUES ('remove', 3)")
+        result = build_similarities(self.index, full=False, top_k=2)
+        self.assertEqual(result['products'], 0)
+        self.assertEqual(self._watermark(), 4)
+        # 下一轮不再扫描同一段变更
+        self.assertEqual(build_similarities(self.index, full=False, top_k=2)['change_seq'], 4)
+
+    def test_watermark_waits_for_open_gap(self):
+        """测试缺失的 seq（尚未提交的事务）使进度停在空洞之前，提交后补算；超时的空洞不再等待"""
+        build_similarities(self.index, full=False, top_k=2)
+        self._add_images([(5, 5)], seq=5, created_at=datetime.now())
+        result = build_similarities(self.index, full=False, top_k=2)
+        self.assertEqual(result['change_seq'], 3)
+        self.assertTrue(self._similarities(5))
+
+        # seq 4 的事务晚于 seq 5 提交
+        self._add_images([(6, 6)], seq=4, created_at=datetime.now())
+        result = build_similarities(self.index, full=False, top_k=2)
+        self.assertEqual(result['change_seq'], 5)
+        self.assertTrue(self._similarities(6))
+
+        self._add_images([(7, 7)], seq=9, created_at=datetime.now() - timedelta(hours=1))
+        self.assertEqual(build_similarities(self.index, full=False, top_k=2)['change_seq'], 9)
+
+    def test_removed_image_updates_listing_products(self):
+        """测试商品删除部分图片后，重算把它列为相似商品的商品"""
+        self._add_images([(4, 2)])
+        build_similarities(self.index, full=True, top_k=2)
+        self.assertGreater(self._similarities(1)[2], 0.9)
+
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM product_images WHERE id = 4")
+            conn.exec_driver_sql("INSERT INTO index_changes (op, image_id, product_id) VALUES ('remove', 4, 2)")
+        self.index.sync_changes()
+        build_similarities(self.index, full=False, top_k=2)
+        self.assertLess(self._similarities(1)[2], 0.9)
+        self.assertLess(self._similarities(2)[1], 0.9)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search.singleflight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, flight, key, fn, count, timeout=None):
+        results, errors = [], []
+        barrier = threading.Barrier(count)
+
+        def worker():
+            barrier.wait()
+            try:
+                results.append(flight.do(key, fn, timeout))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def test_concurrent_calls_share_one_execution(self):
+        """测试相同键的并发调用只执行一次"""
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['result']
+
+        results, errors = self.run_concurrently(flight, ('digest', 10), slow, 8)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['result']] * 8)
+        self.assertEqual(flight.stats(), {'in_flight': 0, 'leaders': 1, 'followers': 7, 'timeouts': 0})
+
+    def test_exception_is_shared(self):
+        """测试 leader 的异常同样抛给等待的调用方，之后的调用重新执行"""
+        flight = SingleFlight()
+
+        def failing():
+            time.sleep(0.1)
+            raise RuntimeError('embedding failed')
+
+        results, errors = self.run_concurrently(flight, 'key', failing, 4)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(flight.do('key', lambda: 'ok'), 'ok')
+
+    def test_follower_runs_itself_after_timeout(self):
+        """测试等待超时后自行执行"""
+        flight = SingleFlight(timeout=0.05)
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=('key', lambda: release.wait(2)))
+        leader.start()
+        time.sleep(0.02)
+        self.assertEqual(flight.do('key', lambda: 'own'), 'own')
+        release.set()
+        leader.join()
+        self.assertEqual(flight.stats()['timeouts'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+from sqlalchemy import create_engine, event
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import product_search.index as index_module
+from product_search.index import VectorProductIndex
+from product_search.admin import verify, reconcile
+
+class SyncTestCase(unittest.TestCase):
+    """在 sqlite 上建 products / product_images / index_changes 表，按 index_changes 同步索引"""
+    index_options = {}
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        # 索引代码按 MySQL 驱动的 %s 占位符书写
+        event.listen(self.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, params, context, many: (statement.replace('%s', '?'), params),
+                     retval=True)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE products (id INTEGER PRIMARY KEY, factory_name TEXT)")
+            conn.exec_driver_sql("CREATE TABLE product_images (id INTEGER PRIMARY KEY, product_id INT, "
+                                 "image_path TEXT, vector BLOB, image_hash INT)")
+            conn.exec_driver_sql("CREATE TABLE index_changes (seq INTEGER PRIMARY KEY, op TEXT, image_id INT)")
+        self.vectors = np.random.default_rng(0).random((20, 4), dtype=np.float32)
+        self.index = VectorProductIndex(dimension=4, sync_interval=0, batch_max_size=1, replication_dir='',
+                                        engine=self.engine, autoload=False, **self.index_options)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def _execute(self, sql, params=()):
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(sql, params)
+
+    def _log(self, op, image_id, seq=None):
+        self._execute("INSERT INTO index_changes (seq, op, image_id) VALUES (?, ?, ?)", (seq, op, image_id))
+
+    def _add_image(self, image_id, product_id=1, vector=None, seq=None):
+        vector = self.vectors[image_id] if vector is None else vector
+        self._execute("INSERT OR IGNORE INTO products (id) VALUES (?)", (product_id,))
+        self._execute("INSERT INTO product_images (id, product_id, image_path, vector) VALUES (?, ?, ?, ?)",
+                      (image_id, product_id, f'{image_id}.jpg', vector.tobytes()))
+        self._log('add', image_id, seq)
+
+    def _delete_image(self, image_id):
+        self._execute("DELETE FROM product_images WHERE id = ?", (image_id,))
+        self._log('remove', image_id)
+
+class TestSyncChanges(SyncTestCase):
+    def test_insert_update_delete(self):
+        """测试新增、修改、删除图片后增量同步，索引与 product_images 一致"""
+        self._add_image(1)
+        self._add_image(2)
+        self.assertEqual(self.index.sync_changes(), 2)
+        np.testing.assert_array_equal(self.index.live_ids(), [1, 2])
+        _, found = self.index.search_vectors(self.vectors[2:3], 1)
+        self.assertEqual(found[0][0], 2)
+
+        self._execute("UPDATE product_images SET vector = ? WHERE id = 1", (self.vectors[5].tobytes(),))
+        self._log('add', 1)
+        self.assertEqual(self.index.sync_changes(), 1)
+        np.testing.assert_array_equal(self.index.reconstruct_vectors(np.array([1])), self.vectors[5:6])
+
+        self._delete_image(2)
+        self.assertEqual(self.index.sync_changes(), 1)
+        np.testing.assert_array_equal(self.index.live_ids(), [1])
+        self.assertEqual(self.index.last_change_seq, 4)
+        self.assertEqual(self.index.sync_changes(), 0)
+
+    def test_seq_gap_is_revisited(self):
+        """测试跳过的 seq（尚未提交的事务）在之后的同步中补上，超时后不再等待"""
+        self._add_image(1, seq=1)
+        self._add_image(3, seq=3)
+        self.index.sync_changes()
+        self.assertEqual(self.index.last_change_seq, 3)
+        self.assertEqual(set(self.index._pending_gaps), {2})
+
+        # seq 2 的事务晚于 seq 3 提交
+        self._add_image(2, seq=2)
+        self.assertEqual(self.index.sync_changes(), 1)
+        np.testing.assert_array_equal(self.index.live_ids(), [1, 2, 3])
+        self.assertEqual(self.index._pending_gaps, {})
+
+        self._add_image(5, seq=5)
+        timeout = index_module.INDEX_CHANGE_GAP_TIMEOUT
+        index_module.INDEX_CHANGE_GAP_TIMEOUT = -1
+        try:
+            self.index.sync_changes()
+        finally:
+            index_module.INDEX_CHANGE_GAP_TIMEOUT = timeout
+        # 超时的空洞视为已回滚
+        self.assertEqual(self.index._pending_gaps, {})
+        self.assertEqual(self.index.last_change_seq, 5)
+
+    def test_replay_is_idempotent(self):
+        """测试重复应用同一批变更得到相同的索引"""
+        for image_id in range(1, 6):
+            self._add_image(image_id)
+        self._delete_image(3)
+        self._execute("UPDATE product_images SET vector = ? WHERE id = 4", (self.vectors[10].tobytes(),))
+        self._log('add', 4)
+        self.index.sync_changes()
+        expected = self.index.reconstruct_vectors(self.index.live_ids())
+
+        self.index.last_change_seq = 0
+        self.assertEqual(self.index.sync_changes(), 7)
+        np.testing.assert_array_equal(self.index.live_ids(), [1, 2, 4, 5])
+        np.testing.assert_array_equal(self.index.reconstruct_vectors(self.index.live_ids()), expected)
+        self.assertEqual(self.index.ntotal, 4)
+
+    def test_restart_from_snapshot_restores_hashes(self):
+        """测试从快照启动后按 product_images.image_hash 恢复 dHash 索引"""
+        replication_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, replication_dir)
+        hashes = {1: 0, 2: 0x0FFF_0FFF, 3: 0x7FFF_0000_0000_0000}
+        for image_id, value in hashes.items():
+            self._add_image(image_id)
+            self._execute("UPDATE product_images SET image_hash = ? WHERE id = ?", (value, image_id))
+        options = dict(dimension=4, sync_interval=0, batch_max_size=1, replication_dir=replication_dir,
+                       replication_role='leader', engine=self.engine)
+        VectorProductIndex(**options)._wal.close()
+
+        restarted = VectorProductIndex(**options)
+        self.addCleanup(restarted._wal.close)
+        self.assertEqual(len(restarted.hash_index), 3)
+        self.assertEqual(restarted.hash_index.search(hashes[2] ^ 1), [(2, 1)])
+
+class TestVerifyReconcile(SyncTestCase):
+    def test_reconcile_fixes_drift(self):
+        """测试校验找出缺失、多余和向量不一致的图片，修复后与数据库一致"""
+        for image_id in range(1, 6):
+            self._add_image(image_id)
+        self.index.sync_changes()
+        self.assertTrue(verify(self.index, chunk_size=2)['in_sync'])
+
+        self.index.remove_vectors([1])
+        self.index.add_vectors([9], self.vectors[9:10])
+        self.index.add_vectors([2], self.vectors[12:13])
+        report = verify(self.index, chunk_size=2)
+        self.assertEqual((report['missing'], report['extra'], report['stale']), (1, 1, 1))
+        self.assertEqual(report['drift_ids'], [1, 2, 9])
+        self.assertNotEqual(report['db_checksum'], report['index_checksum'])
+
+        self.assertEqual(reconcile(self.index, chunk_size=2)['fixed'], 3)
+        report = verify(self.index, chunk_size=2)
+        self.assertTrue(report['in_sync'])
+        self.assertEqual(report['db_checksum'], report['index_checksum'])
+
+class TestPartitionSync(SyncTestCase):
+    index_options = {'partition_column': 'factory_name'}
+
+    def test_partition_follows_product(self):
+        """测试商品换工厂后同步，图片移动到新分区，分区搜索随之变化"""
+        for image_id in range(1, 7):
+            self._add_image(image_id, product_id=1 if image_id <= 3 else 2)
+        self._execute("UPDATE products SET factory_name = CASE id WHEN 1 THEN 'A' ELSE 'B' END")
+        self.index.sync_changes()
+        self.assertEqual(self.index.partitions.sizes(), {'A': 3, 'B': 3})
+        _, found = self.index.search_partitions(self.vectors[5:6], 3, ('A',))
+        self.assertEqual(set(found[0]), {1, 2, 3})
+
+        self._execute("UPDATE products SET factory_name = 'A' WHERE id = 2")
+        for image_id in range(4, 7):
+            self._log('add', image_id)
+        self.index.sync_changes()
+        self.assertEqual(self.index.partitions.partition_of(5), 'A')
+        self.assertEqual(self.index.partitions.sizes(), {'A': 6})
+        _, found = self.index.search_partitions(self.vectors[5:6], 1, ('A',))
+        self.assertEqual(found[0][0], 5)
+        _, found = self.index.search_partitions(self.vectors[5:6], 1, ('B',))
+        self.assertEqual(found[0][0], -1)
+
+        self._delete_image(6)
+        self.index.sync_changes()
+        self.assertIsNone(self.index.partitions.partition_of(6))
+        self.assertEqual(self.index.partitions.sizes(), {'A': 5})
+
+class TestRepresentativeSync(SyncTestCase):
+    index_options = {'representatives': 1}
+
+    def test_reselect_after_delete(self):
+        """测试删除代表图片后同步重新选出代表，商品图片全部删除后不再保留对应关系"""
+        for image_id in range(1, 4):
+            self._add_image(image_id, product_id=7)
+        self._add_image(4, product_id=8)
+        self.index.sync_changes()
+        self.assertEqual(self.index.ntotal, 2)
+        representative = self.index._product_representatives[7][0]
+
+        self._delete_image(representative)
+        self.index.sync_changes()
+        reselected = self.index._product_representatives[7]
+        self.assertEqual(len(reselected), 1)
+        self.assertNotEqual(reselected[0], representative)
+        np.testing.assert_array_equal(self.index.live_ids(), sorted(reselected + [4]))
+
+        for image_id in set(range(1, 4)) - {representative}:
+            self._delete_image(image_id)
+        self.index.sync_changes()
+        self.assertNotIn(7, self.index._product_representatives)
+        self.assertEqual(self.index._representative_product, {4: 8})
+        np.testing.assert_array_equal(self.index.live_ids(), [4])
+
+    def test_restart_from_snapshot(self):
+        """测试从快照启动后恢复商品与代表图片的对应关系，删除代表图片时重新选出而不是留下旧向量"""
+        replication_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, replication_dir)
+        for image_id in range(1, 4):
+            self._add_image(image_id, product_id=7)
+        self._add_image(4, product_id=8)
+        options = dict(dimension=4, sync_interval=0, batch_max_size=1, replication_dir=replication_dir,
+                       replication_role='leader', engine=self.engine, representatives=1)
+        leader = VectorProductIndex(**options)
+        expected = dict(leader._product_representatives)
+        leader._wal.close()
+
+        restarted = VectorProductIndex(**options)
+        self.addCleanup(restarted._wal.close)
+        self.assertEqual(restarted._product_representatives, expected)
+        representative = expected[7][0]
+        self._delete_image(representative)
+        restarted.sync_changes()
+        reselected = restarted._product_representatives[7]
+        self.assertNotEqual(reselected, [representative])
+        np.testing.assert_array_equal(restarted.live_ids(), sorted(reselected + [4]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from product_search import tracing
+
+class TestRequestTracing(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.exporter = tracing.JsonlSpanExporter(os.path.join(self.tmpdir, 'traces.jsonl'), interval=0.05)
+        tracing.set_exporter(self.exporter)
+        self.engine = create_engine('sqlite://')
+        self.app = Flask(__name__)
+        tracing.init_app(self.app)
+
+        @self.app.route('/search')
+        def search():
+            with tracing.span('faiss.search', k=10):
+                pass
+            with self.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+                conn.execute(text('SELECT 2'))
+            return jsonify([])
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        tracing.set_exporter(None)
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_server_timing_header(self):
+        """测试响应头按名称汇总 span，数据库语句自动记录"""
+        response = self.client.get('/search')
+        header = response.headers['Server-Timing']
+        self.assertIn('faiss_search;dur=', header)
+        self.assertIn('desc="db.query x2"', header)
+        self.assertIn('total;dur=', header)
+        self.assertTrue(response.headers['X-Trace-Id'])
+
+    def test_forced_trace_is_exported(self):
+        """测试带 X-Trace: 1 的请求导出到 JSONL 文件"""
+        response = self.client.get('/search', headers={'X-Trace': '1'})
+        self.exporter.flush()
+        with open(self.exporter.path) as f:
+            traces = [json.loads(line) for line in f]
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(traces[0]['trace_id'], response.headers['X-Trace-Id'])
+        self.assertEqual(traces[0]['name'], 'GET /search')
+        self.assertEqual([item['name'] for item in traces[0]['spans']], ['faiss.search', 'db.query', 'db.query'])
+
+    def test_span_without_trace_is_noop(self):
+        """测试没有活动 Trace 时 span 不记录"""
+        with tracing.span('faiss.search') as item:
+            self.assertIsNone(item)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import os
+import sys
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app import create_app
+from models import db
+
+class TestBuildVectorIndex(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_disabled_index_is_not_enabled_by_request(self):
+        """测试未启用向量搜索时构建接口返回错误，且不修改进程配置"""
+        for url in ('/api/products/build-vector-index', '/api/products/build-vector-index/sse'):
+            body = self.client.get(url).get_data(as_text=True)
+            event = json.loads(body.split('data: ', 1)[1])
+            self.assertEqual(event['type'], 'error')
+            self.assertFalse(self.app.config['PRODUCT_INDEX_ENABLED'])
+
+if __name__ == '__main__':
+    unittest.main()
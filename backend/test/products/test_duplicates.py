@@ -0,0 +1,50 @@
+import unittest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app import create_app
+from models import db, Product, ProductImage, DuplicateCluster
+
+class TestDuplicateClusters(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        for product_id in (1, 2, 3):
+            product = Product(id=product_id, name=f'商品{product_id}', price=100, factory_name=f'工厂{product_id}')
+            product.images = [ProductImage(image_path=f'/uploads/good_images/{product_id}/a.jpg', vector=b'\x00' * 16)]
+            db.session.add(product)
+        db.session.commit()
+        images = {image.product_id: image.id for image in ProductImage.query.all()}
+        db.session.add_all([
+            DuplicateCluster(cluster_id=1, product_id=1, image_id=images[1], similarity=0.99),
+            DuplicateCluster(cluster_id=1, product_id=2, image_id=images[2], similarity=0.99),
+            DuplicateCluster(cluster_id=2, product_id=3, image_id=images[3], similarity=0.97),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_list_clusters(self):
+        """测试按分组分页返回重复商品"""
+        response = self.client.get('/api/products/duplicates?per_page=1')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(len(data['clusters']), 1)
+        products = data['clusters'][0]['products']
+        self.assertEqual([p['product_id'] for p in products], [1, 2])
+        self.assertEqual(products[0]['factory_name'], '工厂1')
+        self.assertEqual(products[0]['image_path'], '/uploads/good_images/1/a.jpg')
+
+        data = self.client.get('/api/products/duplicates?page=2&per_page=1').get_json()
+        self.assertEqual(data['clusters'][0]['cluster_id'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
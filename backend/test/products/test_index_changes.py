@@ -0,0 +1,76 @@
+import unittest
+import os
+import sys
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app import create_app
+from models import db, Product, ProductImage, IndexChange
+
+class TestIndexChangeLog(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # 创建带两张向量图片的测试产品
+        self.product = Product(id=1, name='测试产品', price=100)
+        self.product.images = [
+            ProductImage(image_path='/uploads/good_images/1/a.jpg', vector=b'\x00' * 16),
+            ProductImage(image_path='/uploads/good_images/1/b.jpg', vector=b'\x00' * 16),
+        ]
+        db.session.add(self.product)
+        db.session.commit()
+        self.image_ids = sorted(image.id for image in self.product.images)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _changes(self):
+        return [(c.op, c.image_id) for c in IndexChange.query.order_by(IndexChange.seq).all()]
+
+    def test_insert_logs_add(self):
+        """测试插入 ProductImage 时写入 add 变更"""
+        self.assertEqual(self._changes(), [('add', image_id) for image_id in self.image_ids])
+
+    def test_orm_delete_logs_remove(self):
+        """测试通过 ORM 级联删除产品时写入 remove 变更"""
+        db.session.delete(self.product)
+        db.session.commit()
+        removed = sorted(image_id for op, image_id in self._changes() if op == 'remove')
+        self.assertEqual(removed, self.image_ids)
+        # 图片删除后仍能从变更日志找到所属商品
+        self.assertEqual({c.product_id for c in IndexChange.query.filter_by(op='remove')}, {1})
+
+    def test_rollback_discards_changes(self):
+        """测试事务回滚时变更日志一并回滚"""
+        db.session.add(ProductImage(product_id=1, image_path='/uploads/good_images/1/c.jpg', vector=b'\x00' * 16))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(len(self._changes()), len(self.image_ids))
+
+    def test_batch_delete_logs_remove(self):
+        """测试批量删除接口为数据库级联删除的图片写入 remove 变更"""
+        response = self.client.post('/api/products/batch-delete', json={'ids': [1]})
+        self.assertEqual(response.status_code, 200)
+        removed = sorted(image_id for op, image_id in self._changes() if op == 'remove')
+        self.assertEqual(removed, self.image_ids)
+        self.assertEqual({c.product_id for c in IndexChange.query.filter_by(op='remove')}, {1})
+
+    def test_partition_column_change_logs_add(self):
+        """测试修改分区列时为商品的全部图片写入 add 变更，其他列的修改不写入"""
+        with mock.patch('models.index_change.INDEX_PARTITION_COLUMN', 'factory_name'):
+            self.product.description = '新描述'
+            db.session.commit()
+            self.assertEqual(len(self._changes()), len(self.image_ids))
+
+            self.product.factory_name = '新工厂'
+            db.session.commit()
+        moved = [image_id for op, image_id in self._changes()[len(self.image_ids):]]
+        self.assertEqual(sorted(moved), self.image_ids)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app import create_app
+from models import db, Product, ProductSimilarity
+from product_search.sql_monitor import capture_queries
+
+class TestSimilarProducts(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        db.session.add_all([Product(id=product_id, name=f'商品{product_id}', price=100) for product_id in (1, 2, 3, 4)])
+        db.session.add_all([
+            ProductSimilarity(product_id=1, similar_product_id=3, rank=1, similarity=0.9),
+            ProductSimilarity(product_id=1, similar_product_id=2, rank=2, similarity=0.8),
+            ProductSimilarity(product_id=1, similar_product_id=4, rank=3, similarity=0.7),
+            ProductSimilarity(product_id=2, similar_product_id=1, rank=1, similarity=0.8),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_similar_products_in_one_query(self):
+        """测试按排名返回相似商品，且只执行一次查询"""
+        with capture_queries() as stats:
+            response = self.client.get('/api/products/1/similar?limit=2')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual([item['id'] for item in data['similar']], [3, 2])
+        self.assertEqual(data['similar'][0]['name'], '商品3')
+        self.assertEqual(data['similar'][0]['similarity'], 0.9)
+        self.assertEqual(stats.count_matching('FROM product_similarities'), 1)
+
+    def test_no_similar_products(self):
+        """测试没有预计算结果时返回空列表"""
+        data = self.client.get('/api/products/4/similar').get_json()
+        self.assertEqual(data['similar'], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import os
+import sys
+import threading
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app import create_app
+from models import db, Customer, Order
+from product_search import sql_monitor, profiling
+from product_search.sql_monitor import capture_queries, statement_shape
+
+class TestSQLMonitor(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        sql_monitor.MONITOR.reset()
+
+        # 12 个客户各一个订单，订单列表逐个查询客户
+        for i in range(12):
+            customer = Customer(name=f'客户{i}', phone=f'1380000{i:04d}')
+            db.session.add(customer)
+            db.session.flush()
+            db.session.add(Order(order_number=f'NO{i}', customer_id=customer.id, total_amount=10,
+                                 shipping_address='地址', products=[]))
+        db.session.commit()
+        db.session.expunge_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_statement_shape(self):
+        """测试语句形状去掉参数、字面量和 IN 列表长度"""
+        self.assertEqual(statement_shape("SELECT * FROM t WHERE id = 5 AND name = 'x'"),
+                         statement_shape("SELECT * FROM t WHERE id = 7 AND name = 'y'"))
+        self.assertEqual(statement_shape('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+                         'SELECT * FROM t WHERE id IN (?...)')
+
+    def test_capture_detects_n_plus_one(self):
+        """测试订单列表按订单逐个查询客户被识别为 N+1"""
+        with capture_queries() as stats:
+            response = self.client.get('/api/orders?per_page=20')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(stats.count, 13)
+        repeated = stats.repeated()
+        self.assertEqual(len(repeated), 1)
+        self.assertIn('FROM customers', repeated[0]['statement'])
+        self.assertEqual(repeated[0]['count'], 12)
+
+    def test_admin_summary(self):
+        """测试请求结束后汇总到管理接口"""
+        self.client.get('/api/orders?per_page=20')
+        with mock.patch.object(profiling, 'ADMIN_TOKEN', 'secret'):
+            summary = self.client.get('/api/admin/sql', headers={'X-Admin-Token': 'secret'}).json
+        self.assertEqual(summary['endpoints']['GET /api/orders']['requests'], 1)
+        self.assertEqual(summary['n_plus_one'][0]['endpoint'], 'GET /api/orders')
+        self.assertEqual(summary['n_plus_one'][0]['max_count'], 12)
+
+    def test_slow_query_explain(self):
+        """测试超过阈值的查询由后台线程记录 EXPLAIN"""
+        with mock.patch.object(sql_monitor, 'SQL_SLOW_MS', 0):
+            self.client.get('/api/orders?per_page=1')
+        sql_monitor.MONITOR.flush()
+        slow = sql_monitor.MONITOR.summary()['slow_queries']
+        self.assertTrue(slow)
+        self.assertTrue(any(entry['explain'] for entry in slow))
+
+    def test_slow_query_does_not_wait_for_explain(self):
+        """测试记录慢查询时不等待 EXPLAIN，执行计划稍后由后台线程补上"""
+        release = threading.Event()
+
+        def slow_explain(engine, statement, parameters):
+            release.wait(5)
+            return [{'detail': statement}]
+
+        with mock.patch.object(sql_monitor, 'explain_statement', side_effect=slow_explain):
+            sql_monitor.MONITOR.record_slow('GET /x', 'SELECT 1', (), 1.0, db.engine)
+            entry = sql_monitor.MONITOR.summary()['slow_queries'][0]
+            self.assertIsNone(entry['explain'])
+            release.set()
+            sql_monitor.MONITOR.flush()
+        self.assertEqual(entry['explain'], [{'detail': 'SELECT 1'}])
+
+if __name__ == '__main__':
+    unittest.main()
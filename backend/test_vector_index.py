@@ -1,36 +1,25 @@
-import numpy as np
-from product_search import VectorProductIndex
+from product_search.admin import open_index, stats, verify
+from product_search.index import INDEX_REPLICATION_DIR
 
 def test_vector_index():
-    # 初始化向量索引
-    vector_index = VectorProductIndex()
-    
-    # 加载向量
-    vector_index._load_vectors()
+    # 打开向量索引：配置了 INDEX_REPLICATION_DIR 时从最新快照启动，否则从 product_images 加载
+    vector_index = open_index(replication_dir=INDEX_REPLICATION_DIR)
     
     # 获取索引中的统计信息
-    ntotal = vector_index.index.ntotal  # 获取索引中的向量总数
-    d = vector_index.index.d  # 获取向量维度
-    
+    info = stats(vector_index)
     print(f"向量索引统计信息:")
-    print(f"向量总数: {ntotal}")
-    print(f"向量维度: {d}")
+    print(f"索引类型: {info['type']}")
+    print(f"向量总数: {info['ntotal']}（product_images 共 {info['db_rows']} 行）")
+    print(f"向量维度: {info['dimension']}")
+    print(f"内存占用: {info['memory_bytes'] / 1024 / 1024:.1f} MB")
     
-    # 如果索引中有向量，我们可以查看一些示例
-    if ntotal > 0:
-        # 获取所有向量
-        vectors = vector_index.index.reconstruct_n(0, ntotal)  # 重建所有向量
-        print(f"\n前3个向量的形状: {vectors[:3].shape}")
-        print(f"\n第一个向量的前10个维度:")
-        print(vectors[0][:10])
-        
-        # 计算一些基本统计信息
-        means = np.mean(vectors, axis=0)[:10]
-        stds = np.std(vectors, axis=0)[:10]
-        print(f"\n向量前10个维度的平均值:")
-        print(means)
-        print(f"\n向量前10个维度的标准差:")
-        print(stds)
+    # 按 id 和校验和比对索引与数据库
+    report = verify(vector_index)
+    print(f"\n缺失: {report['missing']}，多余: {report['extra']}，向量不一致: {report['stale']}")
+    if not report['in_sync']:
+        print(f"差异示例: {report['samples']}")
+        print("可运行 python -m product_search.admin reconcile 修复")
+    assert report['in_sync']
 
 if __name__ == "__main__":
     test_vector_index()
@@ -70,7 +70,52 @@ CREATE TABLE IF NOT EXISTS product_images (
     product_id INT NOT NULL,
     image_path VARCHAR(255) NOT NULL,
     vector BLOB NOT NULL,
+    image_hash BIGINT NULL,
     PRIMARY KEY (id),
     UNIQUE KEY unique_image_path (image_path),
     FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
 );
+
+-- 创建向量索引变更日志表
+CREATE TABLE IF NOT EXISTS index_changes (
+    seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+    op VARCHAR(10) NOT NULL,
+    image_id INT NOT NULL,
+    product_id INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 创建近似重复商品分组表
+CREATE TABLE IF NOT EXISTS duplicate_clusters (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    cluster_id INT NOT NULL,
+    product_id INT NOT NULL,
+    image_id INT NOT NULL,
+    similarity FLOAT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_cluster_id (cluster_id),
+    INDEX idx_product_id (product_id),
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+);
+
+-- 创建相似商品表
+CREATE TABLE IF NOT EXISTS product_similarities (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    product_id INT NOT NULL,
+    similar_product_id INT NOT NULL,
+    `rank` INT NOT NULL,
+    similarity FLOAT NOT NULL,
+    change_seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_product_rank (product_id, `rank`),
+    INDEX idx_similar_product_id (similar_product_id),
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+    FOREIGN KEY (similar_product_id) REFERENCES products(id) ON DELETE CASCADE
+);
+
+-- 创建相似商品增量计算进度表
+CREATE TABLE IF NOT EXISTS product_similarity_state (
+    id INT PRIMARY KEY,
+    change_seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);